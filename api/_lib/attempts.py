@@ -0,0 +1,91 @@
+"""
+Retry loop shared by every upstream fetch.
+
+An attempt sleeps the pre-request jitter (never past the attempt window),
+picks the egress that can serve it soonest, takes a token of its rate
+budget for the payload request and runs call(client, egress) on a pooled
+client of that egress. call() takes a token with
+egress.acquire(deadline=deadline) before each further widget call and
+returns None when Google answered without data.
+
+Empty answers are retried after a growing delay, 429s on another egress or
+after the backoff it sets, other errors after 3 seconds. No attempt starts
+once the deadline leaves too little time for one.
+"""
+import traceback
+
+from .backoff import Deadline, DeadlineExceeded, get_backoff
+from .proxies import get_egress_pool
+from .ratelimit import CircuitOpen
+from .sessions import DEFAULT_TIMEOUT, get_pool
+from .timing import log
+
+MAX_RETRIES = 3
+
+# Wait before retrying after an error that is not a 429
+ERROR_DELAY = 3
+
+
+def attempt_with_retries(call, deadline: Deadline, kind: str = "PyTrends",
+                         max_retries: int = MAX_RETRIES) -> tuple:
+    """
+    Run call(client, egress) until it returns data.
+    Returns (value, error) with error None, "DEADLINE", "RATE_LIMITED" or the
+    message of the last failure; value is None on error or when every
+    attempt came back empty.
+    """
+    prefix = f"[{kind}]"
+    backoff = get_backoff()
+    egresses = get_egress_pool()
+
+    for attempt in range(max_retries):
+        # Set once chosen: failures before that charge no egress
+        egress = None
+        log(f"{prefix} Attempt {attempt + 1}/{max_retries}")
+        if not deadline.can_attempt():
+            log(f"{prefix} Deadline reached, giving up")
+            return None, "DEADLINE"
+        # No pre-request jitter while the upstream rate is healthy, never past the attempt window
+        deadline.sleep(backoff.jitter(deadline))
+
+        try:
+            # Every upstream call waits for a token of its egress' rate budget
+            egress = egresses.choose(deadline)
+            waited = egress.acquire(deadline=deadline)
+            log(f"{prefix} Waited {waited:.1f}s for rate budget of {egress.label}")
+
+            with get_pool().session(proxy=egress.proxy, timeout=deadline.timeout(DEFAULT_TIMEOUT)) as client:
+                value = call(client, egress)
+            egresses.succeeded(egress)
+
+        except DeadlineExceeded as e:
+            log(f"{prefix} Deadline reached: {e}")
+            return None, "DEADLINE"
+        except CircuitOpen as e:
+            log(f"{prefix} {e}")
+            return None, "RATE_LIMITED"
+        except Exception as e:
+            err_str = str(e)
+            print(f"{prefix} EXCEPTION: {err_str}")
+            log(f"{prefix} Traceback:\n{traceback.format_exc()}")
+
+            if "429" in err_str:
+                delay = egresses.rate_limited(egress)
+                if delay is None or attempt == max_retries - 1 or not deadline.sleep(delay):
+                    return None, "RATE_LIMITED"
+                log(f"{prefix} Rate limited, waited {delay:.1f}s")
+            else:
+                egresses.failed(egress)
+                if attempt == max_retries - 1:
+                    return None, err_str
+                if not deadline.sleep(ERROR_DELAY):
+                    return None, "DEADLINE"
+            continue
+
+        if value is not None:
+            return value, None
+        log(f"{prefix} No data")
+        if attempt < max_retries - 1 and not deadline.sleep(5 * (attempt + 1)):
+            return None, "DEADLINE"
+
+    return None, None
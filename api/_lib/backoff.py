@@ -0,0 +1,112 @@
+"""
+Deadline-aware retries with a backoff learned from recent upstream outcomes.
+
+A Deadline caps the total time a request may spend (sleeps, token waits and
+HTTP timeouts are clamped to what is left). AdaptiveBackoff is AIMD-style:
+every 429 doubles the penalty delay, every success takes a fixed amount off.
+While the penalty is zero the upstream rate is considered healthy and no
+pre-request jitter is added.
+"""
+import os
+import random
+import threading
+import time
+
+from .timing import span
+
+DEFAULT_DEADLINE = float(os.environ.get("TRENDS_DEADLINE", "55"))
+
+# Below this, starting another upstream attempt is pointless
+MIN_ATTEMPT_SECONDS = 3.0
+
+# AIMD parameters (seconds)
+BASE_PENALTY = 5.0
+MAX_PENALTY = 60.0
+PENALTY_DECREASE = 2.0
+
+_backoff = None
+_backoff_lock = threading.Lock()
+
+
+class DeadlineExceeded(Exception):
+    """Not enough time left for the next upstream call"""
+
+
+class Deadline:
+    def __init__(self, seconds: float = None):
+        self.expires_at = time.monotonic() + seconds if seconds else None
+
+    @classmethod
+    def parse(cls, raw):
+        """Deadline from a query param / POST field, the default when absent or invalid"""
+        try:
+            seconds = float(raw)
+        except (TypeError, ValueError):
+            seconds = DEFAULT_DEADLINE
+        return cls(seconds if seconds > 0 else None)
+
+    def remaining(self) -> float:
+        if self.expires_at is None:
+            return float("inf")
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def can_attempt(self) -> bool:
+        return self.remaining() >= MIN_ATTEMPT_SECONDS
+
+    def sleep(self, seconds: float) -> bool:
+        """Sleep unless it would run past the deadline; False when it would"""
+        if seconds <= 0:
+            return True
+        if seconds > self.remaining() - MIN_ATTEMPT_SECONDS:
+            return False
+        with span("sleep"):
+            time.sleep(seconds)
+        return True
+
+    def timeout(self, default: tuple) -> tuple:
+        """(connect, read) HTTP timeout clamped to the remaining time"""
+        remaining = self.remaining()
+        return tuple(max(1.0, min(t, remaining)) for t in default)
+
+
+class AdaptiveBackoff:
+    """Penalty delay shared by all upstream calls of the process"""
+
+    def __init__(self):
+        self.penalty = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def healthy(self) -> bool:
+        return self.penalty == 0.0
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.penalty = max(0.0, self.penalty - PENALTY_DECREASE)
+
+    def record_rate_limited(self) -> None:
+        with self._lock:
+            self.penalty = min(MAX_PENALTY, max(BASE_PENALTY, self.penalty * 2))
+
+    def jitter(self, deadline: Deadline = None) -> float:
+        """
+        Pre-request delay: none while healthy, up to half the penalty
+        otherwise, clamped so the deadline still leaves an attempt window
+        """
+        delay = 0.0 if self.healthy else random.uniform(0, self.penalty / 2)
+        if deadline is not None:
+            delay = min(delay, max(0.0, deadline.remaining() - MIN_ATTEMPT_SECONDS))
+        return delay
+
+    def retry_delay(self) -> float:
+        """Delay before retrying after a 429"""
+        return self.penalty + random.uniform(0, self.penalty / 4)
+
+
+def get_backoff() -> AdaptiveBackoff:
+    global _backoff
+
+    with _backoff_lock:
+        if _backoff is None:
+            _backoff = AdaptiveBackoff()
+        return _backoff
@@ -0,0 +1,95 @@
+"""
+Bounded in-memory fallback cache.
+
+Entries expire after a TTL and the least recently used ones are evicted once
+the entry or byte budget is exceeded, so long-lived workers stay bounded.
+Keys are tuples that carry everything the value depends on (kind, geo,
+period, normalization basis, keyword...): a 7-day score is never served for
+a 30-day request.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = int(os.environ.get("TRENDS_CACHE_ENTRIES", "2048"))
+DEFAULT_MAX_BYTES = int(os.environ.get("TRENDS_CACHE_BYTES", str(8 * 1024 * 1024)))
+DEFAULT_TTL = float(os.environ.get("TRENDS_CACHE_TTL", str(6 * 3600)))
+
+
+def _size_of(value) -> int:
+    """Approximate footprint: size of the JSON encoding"""
+    try:
+        return len(json.dumps(value))
+    except (TypeError, ValueError):
+        return 64
+
+
+class MemoryCache:
+    """LRU cache with per-entry TTL and hit/miss/eviction counters"""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES,
+                 ttl: float = DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._bytes = 0
+        self._entries = OrderedDict()  # key -> (value, expires_at, size)
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at, size = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self._bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def __contains__(self, key: tuple) -> bool:
+        return self.get(key) is not None
+
+    def set(self, key: tuple, value, ttl: float = None) -> None:
+        size = _size_of(value)
+        if size > self.max_bytes:
+            return
+        expires_at = time.monotonic() + (ttl if ttl is not None else self.ttl)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (value, expires_at, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
@@ -0,0 +1,165 @@
+"""
+Lightweight Google Trends client that talks to the widget endpoints directly.
+
+Only `requests` is needed: explore, multiline and comparedgeo responses are
+parsed into plain lists instead of DataFrames, so a cold start never imports
+pandas or pytrends. Results use the same shapes as the pytrends fallback in
+sessions.py:
+
+    timeseries() -> {"dates": [datetime, ...], "values": {kw: [int, ...]},
+                     "partial": [bool, ...]}
+    regions()    -> {"regions": [name, ...], "values": {kw: [int, ...]}}
+"""
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+from .timing import span
+
+BASE_TRENDS_URL = os.environ.get("TRENDS_BASE_URL", "https://trends.google.com/trends")
+EXPLORE_URL = f"{BASE_TRENDS_URL}/api/explore"
+INTEREST_OVER_TIME_URL = f"{BASE_TRENDS_URL}/api/widgetdata/multiline"
+INTEREST_BY_REGION_URL = f"{BASE_TRENDS_URL}/api/widgetdata/comparedgeo"
+
+_JSON_TYPES = ("application/json", "application/javascript", "text/javascript")
+
+
+class TrendsError(Exception):
+    """Non-JSON or non-200 answer from Google (the message carries the status code)"""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"The request failed: Google returned a response with code {status_code}")
+        self.status_code = status_code
+
+
+def _split_values(value) -> list:
+    """Widget values are lists, but tolerate the '[1,2]' strings pytrends copes with"""
+    if isinstance(value, list):
+        return [int(v) for v in value]
+    return [int(v) for v in str(value).strip("[]").split(",") if v.strip()]
+
+
+def parse_timeline(payload: dict, keywords: list) -> dict:
+    """Parse a multiline widget response into plain lists sorted by date"""
+    points = sorted(
+        payload.get("default", {}).get("timelineData", []),
+        key=lambda point: int(point["time"]),
+    )
+    values = {kw: [] for kw in keywords}
+    dates = []
+    partial = []
+    for point in points:
+        dates.append(datetime.fromtimestamp(int(point["time"]), tz=timezone.utc).replace(tzinfo=None))
+        partial.append(bool(point.get("isPartial", False)))
+        row = _split_values(point.get("value", []))
+        for idx, kw in enumerate(keywords):
+            values[kw].append(row[idx] if idx < len(row) else 0)
+    return {"dates": dates, "values": values, "partial": partial}
+
+
+def parse_geo_map(payload: dict, keywords: list) -> dict:
+    """Parse a comparedgeo widget response into plain lists sorted by region name"""
+    entries = sorted(
+        payload.get("default", {}).get("geoMapData", []),
+        key=lambda entry: entry.get("geoName", ""),
+    )
+    values = {kw: [] for kw in keywords}
+    regions = []
+    for entry in entries:
+        regions.append(entry.get("geoName", ""))
+        row = _split_values(entry.get("value", []))
+        for idx, kw in enumerate(keywords):
+            values[kw].append(row[idx] if idx < len(row) else 0)
+    return {"regions": regions, "values": values}
+
+
+class TrendsClient:
+    """Direct widget client with one keep-alive session"""
+
+    def __init__(self, hl: str, tz: int, proxy: str = "", timeout=(10, 25)):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.hl = hl
+        self.tz = tz
+        self.timeout = timeout
+        self.failures = 0
+        self.kw_list = []
+        self.interest_over_time_widget = {}
+        self.interest_by_region_widget = {}
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"accept-language": hl})
+        if proxy:
+            self.session.proxies.update({"https": proxy, "http": proxy})
+        self.refresh_cookies()
+
+    def refresh_cookies(self) -> None:
+        response = self.session.get(f"{BASE_TRENDS_URL}/explore/?geo={self.hl[-2:]}", timeout=self.timeout)
+        self.cookies = {k: v for k, v in response.cookies.items() if k == "NID"}
+        self.cookies_at = time.time()
+
+    def _get_json(self, url: str, method: str = "get", trim_chars: int = 0, params: dict = None):
+        response = self.session.request(method, url, params=params, cookies=self.cookies, timeout=self.timeout)
+        content_type = response.headers.get("Content-Type", "")
+        if response.status_code == 200 and any(t in content_type for t in _JSON_TYPES):
+            # Responses start with garbage characters, like ")]}',"
+            return json.loads(response.text[trim_chars:])
+        raise TrendsError(response.status_code)
+
+    def build_payload(self, kw_list: list, timeframe: str, geo: str = "", cat: int = 0, gprop: str = "") -> None:
+        """Get widget tokens for interest over time and interest by region"""
+        self.kw_list = list(kw_list)
+        req = {
+            "comparisonItem": [{"keyword": kw, "time": timeframe, "geo": geo} for kw in self.kw_list],
+            "category": cat,
+            "property": gprop,
+        }
+        params = {"hl": self.hl, "tz": self.tz, "req": json.dumps(req)}
+        with span("build_payload"):
+            widgets = self._get_json(EXPLORE_URL, method="post", trim_chars=4, params=params)["widgets"]
+
+        self.interest_over_time_widget = {}
+        self.interest_by_region_widget = {}
+        for widget in widgets:
+            if widget["id"] == "TIMESERIES":
+                self.interest_over_time_widget = widget
+            if widget["id"] == "GEO_MAP" and not self.interest_by_region_widget:
+                self.interest_by_region_widget = widget
+
+    def _widget_params(self, widget: dict) -> dict:
+        return {"req": json.dumps(widget["request"]), "token": widget["token"], "tz": self.tz}
+
+    def timeseries(self) -> dict:
+        if not self.interest_over_time_widget:
+            return parse_timeline({}, self.kw_list)
+        with span("widget"):
+            payload = self._get_json(
+                INTEREST_OVER_TIME_URL,
+                trim_chars=5,
+                params=self._widget_params(self.interest_over_time_widget),
+            )
+        with span("parse"):
+            return parse_timeline(payload, self.kw_list)
+
+    def regions(self, resolution: str = "REGION", inc_low_vol: bool = True) -> dict:
+        """Interest by region; the resolution is forced for every country"""
+        if not self.interest_by_region_widget:
+            return parse_geo_map({}, self.kw_list)
+        self.interest_by_region_widget["request"]["resolution"] = resolution
+        self.interest_by_region_widget["request"]["includeLowSearchVolumeGeos"] = inc_low_vol
+        with span("widget"):
+            payload = self._get_json(
+                INTEREST_BY_REGION_URL,
+                trim_chars=5,
+                params=self._widget_params(self.interest_by_region_widget),
+            )
+        with span("parse"):
+            return parse_geo_map(payload, self.kw_list)
+
+    def close(self) -> None:
+        self.session.close()
@@ -0,0 +1,58 @@
+"""
+Shape-preserving downsampling of time series for charts.
+
+Largest-Triangle-Three-Buckets (Steinarsson, 2013): the first and last
+points are kept, the others are split into equal buckets and each bucket
+keeps the point forming the largest triangle with the point kept in the
+previous bucket and the average of the next one. Peaks and dips survive,
+unlike with averaging or striding.
+
+The loop runs over buckets only: every series of a matrix sharing the same
+x axis is processed at once with NumPy, so the cost is O(points budget)
+Python steps whatever the window length or keyword count.
+"""
+import numpy as np
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Indices of the points kept per series.
+
+    Args:
+        x: Shared x axis, shape (n,), increasing
+        y: Values, shape (n, k): one column per series
+        threshold: Points to keep per series (at least 3)
+
+    Returns:
+        int array of shape (threshold, k), increasing down each column;
+        all of range(n) when there are no more than threshold points.
+    """
+    n, k = y.shape
+    if threshold >= n or threshold < 3:
+        return np.repeat(np.arange(n)[:, None], k, axis=1)
+
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    # Buckets of the n - 2 inner points, as [edges[i], edges[i + 1])
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    counts = np.diff(edges)
+
+    # Average point of every bucket (the "next" vertex of the triangle),
+    # plus the last point acting as the bucket after the last one
+    avg_x = np.append(np.add.reduceat(x[:-1], edges[:-1]) / counts, x[-1])
+    avg_y = np.vstack([np.add.reduceat(y[:-1], edges[:-1], axis=0) / counts[:, None], y[-1:]])
+
+    columns = np.arange(k)
+    selected = np.empty((threshold, k), dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    for bucket in range(threshold - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        prev = selected[bucket]
+        ax, ay = x[prev], y[prev, columns]
+        bx, by = x[start:stop, None], y[start:stop]
+        cx, cy = avg_x[bucket + 1], avg_y[bucket + 1]
+        # Twice the triangle area (a, b, c) for every candidate b of every series
+        area = np.abs((ax - cx) * (by - ay) - (ax - bx) * (cy - ay))
+        selected[bucket + 1] = start + np.argmax(area, axis=0)
+    return selected
@@ -0,0 +1,130 @@
+"""
+Columnar shaping of interest-by-region results.
+
+Region data arrives as a region list plus one value list per keyword. It is
+turned into a (regions x keywords) matrix once, and masking, sorting and
+conversion run on the whole matrix instead of one pandas lookup per cell.
+"""
+import numpy as np
+
+
+def region_matrix(geo_map: dict, keywords: list):
+    """(regions array, int32 matrix of shape [regions, keywords])"""
+    regions = np.asarray(geo_map.get("regions", []), dtype=object)
+    values = geo_map.get("values", {})
+    matrix = np.zeros((len(regions), len(keywords)), dtype=np.int32)
+    for col, kw in enumerate(keywords):
+        column = values.get(kw)
+        if column is not None and len(column) == len(regions):
+            matrix[:, col] = column
+    return regions, matrix
+
+
+def ranked_regions(geo_map: dict, keyword: str) -> list:
+    """[{"name", "score"}] for regions with data, highest score first"""
+    regions, matrix = region_matrix(geo_map, [keyword])
+    scores = matrix[:, 0]
+    mask = scores > 0
+    regions, scores = regions[mask], scores[mask]
+    # Stable sort keeps the alphabetical order of regions with the same score
+    order = np.argsort(-scores, kind="stable")
+    return [
+        {"name": str(name), "score": score}
+        for name, score in zip(regions[order].tolist(), scores[order].tolist())
+    ]
+
+
+def comparative_regions(geo_map: dict, keywords: list) -> dict:
+    """{region: {keyword: score}} for regions where any keyword has data"""
+    regions, matrix = region_matrix(geo_map, keywords)
+    mask = (matrix > 0).any(axis=1)
+    return {
+        str(name): dict(zip(keywords, row))
+        for name, row in zip(regions[mask].tolist(), matrix[mask].tolist())
+    }
+
+
+def columnar_from_comparative(results: dict, keywords: list) -> dict:
+    """{region: {kw: score}} -> {"regions": [...], "scores": {kw: [...]}}"""
+    regions = list(results)
+    matrix = np.array(
+        [[results[name].get(kw, 0) for kw in keywords] for name in regions],
+        dtype=np.int32,
+    ).reshape(len(regions), len(keywords))
+    return {"regions": regions, "scores": {kw: matrix[:, col].tolist() for col, kw in enumerate(keywords)}}
+
+
+def columnar_from_ranked(results: dict) -> dict:
+    """{kw: [{"name", "score"}]} -> {"regions": [...], "scores": {kw: [...]}} (0 = no data)"""
+    regions = sorted({entry["name"] for entries in results.values() for entry in entries})
+    index = {name: i for i, name in enumerate(regions)}
+    scores = {}
+    for kw, entries in results.items():
+        column = np.zeros(len(regions), dtype=np.int32)
+        if entries:
+            rows = np.fromiter((index[e["name"]] for e in entries), dtype=np.intp, count=len(entries))
+            column[rows] = np.fromiter((e["score"] for e in entries), dtype=np.int32, count=len(entries))
+        scores[kw] = column.tolist()
+    return {"regions": regions, "scores": scores}
+
+
+def to_columnar(result: dict, keywords: list) -> dict:
+    """Replace result["results"] by its columnar shape (handlers' format=columnar)"""
+    results = result.get("results", {})
+    if result.get("comparative"):
+        shaped = columnar_from_comparative(results, keywords)
+    else:
+        shaped = columnar_from_ranked(results)
+    columnar = {k: v for k, v in result.items() if k != "results"}
+    columnar.update(shaped)
+    columnar["format"] = "columnar"
+    return columnar
+
+
+def chain_comparative(batches: list, batch_results: list, pivot: str, keywords: list) -> dict:
+    """
+    Merge comparative batches that all contain `pivot` into one matrix.
+
+    Within a region, comparative values are shares of the batch keywords, so
+    each keyword is first expressed relative to the pivot of its own batch
+    in that region, then shares are recomputed over all keywords (0-100 per
+    region, like a single comparative request). Where the pivot has no data
+    in a region, the batch's mean pivot share is used instead.
+
+    Args:
+        batches: Keyword lists, each starting with the pivot
+        batch_results: {region: {kw: score}} per batch (None for failed batches)
+        pivot: Keyword shared by every batch
+        keywords: Output column order
+    """
+    regions = sorted({name for results in batch_results if results for name in results})
+    row_of = {name: i for i, name in enumerate(regions)}
+    col_of = {kw: i for i, kw in enumerate(keywords)}
+    relative = np.zeros((len(regions), len(keywords)), dtype=np.float64)
+
+    for batch, results in zip(batches, batch_results):
+        if not results:
+            continue
+        shares = np.zeros((len(regions), len(batch)), dtype=np.float64)
+        for name, region_data in results.items():
+            shares[row_of[name]] = [region_data.get(kw, 0) for kw in batch]
+
+        pivot_shares = shares[:, batch.index(pivot)]
+        with_pivot = pivot_shares > 0
+        if not with_pivot.any():
+            continue
+        fallback = pivot_shares[with_pivot].mean()
+        scale = np.where(with_pivot, pivot_shares, fallback)
+
+        cols = [col_of[kw] for kw in batch]
+        relative[:, cols] = np.maximum(relative[:, cols], shares / scale[:, None])
+
+    totals = relative.sum(axis=1, keepdims=True)
+    scores = np.rint(np.divide(relative * 100, totals, out=np.zeros_like(relative), where=totals > 0))
+    scores = scores.astype(np.int32)
+
+    mask = (scores > 0).any(axis=1)
+    return {
+        name: dict(zip(keywords, row))
+        for name, row in zip(np.asarray(regions, dtype=object)[mask].tolist(), scores[mask].tolist())
+    }
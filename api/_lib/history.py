@@ -0,0 +1,321 @@
+"""
+Columnar binary history of daily interest values and geo matrices.
+
+The SQLite store of an instance starts empty on every cold start, and a JSON
+export of a year of daily values for every candidate is slow to parse. This
+file is written by the trends pipeline (scripts/prewarm.py --history) and
+read through mmap: arrays are NumPy views on the mapped pages, nothing is
+parsed or copied beyond a small header.
+
+Layout (little-endian, every array 8-byte aligned):
+
+    b"TRHIST01"                 magic
+    uint32                      header length
+    header                      JSON: section offsets, shapes and string ids
+    strings                     dictionary of every keyword, geo and region:
+                                uint32 offsets[n + 1] + UTF-8 blob
+    dates                       int32 days since 1970-01-01, one contiguous axis
+    series (one per geo/pivot)  uint32 keyword ids + float32 [days, keywords], NaN = missing
+    geo (one per target)        uint32 region ids + uint32 keyword ids + uint8 [regions, keywords]
+
+Every series group shares the scale of its (geo, pivot) like the store, so
+rows copied into the store need no rescaling. Geo matrices hold comparative
+shares (0-100 per region) of prewarmed keyword sets; they answer comparative
+geo requests for any subset of a set when upstream cannot.
+"""
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from datetime import date, timedelta
+
+import numpy as np
+
+HISTORY_PATH_ENV = "TRENDS_HISTORY_PATH"
+DEFAULT_HISTORY_PATH = os.path.join(tempfile.gettempdir(), "trends_history.bin")
+MAGIC = b"TRHIST01"
+
+_EPOCH = date(1970, 1, 1)
+_ALIGN = 8
+
+_history = None
+_history_lock = threading.Lock()
+
+
+def history_path() -> str:
+    """Configured history file, "" when disabled"""
+    return os.environ.get(HISTORY_PATH_ENV, DEFAULT_HISTORY_PATH)
+
+
+class _Writer:
+    """Appends aligned arrays and records their descriptors"""
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def add(self, array: np.ndarray) -> dict:
+        padding = -self.size % _ALIGN
+        if padding:
+            self.chunks.append(b"\0" * padding)
+            self.size += padding
+        data = np.ascontiguousarray(array).astype(array.dtype.newbyteorder("<"), copy=False).tobytes()
+        section = {"offset": self.size, "dtype": array.dtype.str.lstrip("<>|="), "shape": list(array.shape)}
+        self.chunks.append(data)
+        self.size += len(data)
+        return section
+
+
+def write_history(path: str, series_groups: list, geo_groups: list) -> None:
+    """
+    Atomically write a history file.
+
+    Args:
+        series_groups: [(geo, pivot, {keyword: {iso day: value}}), ...]
+        geo_groups: [(geo, resolution, days, {region: {keyword: score 0-100}}), ...]
+    """
+    strings = {}
+
+    def string_id(value: str) -> int:
+        return strings.setdefault(value, len(strings))
+
+    all_days = sorted({day for _, _, series in series_groups for days in series.values() for day in days})
+    start = date.fromisoformat(all_days[0]) if all_days else _EPOCH
+    end = date.fromisoformat(all_days[-1]) if all_days else _EPOCH - timedelta(days=1)
+    n_days = (end - start).days + 1
+
+    body = _Writer()
+    dates = body.add(np.arange((start - _EPOCH).days, (start - _EPOCH).days + n_days, dtype=np.int32))
+
+    series_sections = []
+    for geo, pivot, series in series_groups:
+        keywords = list(series)
+        matrix = np.full((n_days, len(keywords)), np.nan, dtype=np.float32)
+        for col, kw in enumerate(keywords):
+            if series[kw]:
+                rows = np.array([(date.fromisoformat(d) - start).days for d in series[kw]], dtype=np.int64)
+                matrix[rows, col] = np.fromiter(series[kw].values(), dtype=np.float32, count=len(rows))
+        series_sections.append({
+            "geo": string_id(geo),
+            "pivot": string_id(pivot),
+            "keywords": body.add(np.array([string_id(kw) for kw in keywords], dtype=np.uint32)),
+            "values": body.add(matrix),
+        })
+
+    geo_sections = []
+    for geo, resolution, days, results in geo_groups:
+        regions = list(results)
+        keywords = list(dict.fromkeys(kw for scores in results.values() for kw in scores))
+        matrix = np.array(
+            [[results[name].get(kw, 0) for kw in keywords] for name in regions], dtype=np.int64
+        ).reshape(len(regions), len(keywords))
+        geo_sections.append({
+            "geo": string_id(geo),
+            "resolution": resolution,
+            "days": days,
+            "regions": body.add(np.array([string_id(name) for name in regions], dtype=np.uint32)),
+            "keywords": body.add(np.array([string_id(kw) for kw in keywords], dtype=np.uint32)),
+            "values": body.add(np.clip(matrix, 0, 255).astype(np.uint8)),
+        })
+
+    encoded = [value.encode("utf-8") for value in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint32)
+    offsets[1:] = np.cumsum([len(b) for b in encoded])
+    string_offsets = body.add(offsets)
+    string_blob = body.add(np.frombuffer(b"".join(encoded), dtype=np.uint8))
+
+    header = json.dumps({
+        "start": start.isoformat(),
+        "days": n_days,
+        "dates": dates,
+        "strings": {"offsets": string_offsets, "blob": string_blob},
+        "series": series_sections,
+        "geo": geo_sections,
+    }).encode("utf-8")
+    # Section offsets are relative to the aligned start of the body
+    prefix = len(MAGIC) + 4 + len(header)
+    body_start = prefix + (-prefix % _ALIGN)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".trends_history.", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<I", len(header)))
+            f.write(header)
+            f.write(b"\0" * (body_start - prefix))
+            for chunk in body.chunks:
+                f.write(chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class History:
+    """Read-only, memory-mapped history file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.mtime = os.path.getmtime(path)
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a trends history file")
+        (header_length,) = struct.unpack_from("<I", self._mm, len(MAGIC))
+        header_start = len(MAGIC) + 4
+        header = json.loads(self._mm[header_start:header_start + header_length])
+        prefix = header_start + header_length
+        self._body = prefix + (-prefix % _ALIGN)
+
+        self.start = date.fromisoformat(header["start"])
+        self.days = header["days"]
+        self.dates = self._view(header["dates"])
+
+        offsets = self._view(header["strings"]["offsets"])
+        blob = self._view(header["strings"]["blob"])
+        self._offsets, self._blob = offsets, blob
+        self._strings = {}
+
+        self._series = {}
+        for section in header["series"]:
+            key = (self._string(section["geo"]), self._string(section["pivot"]))
+            keywords = [self._string(i) for i in self._view(section["keywords"]).tolist()]
+            self._series[key] = ({kw: col for col, kw in enumerate(keywords)}, self._view(section["values"]))
+
+        self._geo = {}
+        for section in header["geo"]:
+            key = (self._string(section["geo"]), section["resolution"], section["days"])
+            self._geo[key] = (
+                [self._string(i) for i in self._view(section["regions"]).tolist()],
+                [self._string(i) for i in self._view(section["keywords"]).tolist()],
+                self._view(section["values"]),
+            )
+
+    def _view(self, section: dict) -> np.ndarray:
+        """Zero-copy view of a section on the mapped file"""
+        dtype = np.dtype(section["dtype"]).newbyteorder("<")
+        count = int(np.prod(section["shape"])) if section["shape"] else 1
+        return np.frombuffer(
+            self._mm, dtype=dtype, count=count, offset=self._body + section["offset"]
+        ).reshape(section["shape"])
+
+    def _string(self, index: int) -> str:
+        value = self._strings.get(index)
+        if value is None:
+            value = bytes(self._blob[self._offsets[index]:self._offsets[index + 1]]).decode("utf-8")
+            self._strings[index] = value
+        return value
+
+    def window(self, keywords: list, geo: str, pivot: str, start: date, end: date):
+        """
+        float32 view [days, keywords] of [start, end] clipped to the history,
+        with the first day it starts on; None when a keyword has no series.
+        """
+        group = self._series.get((geo, pivot))
+        if group is None:
+            return None
+        columns, values = group
+        if any(kw not in columns for kw in keywords):
+            return None
+        first = max(0, (start - self.start).days)
+        last = min(self.days - 1, (end - self.start).days)
+        if first > last:
+            return None
+        cols = [columns[kw] for kw in keywords]
+        # Contiguous column ranges stay views; a reordering makes a small copy
+        if cols == list(range(cols[0], cols[0] + len(cols))):
+            matrix = values[first:last + 1, cols[0]:cols[0] + len(cols)]
+        else:
+            matrix = values[first:last + 1][:, cols]
+        return self.start + timedelta(days=first), matrix
+
+    def read(self, keywords: list, geo: str, pivot: str, start: date, end: date) -> dict:
+        """Days of [start, end] every keyword has a value for: {keyword: {day: value}}"""
+        found = self.window(keywords, geo, pivot, start, end)
+        if found is None:
+            return {kw: {} for kw in keywords}
+        first_day, matrix = found
+        complete = np.flatnonzero(~np.isnan(matrix).any(axis=1))
+        days = [(first_day + timedelta(days=int(i))).isoformat() for i in complete]
+        return {
+            kw: dict(zip(days, matrix[complete, col].tolist()))
+            for col, kw in enumerate(keywords)
+        }
+
+    def geo(self, geo: str, resolution: str, days: int):
+        """(regions, keywords, uint8 view [regions, keywords]) or None"""
+        return self._geo.get((geo, resolution, days))
+
+    def comparative(self, keywords: list, geo: str, resolution: str, days: int):
+        """
+        {region: {keyword: share}} for keywords, shares recomputed over them
+        (0-100 per region, like a comparative request); None unless one
+        matrix holds every keyword.
+        """
+        found = self.geo(geo, resolution, days)
+        if found is None:
+            return None
+        regions, columns, values = found
+        col_of = {kw: col for col, kw in enumerate(columns)}
+        if any(kw not in col_of for kw in keywords):
+            return None
+        matrix = values[:, [col_of[kw] for kw in keywords]].astype(np.float64)
+        totals = matrix.sum(axis=1, keepdims=True)
+        scores = np.rint(np.divide(matrix * 100, totals, out=np.zeros_like(matrix), where=totals > 0))
+        scores = scores.astype(np.int32)
+        mask = (scores > 0).any(axis=1)
+        return {
+            name: dict(zip(keywords, row))
+            for name, row in zip(np.asarray(regions, dtype=object)[mask].tolist(), scores[mask].tolist())
+        }
+
+
+def get_history():
+    """Current history, remapped when the file changes; None when there is none"""
+    global _history
+
+    path = history_path()
+    if not path:
+        return None
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    with _history_lock:
+        if _history is None or _history.path != path or _history.mtime != mtime:
+            # Readers may still use the previous mapping: it is unmapped with its last reference
+            try:
+                _history = History(path)
+            except (OSError, ValueError) as e:
+                print(f"[History] Cannot map {path}: {e}")
+                _history = None
+        return _history
+
+
+def history_comparative(keywords: list, geo: str, resolution: str, days: int):
+    """Comparative geo results of keywords from the history (see History.comparative), or None"""
+    history = get_history()
+    if history is None:
+        return None
+    return history.comparative(keywords, geo, resolution, days)
+
+
+def seed_store(store, keywords: list, geo: str, pivot: str, start: date, end: date) -> int:
+    """Copy the history days of [start, end] into the store; returns the number of days copied"""
+    history = get_history()
+    if history is None:
+        return 0
+    series = history.read(keywords, geo, pivot, start, end)
+    days = sorted(series[pivot]) if pivot in series else []
+    if not days:
+        return 0
+    store.write(geo, pivot, [
+        (date.fromisoformat(day), {kw: series[kw][day] for kw in keywords}, False)
+        for day in days
+    ])
+    return len(days)
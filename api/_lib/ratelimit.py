@@ -0,0 +1,291 @@
+"""
+Rate-limit state shared by every worker and instance of a machine.
+
+Module globals only cover one process: after Google answers 429, the other
+workers kept calling it and made the cooldown longer. The state below lives
+in SQLite (TRENDS_RATE_STATE_PATH, the daily store's file by default), one
+row per name, updated in IMMEDIATE transactions:
+
+    egress names ("direct", "host:port")
+        last_429, strikes      last 429 and how many in a row
+        open_until             circuit breaker: no call before this time
+        tokens, updated        shared token bucket (TRENDS_RATE per machine)
+    gate names ("trends", "geo")
+        last_request           the handlers' minimum delay between full jobs
+
+Circuit breaker: once an egress collects `threshold` consecutive 429s it is
+open for a cooldown doubling with every strike (BREAKER_COOLDOWN up to
+BREAKER_MAX_COOLDOWN). While open, every instance gets CircuitOpen at once
+and serves cached or stale data instead of sleeping through retries. When
+the cooldown ends a single caller is let through as a probe (half-open):
+its success closes the breaker, another 429 reopens it for longer.
+
+TRENDS_RATE_STATE_PATH="" keeps the state in memory (one process, as
+before). Other backends (Redis...) subclass RateState, implement _read() and
+_update(), and are installed with set_rate_state().
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from .backoff import DeadlineExceeded
+from .store import DEFAULT_STORE_PATH, STORE_PATH_ENV
+from .timing import span
+
+RATE_STATE_PATH_ENV = "TRENDS_RATE_STATE_PATH"
+
+# Consecutive 429s opening the breaker of a single egress
+BREAKER_THRESHOLD = int(os.environ.get("TRENDS_BREAKER_THRESHOLD", "2"))
+BREAKER_COOLDOWN = float(os.environ.get("TRENDS_BREAKER_COOLDOWN", "30"))
+BREAKER_MAX_COOLDOWN = float(os.environ.get("TRENDS_BREAKER_MAX_COOLDOWN", "900"))
+# Time a half-open probe has before another caller may probe
+PROBE_SECONDS = 30.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_state (
+    name TEXT PRIMARY KEY,
+    state TEXT NOT NULL
+)
+"""
+
+_state = None
+_state_lock = threading.Lock()
+
+
+class CircuitOpen(Exception):
+    """The breaker is open: do not call upstream"""
+
+    def __init__(self, name: str, wait: float):
+        super().__init__(f"Circuit open for {name}, {wait:.0f}s left")
+        self.name = name
+        self.wait = wait
+
+
+class RateState(ABC):
+    """
+    Named rate-limit records. Backends provide _read(name) -> dict and an
+    atomic _update(name, fn), fn mutating the record dict and returning a
+    value handed back to the caller.
+    """
+
+    shared = False
+
+    @abstractmethod
+    def _read(self, name: str) -> dict:
+        """Copy of the record of name ({} when there is none)"""
+
+    @abstractmethod
+    def _update(self, name: str, fn):
+        """Apply fn to the record of name atomically and store it; returns fn's result"""
+
+    # Circuit breaker
+
+    def allow(self, name: str) -> float:
+        """
+        0.0 when a call may go upstream now (closed breaker, or this caller
+        is the half-open probe), otherwise the seconds the breaker stays open.
+        """
+        now = time.time()
+
+        def check(state):
+            open_until = state.get("open_until", 0.0)
+            if open_until <= now:
+                if state.get("strikes", 0) >= state.get("threshold", BREAKER_THRESHOLD):
+                    # Half-open: this caller probes, the others wait for its outcome
+                    state["open_until"] = now + PROBE_SECONDS
+                return 0.0
+            return open_until - now
+
+        # Reads are enough for the common closed case
+        state = self._read(name)
+        closed = state.get("strikes", 0) < state.get("threshold", BREAKER_THRESHOLD)
+        if closed and state.get("open_until", 0.0) <= now:
+            return 0.0
+        return self._update(name, check)
+
+    def record_429(self, name: str, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN,
+                   max_cooldown: float = BREAKER_MAX_COOLDOWN) -> float:
+        """Count a 429; returns the seconds the breaker is now open (0.0 while closed)"""
+        now = time.time()
+
+        def strike(state):
+            state["last_429"] = now
+            state["strikes"] = state.get("strikes", 0) + 1
+            state["threshold"] = threshold
+            if state["strikes"] < threshold:
+                return 0.0
+            seconds = min(max_cooldown, cooldown * 2 ** (state["strikes"] - threshold))
+            state["open_until"] = now + seconds
+            return seconds
+
+        return self._update(name, strike)
+
+    def record_success(self, name: str) -> None:
+        state = self._read(name)
+        if not state.get("strikes") and not state.get("open_until"):
+            return
+
+        def close(state):
+            state["strikes"] = 0
+            state["open_until"] = 0.0
+
+        self._update(name, close)
+
+    def is_open(self, name: str) -> bool:
+        """Whether the breaker refuses calls right now (read only, no probe taken)"""
+        return self._read(name).get("open_until", 0.0) > time.time()
+
+    def status(self, name: str) -> dict:
+        """Current record: last 429, strikes, cooldown left, budget left"""
+        state = self._read(name)
+        now = time.time()
+        return {
+            "last_429": state.get("last_429"),
+            "strikes": state.get("strikes", 0),
+            "cooldown": round(max(0.0, state.get("open_until", 0.0) - now), 1),
+            "tokens": round(state["tokens"], 2) if "tokens" in state else None,
+        }
+
+    # Shared token bucket
+
+    def take(self, name: str, rate: float, burst: float, tokens: float = 1.0) -> float:
+        """Take tokens if available: 0.0, else the seconds until they are"""
+        now = time.time()
+
+        def refill(state):
+            available = min(burst, state.get("tokens", burst) + (now - state.get("updated", now)) * rate)
+            state["updated"] = now
+            if available >= tokens:
+                state["tokens"] = available - tokens
+                return 0.0
+            state["tokens"] = available
+            return (tokens - available) / rate
+
+        return self._update(name, refill)
+
+    def peek(self, name: str, rate: float, burst: float, tokens: float = 1.0) -> float:
+        """Seconds until tokens are available, without taking them"""
+        state = self._read(name)
+        now = time.time()
+        available = min(burst, state.get("tokens", burst) + (now - state.get("updated", now)) * rate)
+        return max(0.0, (tokens - available) / rate)
+
+    # Gates between full jobs
+
+    def last_request(self, name: str) -> float:
+        return self._read(name).get("last_request", 0.0)
+
+    def mark_request(self, name: str, at: float = None) -> None:
+        at = time.time() if at is None else at
+
+        def mark(state):
+            state["last_request"] = at
+
+        self._update(name, mark)
+
+
+class MemoryRateState(RateState):
+    """Process-local state"""
+
+    def __init__(self):
+        self._records = {}
+        self._lock = threading.Lock()
+
+    def _read(self, name: str) -> dict:
+        with self._lock:
+            return dict(self._records.get(name, {}))
+
+    def _update(self, name: str, fn):
+        with self._lock:
+            state = self._records.setdefault(name, {})
+            return fn(state)
+
+
+class SqliteRateState(RateState):
+    """State in a SQLite file shared by the processes of the machine"""
+
+    shared = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        # Autocommit mode: transactions are opened explicitly, IMMEDIATE
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(_SCHEMA)
+
+    def _read(self, name: str) -> dict:
+        with self._lock:
+            row = self._conn.execute("SELECT state FROM rate_state WHERE name = ?", (name,)).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def _update(self, name: str, fn):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT state FROM rate_state WHERE name = ?", (name,)).fetchone()
+                state = json.loads(row[0]) if row else {}
+                result = fn(state)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO rate_state (name, state) VALUES (?, ?)",
+                    (name, json.dumps(state)),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return result
+
+
+class SharedBucket:
+    """Token bucket kept in the rate state: one budget for every process"""
+
+    def __init__(self, state: RateState, name: str, rate: float, burst: float):
+        self.state = state
+        self.name = name
+        self.rate = max(rate, 1e-6)
+        self.burst = max(burst, 1.0)
+
+    def delay(self, tokens: float = 1.0) -> float:
+        return self.state.peek(self.name, self.rate, self.burst, tokens)
+
+    def acquire(self, tokens: float = 1.0, deadline=None) -> float:
+        """Same contract as TokenBucket.acquire"""
+        waited = 0.0
+        while True:
+            delay = self.state.take(self.name, self.rate, self.burst, tokens)
+            if delay <= 0:
+                return waited
+            if deadline is not None and delay > deadline.remaining():
+                raise DeadlineExceeded(f"Rate budget needs {delay:.1f}s")
+            with span("sleep"):
+                time.sleep(delay)
+            waited += delay
+
+
+def set_rate_state(state: RateState) -> None:
+    """Install a rate state backend for the process"""
+    global _state
+
+    with _state_lock:
+        _state = state
+
+
+def get_rate_state() -> RateState:
+    """Process-wide rate state: SQLite when a path is configured, memory otherwise"""
+    global _state
+
+    with _state_lock:
+        if _state is None:
+            path = os.environ.get(RATE_STATE_PATH_ENV, os.environ.get(STORE_PATH_ENV, DEFAULT_STORE_PATH))
+            if path:
+                try:
+                    _state = SqliteRateState(path)
+                except sqlite3.Error as e:
+                    print(f"[RateState] Cannot open {path}: {e}")
+            if _state is None:
+                _state = MemoryRateState()
+        return _state
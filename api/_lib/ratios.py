@@ -0,0 +1,354 @@
+"""
+Persistent graph of measured keyword ratios.
+
+Every batch fetched by the scores mode measures the ratio of the mean
+interest of each pair of its keywords. Ratios are kept in SQLite (next to
+the daily store) per (geo, period), with the time they were measured and a
+weight from the magnitudes they were computed from: Trends values are
+integers, so a ratio of two small means is much noisier than one of two
+large means.
+
+Scores of any keyword set are then the least-squares solution, in log
+space, of all fresh ratios of the connected component that links them:
+redundant measurements average out, and keywords measured with different
+pivots (or in different requests) end up on one scale. The planner only
+asks for the batches that link new or stale keywords to that component, so
+adding one candidate to a measured set costs a single request.
+
+Batches form a magnitude ladder: keywords are grouped with neighbours of
+similar estimated volume and bridged by a linked keyword of that volume,
+instead of always sitting next to the first (often dominant) keyword.
+"""
+import math
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from .store import DEFAULT_STORE_PATH, STORE_PATH_ENV
+
+RATIOS_ENABLED = os.environ.get("TRENDS_RATIOS", "1") != "0"
+# Ratios older than this are not trusted for planning (seconds)
+RATIO_TTL = float(os.environ.get("TRENDS_RATIO_TTL", str(3 * 3600)))
+
+MAX_KEYWORDS_PER_BATCH = 5
+# Mean scores below this are too coarse to rank on (integer values)
+MIN_MEAN = float(os.environ.get("TRENDS_MIN_MEAN", "5"))
+# Tolerated magnitude ratio between a keyword and the top of its batch,
+# beyond what the closest precise keyword above it would give
+MAX_BATCH_SPREAD = 4.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ratios (
+    a TEXT NOT NULL,
+    b TEXT NOT NULL,
+    geo TEXT NOT NULL,
+    period TEXT NOT NULL,
+    log_ratio REAL NOT NULL,
+    weight REAL NOT NULL,
+    measured_at REAL NOT NULL,
+    PRIMARY KEY (a, b, geo, period)
+);
+CREATE TABLE IF NOT EXISTS no_data (
+    keyword TEXT NOT NULL,
+    geo TEXT NOT NULL,
+    period TEXT NOT NULL,
+    measured_at REAL NOT NULL,
+    PRIMARY KEY (keyword, geo, period)
+);
+CREATE TABLE IF NOT EXISTS measures (
+    keyword TEXT NOT NULL,
+    geo TEXT NOT NULL,
+    period TEXT NOT NULL,
+    mean REAL NOT NULL,
+    top TEXT NOT NULL,
+    measured_at REAL NOT NULL,
+    PRIMARY KEY (keyword, geo, period)
+)
+"""
+
+_graph = None
+_graph_lock = threading.Lock()
+
+
+def _components(nodes: set, edges: list) -> list:
+    """Connected components of an undirected graph, as sets"""
+    parent = {node: node for node in nodes}
+
+    def find(node):
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    for a, b, *_ in edges:
+        parent[find(a)] = find(b)
+    groups = {}
+    for node in nodes:
+        groups.setdefault(find(node), set()).add(node)
+    return list(groups.values())
+
+
+class RatioGraph:
+    """Measured log ratios per (geo, period), safe to share between threads"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def record(self, geo: str, period, means: dict) -> int:
+        """
+        Store the ratios of every pair of a batch's mean scores.
+        Keywords without data (mean 0) give no ratio and are recorded as
+        measured at 0. Returns the number of pairs.
+        """
+        keywords = sorted(kw for kw, mean in means.items() if mean and mean > 0)
+        if not means:
+            return 0
+        now = time.time()
+        rows = []
+        for i, a in enumerate(keywords):
+            for b in keywords[i + 1:]:
+                # Variance of log(a/b) from integer rounding ~ 1/a² + 1/b²
+                weight = 1.0 / (1.0 / means[a] ** 2 + 1.0 / means[b] ** 2)
+                rows.append((a, b, geo, str(period), math.log(means[a] / means[b]), weight, now))
+        empty = [(kw, geo, str(period), now) for kw in means if kw not in keywords]
+        # Precision of each keyword: its mean and the keyword that set the batch's scale
+        top = max(keywords, key=means.get) if keywords else None
+        measured = [(kw, geo, str(period), means[kw] or 0.0, top, now) for kw in means] if top else []
+        with self._lock:
+            self._conn.executemany(
+                """
+                INSERT OR REPLACE INTO ratios (a, b, geo, period, log_ratio, weight, measured_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                rows,
+            )
+            self._conn.executemany(
+                "DELETE FROM no_data WHERE keyword = ? AND geo = ? AND period = ?",
+                [(kw, geo, str(period)) for kw in keywords],
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO no_data (keyword, geo, period, measured_at) VALUES (?, ?, ?, ?)",
+                empty,
+            )
+            self._conn.executemany(
+                """
+                INSERT OR REPLACE INTO measures (keyword, geo, period, mean, top, measured_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                measured,
+            )
+            self._conn.commit()
+        return len(rows)
+
+    def no_data(self, geo: str, period, max_age: float = RATIO_TTL) -> set:
+        """Keywords last measured without data, within max_age (None: any age)"""
+        query = "SELECT keyword FROM no_data WHERE geo = ? AND period = ?"
+        args = [geo, str(period)]
+        if max_age is not None:
+            query += " AND measured_at >= ?"
+            args.append(time.time() - max_age)
+        with self._lock:
+            return {row[0] for row in self._conn.execute(query, args).fetchall()}
+
+    def measures(self, geo: str, period, max_age: float = RATIO_TTL) -> dict:
+        """{keyword: (mean, top of its batch)} of the last measure within max_age (None: any age)"""
+        query = "SELECT keyword, mean, top FROM measures WHERE geo = ? AND period = ?"
+        args = [geo, str(period)]
+        if max_age is not None:
+            query += " AND measured_at >= ?"
+            args.append(time.time() - max_age)
+        with self._lock:
+            rows = self._conn.execute(query, args).fetchall()
+        return {kw: (mean, top) for kw, mean, top in rows}
+
+    def edges(self, geo: str, period, max_age: float = RATIO_TTL) -> list:
+        """[(a, b, log_ratio, weight)] measured within max_age (None: any age)"""
+        query = "SELECT a, b, log_ratio, weight FROM ratios WHERE geo = ? AND period = ?"
+        args = [geo, str(period)]
+        if max_age is not None:
+            query += " AND measured_at >= ?"
+            args.append(time.time() - max_age)
+        with self._lock:
+            return self._conn.execute(query, args).fetchall()
+
+    def _linked(self, keywords: list, edges: list):
+        """(all components, the one linking the keywords, anchor keyword in it)"""
+        nodes = set(keywords) | {a for a, *_ in edges} | {b for _, b, *_ in edges}
+        components = _components(nodes, edges)
+        # The component covering most keywords, ties going to the earliest keyword's
+        order = {kw: i for i, kw in enumerate(keywords)}
+        main = max(
+            components,
+            key=lambda c: (len(c & order.keys()), len(c), -min((order[kw] for kw in c if kw in order), default=len(order))),
+        )
+        anchor = min(main & order.keys(), key=order.get)
+        return components, main, anchor
+
+    def _imprecise(self, keywords: list, main: set, empty: set, estimates: dict, measures: dict) -> list:
+        """
+        Keywords whose last measure rounded them to a few units (or to 0)
+        next to a batch top much larger than the closest precise keyword
+        above them, which would bridge them with more precision.
+        """
+        precise = {
+            kw: value for kw, value in estimates.items()
+            if value > 0 and measures.get(kw, (0.0, None))[0] >= MIN_MEAN
+        }
+        imprecise = []
+        for kw in keywords:
+            if kw not in measures or (kw not in main and kw not in empty):
+                continue
+            mean, top = measures[kw]
+            if mean >= MIN_MEAN or top == kw or top not in estimates:
+                continue
+            magnitude = estimates.get(kw, 0.0)
+            above = [value for other, value in precise.items() if other != kw and value >= magnitude]
+            if above and estimates[top] > MAX_BATCH_SPREAD * min(above):
+                imprecise.append(kw)
+        return imprecise
+
+    def plan(self, keywords: list, geo: str, period) -> list:
+        """
+        Batches that link every keyword to one component of fresh ratios,
+        with usable precision; [] when they all are already.
+
+        Batches form a ladder: keywords to link are sorted by magnitude
+        (estimated from ratios of any age) and each batch is bridged by the
+        linked keyword closest to its volume, usually the smallest one of
+        the batch before, so no value is rounded down next to a dominant
+        pivot. Keywords measured that way anyway (or measured at 0) are
+        re-linked under the closest precise keyword above them. Without
+        magnitudes this is the usual pivot chain; either way N new keywords
+        take ceil((N-1)/4) batches.
+        """
+        edges = self.edges(geo, period)
+        components, main, anchor = self._linked(keywords, edges)
+        empty = self.no_data(geo, period)
+        measures = self.measures(geo, period)
+        tops = [top for _, top in measures.values() if top not in keywords]
+        estimates = self.solve(keywords + sorted(set(tops)), geo, period, max_age=None)
+
+        # One representative per component left out: linking it links the whole component
+        unlinked = []
+        for component in components:
+            if component is main or component <= empty:
+                continue
+            representative = next((kw for kw in keywords if kw in component), None)
+            if representative is not None:
+                unlinked.append(representative)
+        imprecise = [kw for kw in self._imprecise(keywords, main, empty, estimates, measures) if kw not in unlinked]
+        if len(main) == 1:
+            # No ratio between the keywords: enough when one at most has data and it was measured
+            live = [kw for kw in keywords if kw not in empty]
+            if not live or (len(live) == 1 and live[0] in measures):
+                return []
+            # Nothing fresh yet: the anchor is just one more keyword of the ladder
+            unlinked.append(anchor)
+        if not unlinked and not imprecise:
+            return []
+
+        bridges = [kw for kw in keywords if kw in main and kw not in unlinked and kw not in imprecise]
+
+        def by_magnitude(group):
+            # Unknown magnitudes first, in request order, then from the largest down
+            return sorted(group, key=lambda kw: (kw in estimates, -estimates.get(kw, 0.0), keywords.index(kw)))
+
+        def magnitude(kw):
+            return estimates.get(kw, 0.0) > 0
+
+        size = MAX_KEYWORDS_PER_BATCH - 1
+        batches = []
+        chunks = []
+        for kw in by_magnitude(unlinked):
+            # A first batch without any bridge holds five new keywords
+            capacity = size + (len(chunks) == 1 and not bridges)
+            if chunks and len(chunks[-1]) < capacity:
+                chunks[-1].append(kw)
+            else:
+                chunks.append([kw])
+        for chunk in chunks:
+            known = [math.log(estimates[kw]) for kw in chunk if magnitude(kw)]
+            candidates = [kw for kw in bridges if magnitude(kw)]
+            if not bridges:
+                batches.append(chunk)
+            elif known and candidates:
+                level = sum(known) / len(known)
+                batches.append([min(candidates, key=lambda kw: abs(math.log(estimates[kw]) - level))] + chunk)
+            else:
+                batches.append([bridges[0]] + chunk)
+            bridges.extend(chunk)
+
+        # Re-linked keywords: batches spanning at most MAX_BATCH_SPREAD, under
+        # the closest precise keyword above their smallest member
+        chunks = []
+        for kw in by_magnitude(imprecise):
+            if chunks and len(chunks[-1]) < size and estimates[chunks[-1][0]] <= MAX_BATCH_SPREAD * estimates[kw]:
+                chunks[-1].append(kw)
+            else:
+                chunks.append([kw])
+        for chunk in chunks:
+            smallest = estimates[chunk[-1]]
+            above = [kw for kw in bridges if estimates.get(kw, 0.0) >= smallest and magnitude(kw)]
+            bridge = min(above, key=estimates.get) if above else anchor
+            batches.append([bridge] + [kw for kw in chunk if kw != bridge])
+        return batches
+
+    def solve(self, keywords: list, geo: str, period, max_age: float = RATIO_TTL) -> dict:
+        """
+        Relative scores {kw: value} of the keywords linked by ratios within
+        max_age, from a weighted least-squares fit of the log ratios. The
+        first linked keyword of `keywords` is 1, keywords measured without
+        data are 0; unlinked keywords are absent. Without any ratio between
+        them, the first keyword measured alone with data is 1.
+        """
+        if not keywords:
+            return {}
+        zeros = {kw: 0.0 for kw in self.no_data(geo, period, max_age) if kw in keywords}
+        edges = self.edges(geo, period, max_age)
+        _, main, anchor = self._linked(keywords, edges)
+        if len(main) == 1:
+            measures = self.measures(geo, period, max_age)
+            lone = next((kw for kw in keywords if kw not in zeros and measures.get(kw, (0.0, None))[0] > 0), None)
+            return {**zeros, lone: 1.0} if lone else zeros
+        nodes = sorted(main)
+        index = {node: i for i, node in enumerate(nodes)}
+        component_edges = [e for e in edges if e[0] in index]
+
+        # Rows: sqrt(w) * (x_a - x_b) = sqrt(w) * log(a/b); x_anchor fixed at 0
+        design = np.zeros((len(component_edges), len(nodes)))
+        target = np.empty(len(component_edges))
+        for row, (a, b, log_ratio, weight) in enumerate(component_edges):
+            scale = math.sqrt(weight)
+            design[row, index[a]] = scale
+            design[row, index[b]] = -scale
+            target[row] = scale * log_ratio
+        free = [i for i in range(len(nodes)) if nodes[i] != anchor]
+        solution = np.zeros(len(nodes))
+        solution[free] = np.linalg.lstsq(design[:, free], target, rcond=None)[0]
+        return {**zeros, **{kw: float(np.exp(solution[index[kw]])) for kw in keywords if kw in index}}
+
+
+def get_graph():
+    """Shared ratio graph, None when disabled or unavailable"""
+    global _graph
+
+    path = os.environ.get(STORE_PATH_ENV, DEFAULT_STORE_PATH)
+    if not path or not RATIOS_ENABLED:
+        return None
+
+    with _graph_lock:
+        if _graph is None or _graph.path != path:
+            try:
+                _graph = RatioGraph(path)
+            except sqlite3.Error as e:
+                print(f"[RatioGraph] Cannot open {path}: {e}")
+                return None
+        return _graph
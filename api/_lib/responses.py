@@ -0,0 +1,159 @@
+"""
+JSON responses for the BaseHTTPRequestHandler based handlers: a single JSON
+body, or a stream of events flushed as batches complete.
+
+Single bodies carry a weak content-hash ETag (a matching If-None-Match gets
+a 304 without body) and are compressed according to Accept-Encoding: brotli
+when the optional `brotli` package is installed, gzip otherwise.
+"""
+import gzip
+import hashlib
+import json
+import threading
+
+from .timing import current
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Fields describing how a response was served rather than its data
+VOLATILE_FIELDS = ("age", "stale", "from_cache", "snapshot", "timings", "cache", "egress")
+
+# Smaller bodies are not worth compressing
+MIN_COMPRESS_BYTES = 1024
+
+
+def etag_of(payload) -> str:
+    """Weak ETag of a payload, ignoring its volatile fields"""
+    if isinstance(payload, dict):
+        payload = {k: v for k, v in payload.items() if k not in VOLATILE_FIELDS}
+    raw = json.dumps(payload, sort_keys=True).encode()
+    return f'W/"{hashlib.sha256(raw).hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match check with weak comparison (RFC 9110 13.1.2)"""
+    if not if_none_match:
+        return False
+    opaque = etag.removeprefix("W/")
+    return any(
+        candidate == "*" or candidate.removeprefix("W/") == opaque
+        for candidate in (c.strip() for c in if_none_match.split(","))
+    )
+
+
+def pick_encoding(accept_encoding: str):
+    """"br", "gzip" or None from an Accept-Encoding header"""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.lower()] = q
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def encode_body(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+
+def send_json(request_handler, status: int, payload, headers: dict = None) -> None:
+    """
+    Write payload as JSON, with the Server-Timing header of the current request.
+    200 responses get an ETag; a GET for data the client already has gets a bodiless 304.
+    """
+    timings = current()
+    request_headers = getattr(request_handler, "headers", None) or {}
+    headers = dict(headers or {})
+
+    if status == 200:
+        etag = etag_of(payload)
+        headers["ETag"] = etag
+        conditional = getattr(request_handler, "command", "GET") in ("GET", "HEAD")
+        if conditional and etag_matches(request_headers.get("If-None-Match"), etag):
+            request_handler.send_response(304)
+            for name, value in headers.items():
+                request_handler.send_header(name, value)
+            if timings is not None:
+                request_handler.send_header("Server-Timing", timings.header())
+            request_handler.end_headers()
+            return
+
+    body = json.dumps(payload).encode()
+    encoding = None
+    if len(body) >= MIN_COMPRESS_BYTES:
+        encoding = pick_encoding(request_headers.get("Accept-Encoding"))
+        if encoding:
+            body = encode_body(body, encoding)
+
+    request_handler.send_response(status)
+    request_handler.send_header("Content-Type", "application/json")
+    request_handler.send_header("Vary", "Accept-Encoding")
+    if encoding:
+        request_handler.send_header("Content-Encoding", encoding)
+    request_handler.send_header("Content-Length", str(len(body)))
+    for name, value in headers.items():
+        request_handler.send_header(name, value)
+    if timings is not None:
+        request_handler.send_header("Server-Timing", timings.header())
+    request_handler.end_headers()
+    request_handler.wfile.write(body)
+
+
+STREAM_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+
+def parse_stream(raw):
+    """"ndjson" / "sse" from a stream query param or POST field, None otherwise"""
+    if raw is True or raw in ("1", "true"):
+        return "ndjson"
+    return raw if raw in STREAM_FORMATS else None
+
+
+class EventStream:
+    """
+    Response written one event at a time: one JSON line per event (ndjson)
+    or one Server-Sent Event named after the event "type" (sse).
+    """
+
+    def __init__(self, request_handler, fmt: str):
+        self.request_handler = request_handler
+        self.fmt = fmt
+        self._lock = threading.Lock()
+
+    def start(self, headers: dict = None) -> None:
+        request_handler = self.request_handler
+        request_handler.send_response(200)
+        request_handler.send_header("Content-Type", STREAM_FORMATS[self.fmt])
+        request_handler.send_header("Cache-Control", "no-store")
+        # Ask reverse proxies not to buffer the stream
+        request_handler.send_header("X-Accel-Buffering", "no")
+        for name, value in (headers or {}).items():
+            request_handler.send_header(name, value)
+        request_handler.end_headers()
+
+    def send(self, event: dict) -> None:
+        data = json.dumps(event)
+        if self.fmt == "sse":
+            chunk = f"event: {event.get('type', 'message')}\ndata: {data}\n\n"
+        else:
+            chunk = data + "\n"
+        with self._lock:
+            self.request_handler.wfile.write(chunk.encode())
+            self.request_handler.wfile.flush()
@@ -0,0 +1,141 @@
+"""
+Concurrent batch execution gated by a process-wide token bucket.
+
+Every upstream call takes one token. The bucket refills at TRENDS_RATE tokens
+per second up to TRENDS_BURST, so independent batches can run side by side on
+a thread pool while the overall request rate stays within budget. With a
+shared rate state (ratelimit.py) the budget is the machine's, not the
+process'.
+"""
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .backoff import DeadlineExceeded
+from .ratelimit import SharedBucket, get_rate_state
+from .timing import span
+
+DEFAULT_RATE = float(os.environ.get("TRENDS_RATE", "0.5"))
+DEFAULT_BURST = float(os.environ.get("TRENDS_BURST", "2"))
+DEFAULT_WORKERS = int(os.environ.get("TRENDS_WORKERS", "4"))
+
+# Google compares at most 5 keywords in one payload
+MAX_KEYWORDS_PER_PAYLOAD = 5
+
+_bucket = None
+_bucket_lock = threading.Lock()
+
+
+class TokenBucket:
+    """Blocking token bucket: `rate` tokens per second, at most `burst` stored"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = max(rate, 1e-6)
+        self.burst = max(burst, 1.0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, tokens: float = 1.0) -> float:
+        """Seconds until `tokens` are available, without taking them"""
+        with self._lock:
+            self._refill(time.monotonic())
+            return max(0.0, (tokens - self._tokens) / self.rate)
+
+    def acquire(self, tokens: float = 1.0, deadline=None) -> float:
+        """
+        Take tokens, sleeping until they are available. Returns the time waited.
+        Raises DeadlineExceeded instead of waiting past the deadline.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            if deadline is not None and delay > deadline.remaining():
+                raise DeadlineExceeded(f"Rate budget needs {delay:.1f}s")
+            with span("sleep"):
+                time.sleep(delay)
+            waited += delay
+
+
+def get_bucket() -> TokenBucket:
+    """
+    Token bucket shared by every upstream call of the process, or of the
+    machine when the rate state is shared (see ratelimit.py)
+    """
+    global _bucket
+
+    with _bucket_lock:
+        if _bucket is None:
+            state = get_rate_state()
+            if state.shared:
+                _bucket = SharedBucket(state, "direct", DEFAULT_RATE, DEFAULT_BURST)
+            else:
+                _bucket = TokenBucket(DEFAULT_RATE, DEFAULT_BURST)
+        return _bucket
+
+
+def pivot_batches(keywords: list, size: int = MAX_KEYWORDS_PER_PAYLOAD) -> list:
+    """
+    Split keywords into payloads that all start with keywords[0] (the pivot):
+    N keywords take ceil((N-1)/(size-1)) payloads.
+    """
+    if len(keywords) <= size:
+        return [list(keywords)]
+    pivot, others = keywords[0], keywords[1:]
+    step = size - 1
+    return [[pivot] + others[i:i + step] for i in range(0, len(others), step)]
+
+
+def run_batches(fn, items: list, max_workers: int = DEFAULT_WORKERS, stop=None, on_result=None) -> list:
+    """
+    Run fn(item) for every item on a thread pool, results in input order.
+
+    Args:
+        fn: Called once per item
+        items: Independent work items (keyword batches...)
+        max_workers: Thread pool size
+        stop: Optional predicate on a result; when it matches, batches that
+            have not started yet are cancelled and their result is None
+        on_result: Optional on_result(index, result), called from the calling
+            thread as each item finishes (completion order)
+    """
+    if not items:
+        return []
+    if len(items) == 1 or max_workers <= 1:
+        results = []
+        for index, item in enumerate(items):
+            result = fn(item)
+            results.append(result)
+            if on_result:
+                on_result(index, result)
+            if stop and stop(result):
+                results.extend([None] * (len(items) - len(results)))
+                break
+        return results
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        # Each batch runs in a copy of the caller's context (request timings...)
+        futures = [executor.submit(contextvars.copy_context().run, fn, item) for item in items]
+        index_of = {future: index for index, future in enumerate(futures)}
+        for future in as_completed(futures):
+            if future.cancelled():
+                continue
+            result = future.result()
+            if on_result:
+                on_result(index_of[future], result)
+            if stop and stop(result):
+                for pending in futures:
+                    pending.cancel()
+
+    return [None if f.cancelled() else f.result() for f in futures]
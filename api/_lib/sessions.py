@@ -0,0 +1,218 @@
+"""
+Pool of warm Google Trends clients shared by every handler of the process.
+
+pytrends opens a new requests session for each call and fetches a NID cookie
+for every TrendReq. Pooled clients keep one keep-alive session per
+(hl, tz, proxy), refresh the cookie when it gets old and are evicted after a
+429 or repeated failures so the next attempt starts from a clean identity.
+
+TRENDS_CLIENT selects the client: "direct" (default) uses the pandas-free
+TrendsClient from client.py, "pytrends" the TrendReq based fallback. Both
+expose build_payload(), timeseries() and regions() with the same results.
+"""
+import importlib.util
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from .timing import span
+
+DEFAULT_HL = "fr-FR"
+DEFAULT_TZ = 60
+DEFAULT_TIMEOUT = (10, 25)
+
+# NID cookies are refreshed after this many seconds
+COOKIE_TTL = 30 * 60
+# Idle clients kept per key
+MAX_IDLE = 4
+# Consecutive failures before a client is dropped
+MAX_FAILURES = 2
+
+CLIENT_MODE = os.environ.get("TRENDS_CLIENT", "direct").lower()
+
+_JSON_TYPES = ("application/json", "application/javascript", "text/javascript")
+
+_client_class = None
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_client_class():
+    """TrendReq subclass reusing one requests.Session (imports pytrends lazily)"""
+    global _client_class
+
+    if _client_class is not None:
+        return _client_class
+
+    with span("import"):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from pytrends import exceptions
+        from pytrends.request import BASE_TRENDS_URL, TrendReq
+
+    class PooledTrendReq(TrendReq):
+        def __init__(self, hl: str, tz: int, proxy: str = "", timeout=DEFAULT_TIMEOUT):
+            self.session = requests.Session()
+            self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+            if proxy:
+                self.session.proxies.update({"https": proxy, "http": proxy})
+            self.failures = 0
+            super().__init__(hl=hl, tz=tz, timeout=timeout)
+            self.session.headers.update(self.headers)
+            self.cookies_at = time.time()
+
+        def GetGoogleCookie(self):
+            response = self.session.get(
+                f"{BASE_TRENDS_URL}/explore/?geo={self.hl[-2:]}",
+                timeout=self.timeout,
+            )
+            return {k: v for k, v in response.cookies.items() if k == "NID"}
+
+        def refresh_cookies(self) -> None:
+            self.cookies = self.GetGoogleCookie()
+            self.cookies_at = time.time()
+
+        def _get_data(self, url, method=TrendReq.GET_METHOD, trim_chars=0, **kwargs):
+            if method == TrendReq.POST_METHOD:
+                response = self.session.post(url, timeout=self.timeout, cookies=self.cookies, **kwargs)
+            else:
+                response = self.session.get(url, timeout=self.timeout, cookies=self.cookies, **kwargs)
+
+            content_type = response.headers.get("Content-Type", "")
+            if response.status_code == 200 and any(t in content_type for t in _JSON_TYPES):
+                # Some responses start with garbage characters, like ")]}',"
+                return json.loads(response.text[trim_chars:])
+            if response.status_code == 429:
+                raise exceptions.TooManyRequestsError.from_response(response)
+            raise exceptions.ResponseError.from_response(response)
+
+        def build_payload(self, kw_list, cat=0, timeframe="today 5-y", geo="", gprop=""):
+            with span("build_payload"):
+                super().build_payload(kw_list, cat=cat, timeframe=timeframe, geo=geo, gprop=gprop)
+
+        def timeseries(self) -> dict:
+            with span("widget"):
+                df = self.interest_over_time()
+            if df is None or df.empty:
+                return {"dates": [], "values": {kw: [] for kw in self.kw_list}, "partial": []}
+            return {
+                "dates": [ts.to_pydatetime() for ts in df.index],
+                "values": {
+                    kw: [int(v) for v in df[kw]] if kw in df.columns else [0] * len(df.index)
+                    for kw in self.kw_list
+                },
+                "partial": [bool(v) for v in df["isPartial"]] if "isPartial" in df.columns else [False] * len(df.index),
+            }
+
+        def regions(self, resolution: str = "REGION", inc_low_vol: bool = True) -> dict:
+            # pytrends only honours CITY/REGION for the US: force it in the widget
+            if self.interest_by_region_widget:
+                self.interest_by_region_widget["request"]["resolution"] = resolution
+            with span("widget"):
+                df = self.interest_by_region(resolution=resolution, inc_low_vol=inc_low_vol, inc_geo_code=False)
+            if df is None or df.empty:
+                return {"regions": [], "values": {kw: [] for kw in self.kw_list}}
+            return {
+                "regions": [str(idx) for idx in df.index],
+                "values": {
+                    kw: [int(v) for v in df[kw]] if kw in df.columns else [0] * len(df.index)
+                    for kw in self.kw_list
+                },
+            }
+
+        def close(self) -> None:
+            self.session.close()
+
+    _client_class = PooledTrendReq
+    return _client_class
+
+
+def _new_client(hl: str, tz: int, proxy: str):
+    if CLIENT_MODE == "pytrends":
+        return _get_client_class()(hl=hl, tz=tz, proxy=proxy)
+    from .client import TrendsClient
+    return TrendsClient(hl=hl, tz=tz, proxy=proxy)
+
+
+def missing_client_dependency():
+    """Name of the package the configured client needs but cannot import, else None"""
+    required = ["pytrends", "pandas"] if CLIENT_MODE == "pytrends" else ["requests"]
+    for name in required:
+        if importlib.util.find_spec(name) is None:
+            return name
+    return None
+
+
+class SessionPool:
+    """Idle Trends clients keyed by (hl, tz, proxy)"""
+
+    def __init__(self, max_idle: int = MAX_IDLE, cookie_ttl: float = COOKIE_TTL,
+                 max_failures: int = MAX_FAILURES):
+        self.max_idle = max_idle
+        self.cookie_ttl = cookie_ttl
+        self.max_failures = max_failures
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _checkout(self, key: tuple):
+        with self._lock:
+            idle = self._idle.get(key)
+            client = idle.pop() if idle else None
+
+        if client is None:
+            hl, tz, proxy = key
+            return _new_client(hl, tz, proxy)
+
+        if not client.cookies or time.time() - client.cookies_at > self.cookie_ttl:
+            client.refresh_cookies()
+        return client
+
+    def _checkin(self, key: tuple, client) -> None:
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append(client)
+                return
+        client.close()
+
+    @contextmanager
+    def session(self, hl: str = DEFAULT_HL, tz: int = DEFAULT_TZ, proxy: str = "", timeout: tuple = None):
+        """
+        Borrow a client for the duration of the block.
+        A client is never shared between two threads while borrowed.
+        """
+        key = (hl, tz, proxy)
+        with span("session"):
+            client = self._checkout(key)
+        client.timeout = timeout or DEFAULT_TIMEOUT
+        try:
+            yield client
+        except Exception as e:
+            client.failures += 1
+            if "429" in str(e) or client.failures >= self.max_failures:
+                client.close()
+            else:
+                self._checkin(key, client)
+            raise
+        else:
+            client.failures = 0
+            self._checkin(key, client)
+
+    def clear(self) -> None:
+        with self._lock:
+            clients = [c for idle in self._idle.values() for c in idle]
+            self._idle.clear()
+        for client in clients:
+            client.close()
+
+
+def get_pool() -> SessionPool:
+    """Process-wide session pool"""
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = SessionPool()
+        return _pool
@@ -0,0 +1,174 @@
+"""
+Single-flight coalescing of identical upstream requests.
+
+Concurrent calls with the same canonical key (sorted, NFC-normalized
+keywords plus timeframe / geo / resolution) wait for one leader and share its
+result. Threads of a process coordinate through an in-memory table. Worker
+processes on the same machine use an flock()ed file per key: whoever holds
+the lock fetches, and the others reuse the result it writes next to the lock,
+provided it was written after they started waiting.
+
+Followers wait no longer than their request deadline allows: past it they
+run fn() themselves, which with the deadline spent makes no upstream call
+and returns the request's DEADLINE / partial result.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import unicodedata
+
+try:
+    import fcntl
+except ImportError:  # Windows: in-process coalescing only
+    fcntl = None
+
+LOCK_DIR_ENV = "TRENDS_LOCK_DIR"
+DEFAULT_LOCK_DIR = os.path.join(tempfile.gettempdir(), "trends_flights")
+
+# Longest time a follower process waits for the leader before fetching itself
+WAIT_TIMEOUT = 120
+_POLL_INTERVAL = 0.1
+
+_flight = None
+_flight_lock = threading.Lock()
+
+
+def normalize_keywords(keywords: list) -> list:
+    """Strip and NFC-normalize keywords, dropping empty ones"""
+    normalized = [unicodedata.normalize("NFC", kw).strip() for kw in keywords]
+    return [kw for kw in normalized if kw]
+
+
+def flight_key(kind: str, keywords: list, **params) -> str:
+    """Canonical key of a request: keyword order and Unicode form do not matter"""
+    canonical = {
+        "kind": kind,
+        "keywords": sorted(set(normalize_keywords(keywords))),
+        **params,
+    }
+    raw = json.dumps(canonical, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _wait_seconds(deadline):
+    """Longest wait for another caller's result, None for no limit"""
+    if deadline is None or deadline.remaining() == float("inf"):
+        return None
+    return deadline.remaining()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, lock_dir: str = None):
+        self.lock_dir = lock_dir
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn, deadline=None):
+        """
+        Run fn() once for all concurrent callers with the same key.
+        With a deadline, a caller that would wait past it runs fn() itself
+        instead (see the module docstring).
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if not call.done.wait(_wait_seconds(deadline)):
+                return fn()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._do_shared(key, fn, deadline)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _do_shared(self, key: str, fn, deadline=None):
+        if fcntl is None or not self.lock_dir:
+            return fn()
+
+        try:
+            os.makedirs(self.lock_dir, exist_ok=True)
+            lock_file = open(os.path.join(self.lock_dir, f"{key}.lock"), "a+")
+        except OSError as e:
+            print(f"[SingleFlight] Lock dir unavailable: {e}")
+            return fn()
+
+        result_path = os.path.join(self.lock_dir, f"{key}.json")
+        started = time.time()
+        with lock_file:
+            wait = _wait_seconds(deadline)
+            locked = self._wait_for_lock(lock_file, WAIT_TIMEOUT if wait is None else min(WAIT_TIMEOUT, wait))
+            try:
+                shared = self._read_result(result_path, started)
+                if shared is not None:
+                    return shared
+                result = fn()
+                self._write_result(result_path, result)
+                return result
+            finally:
+                if locked:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _wait_for_lock(lock_file, timeout: float = WAIT_TIMEOUT) -> bool:
+        give_up_at = time.monotonic() + timeout
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                if time.monotonic() >= give_up_at:
+                    return False
+                time.sleep(_POLL_INTERVAL)
+
+    @staticmethod
+    def _read_result(path: str, newer_than: float):
+        """Result written by another process since we started waiting, else None"""
+        try:
+            if os.path.getmtime(path) < newer_than:
+                return None
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _write_result(path: str, result) -> None:
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(result, f)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"[SingleFlight] Cannot share result: {e}")
+
+
+def get_flight() -> SingleFlight:
+    """Process-wide single-flight table"""
+    global _flight
+
+    with _flight_lock:
+        if _flight is None:
+            _flight = SingleFlight(os.environ.get(LOCK_DIR_ENV, DEFAULT_LOCK_DIR))
+        return _flight
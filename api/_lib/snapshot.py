@@ -0,0 +1,132 @@
+"""
+Pre-warmed snapshot of handler results.
+
+scripts/prewarm.py fetches the known keyword sets for every period off-peak
+and writes them to one JSON file; the handlers look a request up there
+before anything else, so live traffic for those sets never waits on Google.
+
+The file is replaced atomically. It carries a format number (readers ignore
+other formats) and a version that every write increments, so deployments
+and logs can tell which refresh is being served. Entries are keyed by
+snapshot_key(), which uses the period length rather than the dated
+timeframe so a snapshot taken at night still matches the next day's
+requests; entries older than TRENDS_SNAPSHOT_MAX_AGE are not served.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+
+from .singleflight import flight_key
+
+SNAPSHOT_PATH_ENV = "TRENDS_SNAPSHOT_PATH"
+DEFAULT_SNAPSHOT_PATH = os.path.join(tempfile.gettempdir(), "trends_snapshot.json")
+SNAPSHOT_FORMAT = 1
+MAX_AGE = float(os.environ.get("TRENDS_SNAPSHOT_MAX_AGE", str(36 * 3600)))
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def snapshot_path() -> str:
+    """Configured snapshot file, "" when snapshots are disabled"""
+    return os.environ.get(SNAPSHOT_PATH_ENV, DEFAULT_SNAPSHOT_PATH)
+
+
+def snapshot_key(kind: str, keywords: list, **params) -> str:
+    """Snapshot entry key: the request key without the dated timeframe"""
+    return flight_key(f"snapshot:{kind}", keywords, **params)
+
+
+class Snapshot:
+    """One parsed snapshot file"""
+
+    def __init__(self, path: str, data: dict, mtime: float):
+        self.path = path
+        self.mtime = mtime
+        self.version = data.get("version", 0)
+        self.created_at = data.get("created_at", 0.0)
+        self.entries = data.get("entries", {})
+
+    def get(self, key: str, max_age: float = MAX_AGE):
+        """(result, age in seconds) or None when absent or too old"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        age = time.time() - entry["fetched_at"]
+        if age > max_age:
+            return None
+        return entry["result"], age
+
+
+def load_snapshot(path: str):
+    """Parsed snapshot at path, None when missing, unreadable or of another format"""
+    try:
+        mtime = os.path.getmtime(path)
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get("format") != SNAPSHOT_FORMAT:
+        print(f"[Snapshot] Ignoring {path}: format {data.get('format')}")
+        return None
+    return Snapshot(path, data, mtime)
+
+
+def get_snapshot():
+    """Current snapshot, reloaded when the file changes; None when there is none"""
+    global _snapshot
+
+    path = snapshot_path()
+    if not path:
+        return None
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    with _snapshot_lock:
+        if _snapshot is None or _snapshot.path != path or _snapshot.mtime != mtime:
+            _snapshot = load_snapshot(path)
+        return _snapshot
+
+
+def lookup(key: str):
+    """Snapshot result for key, marked like a stored SWR result; None on a miss"""
+    snapshot = get_snapshot()
+    entry = snapshot.get(key) if snapshot else None
+    if entry is None:
+        return None
+    result, age = entry
+    return {**result, "stale": False, "age": round(age), "snapshot": snapshot.version}
+
+
+def write_snapshot(path: str, entries: dict) -> int:
+    """
+    Atomically replace the snapshot at path.
+
+    Args:
+        entries: {key: {"result": dict, "fetched_at": epoch seconds}}
+
+    Returns the version written (previous version + 1).
+    """
+    previous = load_snapshot(path)
+    version = (previous.version if previous else 0) + 1
+    data = {
+        "format": SNAPSHOT_FORMAT,
+        "version": version,
+        "created_at": time.time(),
+        "entries": entries,
+    }
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".trends_snapshot.", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return version
@@ -0,0 +1,209 @@
+"""
+Persistent per-day store for Google Trends interest values.
+
+Daily values are kept in SQLite per (keyword, geo, pivot, day). A batch is
+always fetched together with its pivot, so every value stored under the same
+(geo, pivot) shares one scale: when new days are written, they are rescaled
+onto the stored pivot series using the days both windows have in common.
+Overlapping timeframes (7 / 30 days...) then only fetch the days that are not
+stored yet.
+"""
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+STORE_PATH_ENV = "TRENDS_STORE_PATH"
+DEFAULT_STORE_PATH = os.path.join(tempfile.gettempdir(), "trends_store.sqlite3")
+
+# Days fetched before the first missing day so new values can be rescaled
+OVERLAP_DAYS = 3
+
+# Partial days (today) are only trusted for this long
+PARTIAL_TTL_SECONDS = int(os.environ.get("TRENDS_PARTIAL_TTL", "3600"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS daily (
+    keyword TEXT NOT NULL,
+    geo TEXT NOT NULL,
+    pivot TEXT NOT NULL,
+    day TEXT NOT NULL,
+    value REAL NOT NULL,
+    partial INTEGER NOT NULL DEFAULT 0,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (keyword, geo, pivot, day)
+)
+"""
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def parse_timeframe(timeframe: str):
+    """Parse a 'YYYY-MM-DD YYYY-MM-DD' timeframe, None for other formats"""
+    try:
+        start_raw, end_raw = timeframe.split(" ")
+        start = datetime.strptime(start_raw, "%Y-%m-%d").date()
+        end = datetime.strptime(end_raw, "%Y-%m-%d").date()
+    except (ValueError, AttributeError):
+        return None
+    if start > end:
+        return None
+    return start, end
+
+
+def timeframe_days(timeframe: str):
+    """Length of a timeframe in days (the timeframe itself when it is not a date range)"""
+    window = parse_timeframe(timeframe)
+    return (window[1] - window[0]).days if window else timeframe
+
+
+def format_timeframe(start: date, end: date) -> str:
+    return f"{start.isoformat()} {end.isoformat()}"
+
+
+def _days(start: date, end: date) -> list:
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+class TrendsStore:
+    """SQLite-backed daily interest values, safe to share between threads"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(_SCHEMA)
+        self._conn.commit()
+
+    def missing_start(self, keywords: list, geo: str, pivot: str, start: date, end: date):
+        """
+        First day of [start, end] not covered for every keyword, None if the
+        whole window is stored. Partial days count only while they are fresh.
+        """
+        fresh_after = time.time() - PARTIAL_TTL_SECONDS
+        placeholders = ",".join("?" for _ in keywords)
+        with self._lock:
+            rows = self._conn.execute(
+                f"""
+                SELECT day, COUNT(*) FROM daily
+                WHERE geo = ? AND pivot = ? AND keyword IN ({placeholders})
+                  AND day BETWEEN ? AND ?
+                  AND (partial = 0 OR fetched_at >= ?)
+                GROUP BY day
+                """,
+                [geo, pivot, *keywords, start.isoformat(), end.isoformat(), fresh_after],
+            ).fetchall()
+
+        covered = {day for day, count in rows if count == len(set(keywords))}
+        for day in _days(start, end):
+            if day.isoformat() not in covered:
+                return day
+        return None
+
+    def read(self, keywords: list, geo: str, pivot: str, start: date, end: date) -> dict:
+        """Stored values in [start, end]: {keyword: {day: value}}"""
+        placeholders = ",".join("?" for _ in keywords)
+        with self._lock:
+            rows = self._conn.execute(
+                f"""
+                SELECT keyword, day, value FROM daily
+                WHERE geo = ? AND pivot = ? AND keyword IN ({placeholders})
+                  AND day BETWEEN ? AND ?
+                ORDER BY day
+                """,
+                [geo, pivot, *keywords, start.isoformat(), end.isoformat()],
+            ).fetchall()
+
+        series = {kw: {} for kw in keywords}
+        for kw, day, value in rows:
+            series[kw][day] = value
+        return series
+
+    def export(self) -> dict:
+        """Every complete (non-partial) day: {(geo, pivot): {keyword: {day: value}}}"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT geo, pivot, keyword, day, value FROM daily WHERE partial = 0 ORDER BY day"
+            ).fetchall()
+
+        groups = {}
+        for geo, pivot, kw, day, value in rows:
+            groups.setdefault((geo, pivot), {}).setdefault(kw, {})[day] = value
+        return groups
+
+    def write(self, geo: str, pivot: str, rows: list) -> None:
+        """
+        Store a freshly fetched batch.
+
+        Args:
+            geo: Geographic code of the request
+            pivot: Keyword every value of the batch is relative to
+            rows: [(day, {keyword: value}, is_partial), ...] sorted by day
+        """
+        if not rows:
+            return
+
+        days = [day.isoformat() for day, _, _ in rows]
+        with self._lock:
+            stored_pivot = dict(self._conn.execute(
+                """
+                SELECT day, value FROM daily
+                WHERE keyword = ? AND geo = ? AND pivot = ? AND partial = 0
+                  AND day BETWEEN ? AND ?
+                """,
+                (pivot, geo, pivot, days[0], days[-1]),
+            ).fetchall())
+
+            # Rescale onto the stored pivot series (complete days only)
+            stored_sum = 0.0
+            new_sum = 0.0
+            for (day, values, is_partial), key in zip(rows, days):
+                if not is_partial and key in stored_pivot and pivot in values:
+                    stored_sum += stored_pivot[key]
+                    new_sum += values[pivot]
+
+            factor = 1.0
+            if stored_sum > 0 and new_sum > 0:
+                factor = stored_sum / new_sum
+            elif not stored_pivot:
+                # No overlap: values on other days use another scale, drop them
+                self._conn.execute(
+                    "DELETE FROM daily WHERE geo = ? AND pivot = ?", (geo, pivot)
+                )
+
+            now = time.time()
+            self._conn.executemany(
+                """
+                INSERT OR REPLACE INTO daily
+                    (keyword, geo, pivot, day, value, partial, fetched_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (kw, geo, pivot, key, float(value) * factor, int(is_partial), now)
+                    for (day, values, is_partial), key in zip(rows, days)
+                    for kw, value in values.items()
+                ],
+            )
+            self._conn.commit()
+
+
+def get_store():
+    """Shared store for this instance, None when disabled or unavailable"""
+    global _store
+
+    path = os.environ.get(STORE_PATH_ENV, DEFAULT_STORE_PATH)
+    if not path:
+        return None
+
+    with _store_lock:
+        if _store is None or _store.path != path:
+            try:
+                _store = TrendsStore(path)
+            except sqlite3.Error as e:
+                print(f"[TrendsStore] Cannot open {path}: {e}")
+                return None
+        return _store
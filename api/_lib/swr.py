@@ -0,0 +1,146 @@
+"""
+Stale-while-revalidate serving of handler results.
+
+The last good result of every request key is kept in SQLite (next to the
+daily store). Younger than the soft TTL it is served as is; between the soft
+and the hard TTL it is served immediately, marked stale with its age, while a
+background thread refreshes it; past the hard TTL the request blocks on a
+normal fetch. While every egress' circuit breaker is open (ratelimit.py)
+the stored result is served whatever its age: fetching could only answer
+RATE_LIMITED.
+
+On serverless platforms the background refresh only runs while the instance
+is kept warm; the long-lived server keeps it running to completion.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from .proxies import get_egress_pool
+from .store import DEFAULT_STORE_PATH, STORE_PATH_ENV
+
+SWR_ENABLED = os.environ.get("TRENDS_SWR", "1") != "0"
+SOFT_TTL = float(os.environ.get("TRENDS_SOFT_TTL", "900"))
+HARD_TTL = float(os.environ.get("TRENDS_HARD_TTL", "86400"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+
+_results = None
+_results_lock = threading.Lock()
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+class ResultStore:
+    """Last good result per request key"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(_SCHEMA)
+        self._conn.commit()
+
+    def get(self, key: str):
+        """(result, age in seconds) or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, updated_at FROM results WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), time.time() - row[1]
+
+    def put(self, key: str, result: dict) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, payload, updated_at) VALUES (?, ?, ?)",
+                (key, json.dumps(result), time.time()),
+            )
+            self._conn.commit()
+
+
+def get_results():
+    """Shared result store, None when the store path is disabled or unusable"""
+    global _results
+
+    path = os.environ.get(STORE_PATH_ENV, DEFAULT_STORE_PATH)
+    if not path:
+        return None
+
+    with _results_lock:
+        if _results is None or _results.path != path:
+            try:
+                _results = ResultStore(path)
+            except sqlite3.Error as e:
+                print(f"[SWR] Cannot open {path}: {e}")
+                return None
+        return _results
+
+
+def _refresh(results: ResultStore, key: str, fetch, is_good) -> None:
+    try:
+        result = fetch()
+        if is_good(result):
+            results.put(key, result)
+    except Exception as e:
+        print(f"[SWR] Background refresh failed: {e}")
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(key)
+
+
+def _refresh_in_background(results: ResultStore, key: str, fetch, is_good) -> None:
+    with _refreshing_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+    threading.Thread(target=_refresh, args=(results, key, fetch, is_good), daemon=True).start()
+
+
+def serve(key: str, fetch, is_good, refresh=None) -> dict:
+    """
+    Result for key, from the stored copy when it is recent enough.
+
+    Args:
+        key: Canonical request key
+        fetch: Blocking upstream fetch, returns a result dict
+        is_good: Whether a fetched result may replace the stored one
+        refresh: Fetch used for background refreshes (defaults to fetch)
+    """
+    results = get_results() if SWR_ENABLED else None
+    if results is None:
+        return fetch()
+
+    try:
+        entry = results.get(key)
+    except (sqlite3.Error, ValueError) as e:
+        print(f"[SWR] Lookup failed: {e}")
+        entry = None
+
+    if entry is not None:
+        stored, age = entry
+        if age < SOFT_TTL:
+            return {**stored, "stale": False, "age": round(age)}
+        if age < HARD_TTL:
+            _refresh_in_background(results, key, refresh or fetch, is_good)
+            return {**stored, "stale": True, "age": round(age)}
+        if get_egress_pool().circuit_open():
+            return {**stored, "stale": True, "age": round(age)}
+
+    result = fetch()
+    if is_good(result):
+        try:
+            results.put(key, result)
+        except sqlite3.Error as e:
+            print(f"[SWR] Cannot store result: {e}")
+    return {**result, "stale": False, "age": 0}
@@ -0,0 +1,113 @@
+"""
+Per-request timing spans and sampled logging.
+
+A handler opens a request with start_request(); code anywhere below it wraps
+its phases in span("build_payload") etc. Durations are summed per phase name
+(batches running on several threads add up, so phases can exceed the total)
+and sent back as a Server-Timing header, or as a "timings" field on demand.
+
+The request lives in a context variable: run_batches() copies the context
+into its worker threads, background refreshes run without one and record
+nothing.
+
+Verbose logs go through log(), printed only for a sampled share of requests
+(TRENDS_LOG_SAMPLE, 0-1). Errors keep using print().
+"""
+import contextvars
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+LOG_SAMPLE = float(os.environ.get("TRENDS_LOG_SAMPLE", "0.1"))
+
+_current = contextvars.ContextVar("trends_request", default=None)
+
+# Module import time of the process, reported once on its first request
+_import_seconds = 0.0
+_import_reported = False
+_import_lock = threading.Lock()
+
+
+class Timings:
+    """Summed duration and count per phase of one request"""
+
+    def __init__(self, sampled: bool = False):
+        self.started = time.perf_counter()
+        self.sampled = sampled
+        self.phases = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float) -> None:
+        with self._lock:
+            total, count = self.phases.get(name, (0.0, 0))
+            self.phases[name] = (total + seconds, count + 1)
+
+    def total(self) -> float:
+        return time.perf_counter() - self.started
+
+    def as_dict(self) -> dict:
+        """{phase: {"ms", "count"}} plus the request total"""
+        with self._lock:
+            timings = {
+                name: {"ms": round(total * 1000, 1), "count": count}
+                for name, (total, count) in self.phases.items()
+            }
+        timings["total"] = {"ms": round(self.total() * 1000, 1), "count": 1}
+        return timings
+
+    def header(self) -> str:
+        """Server-Timing header value"""
+        return ", ".join(
+            f"{name};dur={entry['ms']}" if entry["count"] == 1
+            else f'{name};dur={entry["ms"]};desc="x{entry["count"]}"'
+            for name, entry in self.as_dict().items()
+        )
+
+
+def record_import(seconds: float) -> None:
+    """Import time of a handler module, added to the process' first request"""
+    global _import_seconds
+    with _import_lock:
+        _import_seconds += seconds
+
+
+def start_request() -> Timings:
+    """Open the timings of the current request (in this thread's context)"""
+    global _import_reported
+
+    timings = Timings(sampled=random.random() < LOG_SAMPLE)
+    with _import_lock:
+        if not _import_reported and _import_seconds:
+            timings.add("import", _import_seconds)
+            _import_reported = True
+    _current.set(timings)
+    return timings
+
+
+def current():
+    """Timings of the current request, None outside of one"""
+    return _current.get()
+
+
+@contextmanager
+def span(name: str):
+    """Add the duration of the block to the current request under `name`"""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - started)
+
+
+def log(message: str) -> None:
+    """Verbose log line, printed only for sampled requests"""
+    timings = _current.get()
+    sampled = timings.sampled if timings is not None else random.random() < LOG_SAMPLE
+    if sampled:
+        print(message)
@@ -1,248 +1,934 @@
-from http.server import BaseHTTPRequestHandler
-import json
-import time
-import random
-from urllib.parse import parse_qs, urlparse
-from datetime import datetime, timedelta
-
-# Cache en mémoire pour cette instance (fallback)
-_memory_cache = {}
-_last_request_time = None
-
-def get_timeframe(days: int) -> str:
-    """Convert days to Google Trends timeframe format"""
-    end = datetime.now()
-    start = end - timedelta(days=days)
-    return f"{start.strftime('%Y-%m-%d')} {end.strftime('%Y-%m-%d')}"
-
-def fetch_trends_batch(keywords: list, timeframe: str) -> dict:
-    """Fetch trends for a batch of up to 5 keywords"""
-    try:
-        from pytrends.request import TrendReq
-    except ImportError:
-        return {"error": "pytrends not installed", "scores": {}}
-
-    scores = {}
-    max_retries = 3
-
-    for attempt in range(max_retries):
-        try:
-            # Random delay to avoid rate limiting
-            time.sleep(2 + random.uniform(0, 2))
-
-            pytrends = TrendReq(hl="fr-FR", tz=60, timeout=(10, 25))
-            pytrends.build_payload(keywords, timeframe=timeframe, geo="FR")
-
-            time.sleep(1 + random.uniform(0, 1))
-            df = pytrends.interest_over_time()
-
-            if df is not None and not df.empty:
-                if "isPartial" in df.columns:
-                    df = df.drop(columns=["isPartial"])
-
-                for kw in keywords:
-                    if kw in df.columns:
-                        scores[kw] = round(float(df[kw].mean()), 1)
-                    else:
-                        scores[kw] = 0.0
-                return {"scores": scores, "error": None}
-            else:
-                if attempt < max_retries - 1:
-                    time.sleep(5 * (attempt + 1))
-
-        except Exception as e:
-            err_str = str(e)
-            if "429" in err_str:
-                if attempt < max_retries - 1:
-                    time.sleep(10 * (attempt + 1) + random.uniform(0, 5))
-                else:
-                    return {"error": "RATE_LIMITED", "scores": {}}
-            else:
-                if attempt == max_retries - 1:
-                    return {"error": err_str[:100], "scores": {}}
-                time.sleep(3)
-
-    return {"scores": scores, "error": None}
-
-def fetch_trends_with_pivot(keywords: list, timeframe: str) -> dict:
-    """
-    Fetch trends for multiple keywords using pivot normalization.
-    Google Trends only allows 5 keywords per request.
-    We use the first keyword as a pivot to normalize across batches.
-    """
-    global _last_request_time
-
-    if not keywords:
-        return {"scores": {}, "error": "No keywords provided"}
-
-    # Rate limit check (minimum 30 seconds between full requests)
-    if _last_request_time:
-        elapsed = time.time() - _last_request_time
-        if elapsed < 30:
-            # Return cached data if available
-            cached_scores = {}
-            for kw in keywords:
-                if kw in _memory_cache:
-                    cached_scores[kw] = _memory_cache[kw]
-            if cached_scores:
-                return {"scores": cached_scores, "error": None, "from_cache": True}
-
-    _last_request_time = time.time()
-
-    all_scores = {}
-    errors = []
-
-    # If 5 or fewer keywords, single request
-    if len(keywords) <= 5:
-        result = fetch_trends_batch(keywords, timeframe)
-        if result.get("error") == "RATE_LIMITED":
-            return {"scores": _get_fallback_scores(keywords), "error": "RATE_LIMITED"}
-        if result.get("error"):
-            errors.append(result["error"])
-        all_scores.update(result.get("scores", {}))
-    else:
-        # Use pivot strategy for more than 5 keywords
-        pivot = keywords[0]
-        pivot_score = None
-        batch_size = 4  # 4 + pivot = 5
-
-        for i in range(0, len(keywords), batch_size):
-            batch = keywords[i:i + batch_size]
-
-            # Always include pivot in batch (except first batch where it's already there)
-            if pivot not in batch:
-                batch = [pivot] + batch
-
-            result = fetch_trends_batch(batch, timeframe)
-
-            if result.get("error") == "RATE_LIMITED":
-                # Use fallback for remaining keywords
-                for kw in keywords:
-                    if kw not in all_scores:
-                        all_scores[kw] = _memory_cache.get(kw, 0)
-                return {"scores": all_scores, "error": "RATE_LIMITED"}
-
-            if result.get("error"):
-                errors.append(result["error"])
-                continue
-
-            batch_scores = result.get("scores", {})
-
-            # Set pivot score from first successful batch
-            if pivot_score is None and pivot in batch_scores:
-                pivot_score = batch_scores[pivot]
-
-            # Normalize scores relative to pivot
-            for kw in batch:
-                if kw in batch_scores:
-                    raw_score = batch_scores[kw]
-                    if pivot_score and pivot_score > 0 and pivot in batch_scores:
-                        current_pivot = batch_scores[pivot]
-                        if current_pivot > 0:
-                            normalized = (raw_score / current_pivot) * pivot_score
-                            all_scores[kw] = round(normalized, 1)
-                        else:
-                            all_scores[kw] = round(raw_score, 1)
-                    else:
-                        all_scores[kw] = round(raw_score, 1)
-
-    # Store in memory cache for fallback
-    for kw, score in all_scores.items():
-        if score > 0:
-            _memory_cache[kw] = score
-
-    # Fill missing keywords with 0
-    for kw in keywords:
-        if kw not in all_scores:
-            all_scores[kw] = _memory_cache.get(kw, 0)
-
-    # Normalize to 0-100 scale (max = 100)
-    if all_scores:
-        max_score = max(all_scores.values())
-        if max_score > 0:
-            all_scores = {kw: round((score / max_score) * 100, 1) for kw, score in all_scores.items()}
-
-    return {
-        "scores": all_scores,
-        "error": errors[0] if errors else None,
-        "from_cache": False
-    }
-
-def _get_fallback_scores(keywords: list) -> dict:
-    """Get fallback scores from memory cache"""
-    return {kw: _memory_cache.get(kw, 0) for kw in keywords}
-
-class handler(BaseHTTPRequestHandler):
-    def do_GET(self):
-        try:
-            # Parse query parameters
-            parsed = urlparse(self.path)
-            params = parse_qs(parsed.query)
-
-            keywords_raw = params.get("keywords", [""])[0]
-            days = int(params.get("days", ["7"])[0])
-
-            if not keywords_raw:
-                self.send_response(400)
-                self.send_header("Content-Type", "application/json")
-                self.end_headers()
-                self.wfile.write(json.dumps({"error": "Missing keywords parameter"}).encode())
-                return
-
-            # Parse keywords (comma-separated)
-            keywords = [k.strip() for k in keywords_raw.split(",") if k.strip()]
-
-            if not keywords:
-                self.send_response(400)
-                self.send_header("Content-Type", "application/json")
-                self.end_headers()
-                self.wfile.write(json.dumps({"error": "No valid keywords"}).encode())
-                return
-
-            # Get timeframe
-            timeframe = get_timeframe(days)
-
-            # Fetch trends
-            result = fetch_trends_with_pivot(keywords, timeframe)
-
-            self.send_response(200)
-            self.send_header("Content-Type", "application/json")
-            self.send_header("Cache-Control", "s-maxage=3600")  # Cache 1h at edge
-            self.end_headers()
-            self.wfile.write(json.dumps(result).encode())
-
-        except Exception as e:
-            self.send_response(500)
-            self.send_header("Content-Type", "application/json")
-            self.end_headers()
-            self.wfile.write(json.dumps({"error": str(e)}).encode())
-
-    def do_POST(self):
-        try:
-            content_length = int(self.headers.get("Content-Length", 0))
-            body = self.rfile.read(content_length)
-            data = json.loads(body) if body else {}
-
-            keywords = data.get("keywords", [])
-            days = data.get("days", 7)
-
-            if not keywords:
-                self.send_response(400)
-                self.send_header("Content-Type", "application/json")
-                self.end_headers()
-                self.wfile.write(json.dumps({"error": "Missing keywords"}).encode())
-                return
-
-            timeframe = get_timeframe(days)
-            result = fetch_trends_with_pivot(keywords, timeframe)
-
-            self.send_response(200)
-            self.send_header("Content-Type", "application/json")
-            self.end_headers()
-            self.wfile.write(json.dumps(result).encode())
-
-        except Exception as e:
-            self.send_response(500)
-            self.send_header("Content-Type", "application/json")
-            self.end_headers()
-            self.wfile.write(json.dumps({"error": str(e)}).encode())
+from http.server import BaseHTTPRequestHandler
+import json
+import os
+import sys
+import time
+from urllib.parse import parse_qs, urlparse
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# Shared helpers live in api/_lib (appended so the pytrends package still wins)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+_import_started = time.perf_counter()
+from _lib.attempts import attempt_with_retries
+from _lib.backoff import Deadline
+from _lib.cache import MemoryCache
+from _lib.downsample import lttb_indices
+from _lib.geo import chain_comparative, comparative_regions
+from _lib.history import seed_store
+from _lib.ratios import get_graph
+from _lib.proxies import get_egress_pool
+from _lib.ratelimit import get_rate_state
+from _lib.responses import EventStream, parse_stream, send_json
+from _lib.scheduler import pivot_batches, run_batches
+from _lib.sessions import missing_client_dependency
+from _lib.singleflight import flight_key, get_flight, normalize_keywords
+from _lib.snapshot import lookup, snapshot_key
+from _lib.swr import serve
+from _lib.store import OVERLAP_DAYS, format_timeframe, get_store, parse_timeframe, timeframe_days
+from _lib.timing import record_import, span, start_request
+record_import(time.perf_counter() - _import_started)
+
+# Cache en mémoire pour cette instance (fallback)
+_memory_cache = MemoryCache()
+
+# Time series are always fetched for France
+GEO = "FR"
+
+# Interest by region pulled by the combined mode when none is requested
+COMBINED_RESOLUTIONS = ["REGION", "CITY"]
+
+# Periods (days) served by the multi-period mode when none are requested
+DEFAULT_PERIODS = [7, 14, 30]
+# Longest window Google still returns day by day
+MAX_DAILY_DAYS = 90
+
+# Points per keyword returned by the series mode, by default and at most
+DEFAULT_SERIES_POINTS = 200
+MAX_SERIES_POINTS = 2000
+
+def get_timeframe(days: int) -> str:
+    """Convert days to Google Trends timeframe format"""
+    end = datetime.now()
+    start = end - timedelta(days=days)
+    return f"{start.strftime('%Y-%m-%d')} {end.strftime('%Y-%m-%d')}"
+
+def _store_means(series: dict) -> dict:
+    """Mean daily value per keyword from stored {keyword: {day: value}}"""
+    return {
+        kw: round(sum(days.values()) / len(days), 1) if days else 0.0
+        for kw, days in series.items()
+    }
+
+def _series_means(series: dict, keywords: list) -> dict:
+    """Mean value per keyword of a fetched series"""
+    scores = {}
+    for kw in keywords:
+        values = series["values"].get(kw, [])
+        scores[kw] = round(sum(values) / len(values), 1) if values else 0.0
+    return scores
+
+def _is_daily(series: dict) -> bool:
+    """Short windows come back hourly: the store only keeps days"""
+    dates = series["dates"]
+    return len({d.date() for d in dates}) == len(dates)
+
+def _daily_series(series: dict, keywords: list) -> dict:
+    """Fetched daily series as {keyword: {iso day: value}} (the store's shape)"""
+    days = [d.date().isoformat() for d in series["dates"]]
+    return {kw: dict(zip(days, series["values"].get(kw, []))) for kw in keywords}
+
+def _hourly_series(series: dict, keywords: list) -> dict:
+    """Fetched sub-daily series as {keyword: {iso datetime: value}}"""
+    times = [d.isoformat() for d in series["dates"]]
+    return {kw: dict(zip(times, series["values"].get(kw, []))) for kw in keywords}
+
+def _store_series(store, keywords: list, window: tuple, series: dict) -> dict:
+    """Write a daily series (pivot = keywords[0]) and read back the stored window"""
+    pivot = keywords[0]
+    rows = [
+        (
+            d.date(),
+            {kw: float(series["values"][kw][i]) for kw in keywords},
+            series["partial"][i],
+        )
+        for i, d in enumerate(series["dates"])
+    ]
+    store.write(GEO, pivot, rows)
+    return store.read(keywords, GEO, pivot, *window)
+
+def fetch_trends_batch(keywords: list, timeframe: str, deadline: Deadline = None) -> dict:
+    """
+    Fetch trends for a batch of up to 5 keywords.
+    Days already in the store are not fetched again: only the uncovered
+    range (plus a few overlap days used for rescaling) goes upstream.
+    Gives up with error "DEADLINE" when the deadline leaves no time to retry.
+    Daily data is also returned as "series": {keyword: {iso day: value}},
+    shorter windows as "hourly": {keyword: {iso datetime: value}}.
+    """
+    # The first keyword is the pivot every value of the batch is relative to
+    pivot = keywords[0]
+    window = parse_timeframe(timeframe)
+    store = get_store() if window else None
+    fetch_timeframe = timeframe
+
+    if store:
+        start, end = window
+        try:
+            missing = store.missing_start(keywords, GEO, pivot, start, end)
+            # A cold store takes the days it lacks from the mapped history first
+            if missing is not None and seed_store(store, keywords, GEO, pivot, missing, end):
+                missing = store.missing_start(keywords, GEO, pivot, start, end)
+            if missing is None:
+                series = store.read(keywords, GEO, pivot, start, end)
+                return {"scores": _store_means(series), "series": series, "error": None, "from_store": True}
+            if missing > start:
+                fetch_start = max(start, missing - timedelta(days=OVERLAP_DAYS))
+                fetch_timeframe = format_timeframe(fetch_start, end)
+        except Exception as e:
+            print(f"[PyTrends] Store lookup failed: {e}")
+            store = None
+
+    missing_dependency = missing_client_dependency()
+    if missing_dependency:
+        return {"error": f"{missing_dependency} not installed", "scores": {}}
+
+    deadline = deadline or Deadline()
+
+    def fetch(client, egress):
+        client.build_payload(keywords, timeframe=fetch_timeframe, geo=GEO)
+
+        egress.acquire(deadline=deadline)
+        series = client.timeseries()
+        return series if series["dates"] else None
+
+    while True:
+        series, error = attempt_with_retries(fetch, deadline)
+        if error:
+            return {"error": error[:100], "scores": {}}
+        if series is None:
+            return {"scores": {}, "error": None}
+
+        # A partial window that did not come back day by day is fetched again in full
+        daily = _is_daily(series)
+        if not daily and fetch_timeframe != timeframe:
+            store = None
+            fetch_timeframe = timeframe
+            continue
+
+        if store and daily:
+            try:
+                stored = _store_series(store, keywords, window, series)
+                return {"scores": _store_means(stored), "series": stored, "error": None}
+            except Exception as e:
+                print(f"[PyTrends] Store update failed: {e}")
+                if fetch_timeframe != timeframe:
+                    # Only part of the window was fetched, retry in full
+                    store = None
+                    fetch_timeframe = timeframe
+                    continue
+
+        result = {"scores": _series_means(series, keywords), "error": None}
+        if daily:
+            result["series"] = _daily_series(series, keywords)
+        else:
+            result["hourly"] = _hourly_series(series, keywords)
+        return result
+
+def _rescale_to_pivot(batch: list, batch_scores: dict, pivot: str, pivot_score: float) -> dict:
+    """Batch scores expressed on the scale of the pivot's reference score"""
+    current_pivot = batch_scores.get(pivot)
+    rescaled = {}
+    with span("normalize"):
+        for kw in batch:
+            if kw in batch_scores:
+                raw_score = batch_scores[kw]
+                if pivot_score and pivot_score > 0 and current_pivot and current_pivot > 0:
+                    rescaled[kw] = round((raw_score / current_pivot) * pivot_score, 1)
+                else:
+                    rescaled[kw] = round(raw_score, 1)
+    return rescaled
+
+def _scale_to_100(scores: dict) -> dict:
+    """Highest score becomes 100"""
+    if scores:
+        max_score = max(scores.values())
+        if max_score > 0:
+            with span("normalize"):
+                return {kw: round((score / max_score) * 100, 1) for kw, score in scores.items()}
+    return scores
+
+def _fallback_key(timeframe: str, keywords: list, kw: str, geo: str = GEO) -> tuple:
+    """
+    Memory cache key of a pivot-scale score: its period, geo and the
+    payload whose pivot set the scale (the first pivot batch).
+    """
+    basis = tuple(sorted(pivot_batches(keywords)[0]))
+    return ("scores", geo, timeframe_days(timeframe), basis, kw)
+
+def _cache_scores(timeframe: str, keywords: list, scores: dict, geo: str = GEO) -> None:
+    """Store pivot-scale scores in memory cache for fallback"""
+    for kw, score in scores.items():
+        if score > 0:
+            _memory_cache.set(_fallback_key(timeframe, keywords, kw, geo), score)
+
+def fetch_trends_with_pivot(keywords: list, timeframe: str, deadline: Deadline = None, on_batch=None) -> dict:
+    """
+    Fetch trends for multiple keywords using pivot normalization.
+    Google Trends only allows 5 keywords per request.
+    We use the first keyword as a pivot to normalize across batches.
+    Batches cut off by the deadline are reported in "missing" (with
+    "partial": True) and filled from the memory cache.
+    With several batches, on_batch(event) receives a "batch" event as each
+    one completes, with provisional 0-100 scores of the batches done so far.
+
+    With the ratio graph (_lib/ratios.py), every batch's pairwise ratios are
+    persisted and only the batches linking new or stale keywords to the
+    fresh ratios are fetched; scores are the graph's least-squares solution.
+    Those batches group keywords of similar magnitude around a bridge of
+    the same volume rather than keywords[0], and keywords rounded to a few
+    units (or to 0) next to a larger one are re-measured under a closer one.
+    """
+    if not keywords:
+        return {"scores": {}, "error": "No keywords provided"}
+
+    # Rate limit check (minimum 30 seconds between full requests, on any instance)
+    rate_state = get_rate_state()
+    if rate_state.last_request("trends"):
+        elapsed = time.time() - rate_state.last_request("trends")
+        if elapsed < 30:
+            # Return cached data if available
+            cached_scores = {}
+            for kw in keywords:
+                score = _memory_cache.get(_fallback_key(timeframe, keywords, kw))
+                if score is not None:
+                    cached_scores[kw] = score
+            if cached_scores:
+                return {"scores": cached_scores, "error": None, "from_cache": True}
+
+    rate_state.mark_request("trends")
+
+    all_scores = {}
+    errors = []
+    missing = []
+    # Index of the batch whose pivot set the scale of all_scores
+    scale_batch = None
+
+    graph = get_graph()
+    period = timeframe_days(timeframe)
+
+    # If 5 or fewer keywords, single request
+    if graph is None and len(keywords) <= 5:
+        result = fetch_trends_batch(keywords, timeframe, deadline)
+        if result.get("error") == "RATE_LIMITED":
+            return {"scores": _get_fallback_scores(keywords, timeframe), "error": "RATE_LIMITED"}
+        if result.get("error") == "DEADLINE":
+            missing.extend(keywords)
+        elif result.get("error"):
+            errors.append(result["error"])
+        else:
+            scale_batch = 0
+        all_scores.update(result.get("scores", {}))
+    else:
+        # Use pivot strategy for more than 5 keywords: pivot + 4 per batch,
+        # or only the batches the ratio graph still needs (none when all are linked)
+        pivot = keywords[0]
+        pivot_score = None
+        batches = graph.plan(keywords, GEO, period) if graph else pivot_batches(keywords)
+        recorded = set()
+
+        provisional = {}
+        provisional_pivot = {}
+
+        def report(index: int, result: dict) -> None:
+            # Completion order: rescale onto the first pivot seen, the final
+            # scaling to 100 makes it equivalent to the ordered chaining below
+            batch = batches[index]
+            batch_scores = result.get("scores") or {}
+            if batch_scores and not result.get("error"):
+                if graph:
+                    graph.record(GEO, period, batch_scores)
+                    recorded.add(index)
+                    provisional.clear()
+                    provisional.update(graph.solve(keywords, GEO, period))
+                else:
+                    if not provisional_pivot and pivot in batch_scores:
+                        provisional_pivot["score"] = batch_scores[pivot]
+                    provisional.update(_rescale_to_pivot(batch, batch_scores, pivot, provisional_pivot.get("score")))
+            provisional_pivot["done"] = provisional_pivot.get("done", 0) + 1
+            on_batch({
+                "type": "batch",
+                "index": index,
+                "keywords": batch,
+                "error": result.get("error"),
+                "scores": _scale_to_100(dict(provisional)),
+                "done": provisional_pivot["done"],
+                "total": len(batches),
+            })
+
+        # Batches are independent: run them concurrently, then chain in order
+        results = run_batches(
+            lambda batch: fetch_trends_batch(batch, timeframe, deadline),
+            batches,
+            stop=lambda result: result.get("error") == "RATE_LIMITED",
+            on_result=report if on_batch else None,
+        )
+
+        for index, (batch, result) in enumerate(zip(batches, results)):
+            if graph and result and not result.get("error") and result.get("scores") and index not in recorded:
+                graph.record(GEO, period, result["scores"])
+
+            if (result is None or result.get("error") == "RATE_LIMITED") and graph:
+                # Older ratios stand in for the batches that could not be fetched
+                for later in results[index + 1:]:
+                    if later and not later.get("error") and later.get("scores"):
+                        graph.record(GEO, period, later["scores"])
+                solved = graph.solve(keywords, GEO, period, max_age=None)
+                return {"scores": _scale_to_100({kw: solved.get(kw, 0) for kw in keywords}), "error": "RATE_LIMITED"}
+
+            if result is None or result.get("error") == "RATE_LIMITED":
+                # Use fallback for remaining keywords
+                for kw in keywords:
+                    if kw not in all_scores:
+                        all_scores[kw] = _memory_cache.get(_fallback_key(timeframe, keywords, kw), 0)
+                return {"scores": all_scores, "error": "RATE_LIMITED"}
+
+            if result.get("error") == "DEADLINE":
+                missing.extend(kw for kw in batch if kw not in missing)
+                continue
+
+            if result.get("error"):
+                errors.append(result["error"])
+                continue
+
+            batch_scores = result.get("scores", {})
+
+            # Set pivot score from first successful batch
+            if pivot_score is None and pivot in batch_scores:
+                pivot_score = batch_scores[pivot]
+                scale_batch = index
+
+            # Normalize scores relative to pivot
+            all_scores.update(_rescale_to_pivot(batch, batch_scores, pivot, pivot_score))
+
+        if graph:
+            with span("normalize"):
+                solved = graph.solve(keywords, GEO, period)
+                # Keywords not linked by fresh ratios (cut off batches) take older ones
+                missing = [kw for kw in keywords if kw not in solved]
+                if missing:
+                    solved = graph.solve(keywords, GEO, period, max_age=None)
+            # Relative scores: the memory cache keeps pivot-scale ones only,
+            # keywords no ratio links at all score 0 and stay in "missing"
+            all_scores = {kw: solved.get(kw, 0) for kw in keywords}
+            scale_batch = None
+
+    # Keywords only present in batches cut off by the deadline
+    if graph is None:
+        missing = [kw for kw in missing if kw not in all_scores]
+
+    # Store in memory cache for fallback, unless the scale came from another batch
+    if scale_batch == 0:
+        _cache_scores(timeframe, keywords, all_scores)
+
+    # Fill missing keywords from the pivot-scale cache, else with 0 (graph scores have them all)
+    for kw in keywords:
+        if kw not in all_scores:
+            all_scores[kw] = _memory_cache.get(_fallback_key(timeframe, keywords, kw), 0)
+
+    # Normalize to 0-100 scale (max = 100)
+    all_scores = _scale_to_100(all_scores)
+
+    result = {
+        "scores": all_scores,
+        "error": errors[0] if errors else None,
+        "from_cache": False
+    }
+    # Deadline reached: return what was fetched instead of nothing
+    if missing:
+        result["partial"] = True
+        result["missing"] = missing
+    return result
+
+def _get_fallback_scores(keywords: list, timeframe: str) -> dict:
+    """Get fallback scores from memory cache"""
+    return {kw: _memory_cache.get(_fallback_key(timeframe, keywords, kw), 0) for kw in keywords}
+
+def _is_good_result(result: dict) -> bool:
+    return (
+        not result.get("error")
+        and not result.get("from_cache")
+        and not result.get("partial")
+        and bool(result.get("scores"))
+    )
+
+def fetch_trends_shared(keywords: list, timeframe: str, deadline: Deadline = None, on_batch=None) -> dict:
+    """
+    fetch_trends_with_pivot, coalesced with identical requests in flight
+    in this process or in other workers of the machine. The last good
+    result is served right away (marked stale past the soft TTL) while it
+    is refreshed in the background, without the request deadline.
+    Batch events only reach on_batch when this request does the fetch.
+    Sets pre-warmed by scripts/prewarm.py are served from the snapshot first.
+    """
+    snapshot = lookup(snapshot_key("trends", keywords, days=timeframe_days(timeframe), geo=GEO))
+    if snapshot is not None:
+        return snapshot
+
+    key = flight_key("trends", keywords, timeframe=timeframe, geo=GEO)
+    return serve(
+        key,
+        lambda: get_flight().do(key, lambda: fetch_trends_with_pivot(keywords, timeframe, deadline, on_batch), deadline),
+        _is_good_result,
+        refresh=lambda: get_flight().do(key, lambda: fetch_trends_with_pivot(keywords, timeframe)),
+    )
+
+def _period_means(series: dict, end_day, days: int) -> dict:
+    """Mean value per keyword over the last `days` days (like get_timeframe(days))"""
+    first_day = (end_day - timedelta(days=days)).isoformat()
+    means = {}
+    for kw, values in series.items():
+        in_period = [value for day, value in values.items() if day >= first_day]
+        means[kw] = round(sum(in_period) / len(in_period), 1) if in_period else 0.0
+    return means
+
+def fetch_trends_periods(keywords: list, periods: list, deadline: Deadline = None) -> dict:
+    """
+    Scores for several periods from ONE daily series per batch.
+    The window of the longest period (capped at MAX_DAILY_DAYS) is fetched
+    with the usual pivot batches; every period's means are then computed
+    locally, so switching periods costs no upstream call. All periods share
+    the scale of the longest window's pivot.
+
+    Returns:
+        {
+            "periods": {"7": {"scores": {kw: 0-100}, "means": {kw: mean}}, ...},
+            "days": int,                       # length of the fetched window
+            "error": str or None,
+            "from_cache": False,
+            "partial": True, "missing": [...]  # only when batches were cut off
+        }
+    """
+    if not keywords:
+        return {"periods": {}, "error": "No keywords provided"}
+
+    days = min(max(periods), MAX_DAILY_DAYS)
+    periods = sorted({min(p, days) for p in periods})
+    timeframe = get_timeframe(days)
+    end_day = parse_timeframe(timeframe)[1]
+
+    pivot = keywords[0]
+    batches = pivot_batches(keywords)
+    results = run_batches(
+        lambda batch: fetch_trends_batch(batch, timeframe, deadline),
+        batches,
+        stop=lambda result: result.get("error") == "RATE_LIMITED",
+    )
+
+    means = {p: {} for p in periods}
+    pivot_means = {}
+    errors = []
+    missing = []
+
+    for batch, result in zip(batches, results):
+        if result is None or result.get("error") or not result.get("series"):
+            # Cancelled batches (None) follow a rate limited one
+            error = "RATE_LIMITED" if result is None else result.get("error") or "No daily data"
+            if error != "DEADLINE":
+                errors.append(error)
+            missing.extend(kw for kw in batch if kw not in missing)
+            continue
+
+        for p in periods:
+            batch_means = _period_means(result["series"], end_day, p)
+            if p not in pivot_means and pivot in batch_means:
+                pivot_means[p] = batch_means[pivot]
+            means[p].update(_rescale_to_pivot(batch, batch_means, pivot, pivot_means.get(p)))
+
+    missing = [kw for kw in missing if not any(kw in means[p] for p in periods)]
+
+    result = {
+        "periods": {
+            str(p): {
+                "scores": _scale_to_100({kw: means[p].get(kw, 0) for kw in keywords}),
+                "means": means[p],
+            }
+            for p in periods
+        },
+        "days": days,
+        "error": "RATE_LIMITED" if "RATE_LIMITED" in errors else (errors[0] if errors else None),
+        "from_cache": False,
+    }
+    if missing:
+        result["partial"] = True
+        result["missing"] = missing
+    return result
+
+def fetch_trends_periods_shared(keywords: list, periods: list, deadline: Deadline = None) -> dict:
+    """fetch_trends_periods, coalesced and served stale-while-revalidate like fetch_trends_shared"""
+    key = flight_key("periods", keywords, periods=sorted(periods), geo=GEO, day=datetime.now().strftime("%Y-%m-%d"))
+
+    def is_good(result: dict) -> bool:
+        return not result.get("error") and not result.get("partial") and bool(result.get("periods"))
+
+    return serve(
+        key,
+        lambda: get_flight().do(key, lambda: fetch_trends_periods(keywords, periods, deadline), deadline),
+        is_good,
+        refresh=lambda: get_flight().do(key, lambda: fetch_trends_periods(keywords, periods)),
+    )
+
+def _parse_periods(raw) -> list:
+    """Positive day counts from "7,14,30" or a JSON list, the defaults when empty"""
+    if isinstance(raw, str):
+        raw = raw.split(",")
+    periods = []
+    for value in raw or []:
+        try:
+            days = int(value)
+        except (TypeError, ValueError):
+            continue
+        if days > 0:
+            periods.append(days)
+    return periods or DEFAULT_PERIODS
+
+def fetch_combined_batch(keywords: list, timeframe: str, resolutions: list, deadline: Deadline = None,
+                         geo: str = GEO) -> dict:
+    """
+    Time series and interest by region for a batch of up to 5 keywords from
+    ONE explore payload: a single token request, then one widget call for
+    the series and one per resolution. The payload (series included) is
+    restricted to geo; only France-wide series go to the daily store.
+
+    Returns:
+        {"scores": {kw: mean}, "geo": {resolution: {region: {kw: score}}}, "error": str or None}
+    """
+    missing_dependency = missing_client_dependency()
+    if missing_dependency:
+        return {"error": f"{missing_dependency} not installed", "scores": {}, "geo": {}}
+
+    window = parse_timeframe(timeframe)
+    deadline = deadline or Deadline()
+
+    def fetch(client, egress):
+        client.build_payload(keywords, timeframe=timeframe, geo=geo)
+
+        egress.acquire(deadline=deadline)
+        series = client.timeseries()
+
+        geo_maps = {}
+        for resolution in resolutions:
+            egress.acquire(deadline=deadline)
+            geo_maps[resolution] = client.regions(resolution=resolution, inc_low_vol=True)
+        return (series, geo_maps) if series["dates"] else None
+
+    fetched, error = attempt_with_retries(fetch, deadline)
+    if error:
+        return {"error": error[:100], "scores": {}, "geo": {}}
+    if fetched is None:
+        return {"scores": {}, "geo": {}, "error": None}
+
+    series, geo_maps = fetched
+    store = get_store() if window and geo == GEO and _is_daily(series) else None
+    scores = None
+    if store:
+        try:
+            scores = _store_means(_store_series(store, keywords, window, series))
+        except Exception as e:
+            print(f"[PyTrends] Store update failed: {e}")
+    if scores is None:
+        scores = _series_means(series, keywords)
+
+    with span("normalize"):
+        regions = {
+            resolution: comparative_regions(geo_map, keywords)
+            for resolution, geo_map in geo_maps.items()
+        }
+    return {"scores": scores, "geo": regions, "error": None}
+
+def fetch_combined(keywords: list, timeframe: str, resolutions: list = None, deadline: Deadline = None,
+                   geo: str = GEO) -> dict:
+    """
+    Scores of /api/pytrends plus comparative geo data (as returned by
+    /api/pytrends_geo with comparative=true) from one batch plan: every
+    pivot batch builds its payload once and feeds both.
+
+    geo restricts the whole payload, e.g. "FR-J" with CITY for the Paris
+    tab: the scores then measure interest within that area, not France.
+
+    Returns:
+        {
+            "scores": {kw: score},                                  # 0-100, like fetch_trends_with_pivot
+            "geo": {resolution: {region: {kw: score}}},
+            "error": str or None,
+            "from_cache": False,
+            "batches": int,
+            "partial": True, "missing": [...]  # only when batches were cut off
+        }
+    """
+    if not keywords:
+        return {"scores": {}, "geo": {}, "error": "No keywords provided"}
+
+    resolutions = resolutions or COMBINED_RESOLUTIONS
+    pivot = keywords[0]
+    batches = pivot_batches(keywords)
+
+    results = run_batches(
+        lambda batch: fetch_combined_batch(batch, timeframe, resolutions, deadline, geo),
+        batches,
+        stop=lambda result: result.get("error") == "RATE_LIMITED",
+    )
+
+    all_scores = {}
+    pivot_score = None
+    errors = []
+    missing = []
+    geo_inputs = {resolution: [] for resolution in resolutions}
+
+    for batch, result in zip(batches, results):
+        if result is None or result.get("error"):
+            # Cancelled batches (None) follow a rate limited one
+            error = "RATE_LIMITED" if result is None else result["error"]
+            if error != "DEADLINE":
+                errors.append(error)
+            missing.extend(kw for kw in batch if kw not in missing)
+            for resolution in resolutions:
+                geo_inputs[resolution].append(None)
+            continue
+
+        batch_scores = result["scores"]
+        if pivot_score is None and pivot in batch_scores:
+            pivot_score = batch_scores[pivot]
+        all_scores.update(_rescale_to_pivot(batch, batch_scores, pivot, pivot_score))
+
+        for resolution in resolutions:
+            geo_inputs[resolution].append(result["geo"].get(resolution))
+
+    if len(batches) == 1:
+        regions = {resolution: inputs[0] or {} for resolution, inputs in geo_inputs.items()}
+    else:
+        with span("normalize"):
+            regions = {
+                resolution: chain_comparative(batches, inputs, pivot, keywords)
+                for resolution, inputs in geo_inputs.items()
+            }
+
+    missing = [kw for kw in missing if kw not in all_scores]
+
+    # The first batch sets the scale of cached scores
+    if results[0] is not None and not results[0].get("error"):
+        _cache_scores(timeframe, keywords, all_scores, geo)
+    for kw in keywords:
+        if kw not in all_scores:
+            all_scores[kw] = _memory_cache.get(_fallback_key(timeframe, keywords, kw, geo), 0)
+
+    result = {
+        "scores": _scale_to_100(all_scores),
+        "geo": regions,
+        "error": "RATE_LIMITED" if "RATE_LIMITED" in errors else (errors[0] if errors else None),
+        "from_cache": False,
+        "batches": len(batches),
+    }
+    if missing:
+        result["partial"] = True
+        result["missing"] = missing
+    return result
+
+def _rescale_series(batch_series: dict, pivot: str, reference: dict) -> dict:
+    """
+    A batch's {kw: {time: value}} on the scale of the reference pivot series:
+    one factor per batch, from the pivot's sums over the times both share.
+    """
+    pivot_series = batch_series.get(pivot, {})
+    common = [t for t in pivot_series if t in reference]
+    batch_sum = sum(pivot_series[t] for t in common)
+    reference_sum = sum(reference[t] for t in common)
+    factor = reference_sum / batch_sum if batch_sum > 0 and reference_sum > 0 else 1.0
+    return {kw: {t: value * factor for t, value in values.items()} for kw, values in batch_series.items()}
+
+def fetch_trends_series(keywords: list, timeframe: str, points: int = DEFAULT_SERIES_POINTS,
+                        deadline: Deadline = None) -> dict:
+    """
+    Normalized time series per keyword, downsampled to a point budget.
+    Batches are chained on the pivot's series (not its mean), scaled so the
+    highest value over all keywords is 100, then reduced per keyword with
+    LTTB, which keeps peaks and dips.
+
+    Returns:
+        {
+            "series": {kw: {"dates": [iso, ...], "values": [0-100, ...]}},
+            "points": int,                     # points per keyword after downsampling
+            "raw_points": int,                 # points of the fetched series
+            "error": str or None,
+            "from_cache": False,
+            "partial": True, "missing": [...]  # only when batches were cut off
+        }
+    """
+    if not keywords:
+        return {"series": {}, "error": "No keywords provided"}
+
+    pivot = keywords[0]
+    batches = pivot_batches(keywords)
+    results = run_batches(
+        lambda batch: fetch_trends_batch(batch, timeframe, deadline),
+        batches,
+        stop=lambda result: result.get("error") == "RATE_LIMITED",
+    )
+
+    merged = {}
+    reference = None
+    errors = []
+    missing = []
+    for batch, result in zip(batches, results):
+        batch_series = None if result is None else result.get("series") or result.get("hourly")
+        if result is None or result.get("error") or not batch_series:
+            # Cancelled batches (None) follow a rate limited one
+            error = "RATE_LIMITED" if result is None else result.get("error") or "No series data"
+            if error != "DEADLINE":
+                errors.append(error)
+            missing.extend(kw for kw in batch if kw not in missing)
+            continue
+        if reference is None:
+            reference = batch_series.get(pivot, {})
+        with span("normalize"):
+            merged.update(_rescale_series(batch_series, pivot, reference))
+
+    missing = [kw for kw in missing if kw not in merged]
+    fetched = [kw for kw in keywords if kw in merged]
+    series = {}
+    raw_points = 0
+    if fetched:
+        with span("normalize"):
+            # Times every fetched keyword has a value for (batches share the window)
+            times = sorted(set.intersection(*(set(merged[kw]) for kw in fetched)))
+            matrix = np.array([[merged[kw][t] for kw in fetched] for t in times], dtype=np.float64)
+            matrix = matrix.reshape(len(times), len(fetched))
+            peak = matrix.max() if matrix.size else 0
+            if peak > 0:
+                matrix = matrix * (100 / peak)
+            x = np.array(times, dtype="datetime64[s]").astype(np.float64)
+            raw_points = len(times)
+            kept = lttb_indices(x, matrix, points)
+            for col, kw in enumerate(fetched):
+                series[kw] = {
+                    "dates": [times[i] for i in kept[:, col].tolist()],
+                    "values": np.round(matrix[kept[:, col], col], 1).tolist(),
+                }
+
+    result = {
+        "series": series,
+        "points": min(points, raw_points),
+        "raw_points": raw_points,
+        "error": "RATE_LIMITED" if "RATE_LIMITED" in errors else (errors[0] if errors else None),
+        "from_cache": False,
+    }
+    if missing:
+        result["partial"] = True
+        result["missing"] = missing
+    return result
+
+def fetch_trends_series_shared(keywords: list, timeframe: str, points: int, deadline: Deadline = None) -> dict:
+    """fetch_trends_series, coalesced and served stale-while-revalidate like fetch_trends_shared"""
+    key = flight_key("series", keywords, timeframe=timeframe, geo=GEO, points=points)
+
+    def is_good(result: dict) -> bool:
+        return not result.get("error") and not result.get("partial") and bool(result.get("series"))
+
+    return serve(
+        key,
+        lambda: get_flight().do(key, lambda: fetch_trends_series(keywords, timeframe, points, deadline), deadline),
+        is_good,
+        refresh=lambda: get_flight().do(key, lambda: fetch_trends_series(keywords, timeframe, points)),
+    )
+
+def _parse_points(raw) -> int:
+    """Point budget of the series mode, clamped to [3, MAX_SERIES_POINTS]"""
+    try:
+        points = int(raw)
+    except (TypeError, ValueError):
+        return DEFAULT_SERIES_POINTS
+    return min(max(points, 3), MAX_SERIES_POINTS)
+
+def fetch_combined_shared(keywords: list, timeframe: str, resolutions: list, deadline: Deadline = None,
+                          geo: str = GEO) -> dict:
+    """fetch_combined, coalesced and served stale-while-revalidate like fetch_trends_shared"""
+    key = flight_key("combined", keywords, timeframe=timeframe, geo=geo, resolutions=sorted(resolutions))
+    return serve(
+        key,
+        lambda: get_flight().do(key, lambda: fetch_combined(keywords, timeframe, resolutions, deadline, geo), deadline),
+        _is_good_result,
+        refresh=lambda: get_flight().do(key, lambda: fetch_combined(keywords, timeframe, resolutions, geo=geo)),
+    )
+
+def _parse_resolutions(raw) -> list:
+    """REGION/CITY list from "REGION,CITY" or a JSON list, the default when empty"""
+    if isinstance(raw, str):
+        raw = raw.split(",")
+    resolutions = [r.strip().upper() for r in raw or [] if r.strip().upper() in ("REGION", "CITY")]
+    return list(dict.fromkeys(resolutions)) or COMBINED_RESOLUTIONS
+
+class handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        timings = start_request()
+        events = None
+        try:
+            # Parse query parameters
+            parsed = urlparse(self.path)
+            params = parse_qs(parsed.query)
+
+            keywords_raw = params.get("keywords", [""])[0]
+            days = int(params.get("days", ["7"])[0])
+            deadline = Deadline.parse(params.get("deadline", [None])[0])
+
+            if not keywords_raw:
+                send_json(self, 400, {"error": "Missing keywords parameter"})
+                return
+
+            # Parse keywords (comma-separated)
+            keywords = normalize_keywords(keywords_raw.split(","))
+
+            if not keywords:
+                send_json(self, 400, {"error": "No valid keywords"})
+                return
+
+            # Get timeframe
+            timeframe = get_timeframe(days)
+
+            # stream=ndjson|sse: one event per completed batch, then the result
+            stream = parse_stream(params.get("stream", [None])[0])
+            if stream:
+                events = EventStream(self, stream)
+                events.start()
+
+            # Fetch trends (mode=combined adds geo data from the same payloads,
+            # for geo=FR by default, e.g. geo=FR-J&resolutions=CITY for Paris,
+            # mode=periods serves several periods from one long series,
+            # mode=series returns the downsampled series themselves)
+            mode = params.get("mode", ["scores"])[0].lower()
+            if mode == "series":
+                points = _parse_points(params.get("points", [None])[0])
+                result = fetch_trends_series_shared(keywords, timeframe, points, deadline)
+            elif mode == "combined":
+                resolutions = _parse_resolutions(params.get("resolutions", [""])[0])
+                geo = params.get("geo", [GEO])[0] or GEO
+                result = fetch_combined_shared(keywords, timeframe, resolutions, deadline, geo)
+            elif mode == "periods":
+                periods = _parse_periods(params.get("periods", [""])[0])
+                result = fetch_trends_periods_shared(keywords, periods, deadline)
+            else:
+                result = fetch_trends_shared(keywords, timeframe, deadline, events.send if events else None)
+
+            if events:
+                events.send({"type": "final", **result, "timings": timings.as_dict()})
+                return
+
+            # Per-phase durations are always in Server-Timing, in the body on demand
+            if params.get("timings", ["0"])[0] == "1":
+                result = {
+                    **result,
+                    "timings": timings.as_dict(),
+                    "cache": _memory_cache.stats(),
+                    "egress": get_egress_pool().stats(),
+                }
+
+            send_json(self, 200, result, {"Cache-Control": "s-maxage=3600"})  # Cache 1h at edge
+
+        except Exception as e:
+            if events:
+                events.send({"type": "error", "error": str(e)})
+            else:
+                send_json(self, 500, {"error": str(e)})
+
+    def do_POST(self):
+        timings = start_request()
+        events = None
+        try:
+            content_length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(content_length)
+            data = json.loads(body) if body else {}
+
+            keywords = normalize_keywords(data.get("keywords", []))
+            days = data.get("days", 7)
+            deadline = Deadline.parse(data.get("deadline"))
+
+            if not keywords:
+                send_json(self, 400, {"error": "Missing keywords"})
+                return
+
+            timeframe = get_timeframe(days)
+
+            stream = parse_stream(data.get("stream"))
+            if stream:
+                events = EventStream(self, stream)
+                events.start()
+
+            if data.get("mode") == "series":
+                result = fetch_trends_series_shared(keywords, timeframe, _parse_points(data.get("points")), deadline)
+            elif data.get("mode") == "combined":
+                resolutions = _parse_resolutions(data.get("resolutions"))
+                result = fetch_combined_shared(keywords, timeframe, resolutions, deadline, data.get("geo") or GEO)
+            elif data.get("mode") == "periods":
+                result = fetch_trends_periods_shared(keywords, _parse_periods(data.get("periods")), deadline)
+            else:
+                result = fetch_trends_shared(keywords, timeframe, deadline, events.send if events else None)
+
+            if events:
+                events.send({"type": "final", **result, "timings": timings.as_dict()})
+                return
+
+            if data.get("timings"):
+                result = {
+                    **result,
+                    "timings": timings.as_dict(),
+                    "cache": _memory_cache.stats(),
+                    "egress": get_egress_pool().stats(),
+                }
+
+            send_json(self, 200, result)
+
+        except Exception as e:
+            if events:
+                events.send({"type": "error", "error": str(e)})
+            else:
+                send_json(self, 500, {"error": str(e)})
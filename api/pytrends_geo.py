@@ -1,458 +1,803 @@
-from http.server import BaseHTTPRequestHandler
-import json
-import time
-import random
-from urllib.parse import parse_qs, urlparse
-from datetime import datetime, timedelta
-
-# Cache en memoire pour cette instance (fallback)
-_memory_cache = {}
-_last_request_time = None
-
-def get_timeframe(days: int) -> str:
-    """Convert days to Google Trends timeframe format"""
-    end = datetime.now()
-    start = end - timedelta(days=days)
-    return f"{start.strftime('%Y-%m-%d')} {end.strftime('%Y-%m-%d')}"
-
-def fetch_geo_trends(keyword: str, geo: str, timeframe: str, resolution: str = "CITY") -> dict:
-    """
-    Fetch geographic interest data for a keyword.
-    Uses patched pytrends to support CITY resolution for non-US countries.
-
-    Args:
-        keyword: Search term
-        geo: Geographic code (e.g., 'FR-J' for Ile-de-France)
-        timeframe: Date range
-        resolution: 'CITY' or 'REGION'
-    """
-    print(f"[PyTrendsGeo] ====== FETCH START ======")
-    print(f"[PyTrendsGeo] Keyword: {keyword}")
-    print(f"[PyTrendsGeo] Geo: {geo}, Timeframe: {timeframe}, Resolution: {resolution}")
-
-    try:
-        from pytrends.request import TrendReq
-        import pandas as pd
-        print(f"[PyTrendsGeo] pytrends imported OK")
-    except ImportError as e:
-        print(f"[PyTrendsGeo] ERROR: pytrends import failed: {e}")
-        return {"error": "pytrends not installed", "data": []}
-
-    max_retries = 3
-
-    for attempt in range(max_retries):
-        print(f"[PyTrendsGeo] Attempt {attempt + 1}/{max_retries}")
-        try:
-            # Random delay to avoid rate limiting
-            delay = 2 + random.uniform(0, 2)
-            print(f"[PyTrendsGeo] Sleeping {delay:.1f}s before request")
-            time.sleep(delay)
-
-            print(f"[PyTrendsGeo] Creating TrendReq...")
-            pytrends = TrendReq(hl="fr-FR", tz=60, timeout=(10, 25))
-
-            print(f"[PyTrendsGeo] Building payload...")
-            pytrends.build_payload([keyword], timeframe=timeframe, geo=geo)
-
-            time.sleep(1 + random.uniform(0, 1))
-
-            # Patch: Force resolution for non-US countries
-            # The original pytrends only allows CITY/REGION for US or empty geo
-            # We manually set the resolution in the widget request
-            print(f"[PyTrendsGeo] Checking interest_by_region_widget...")
-            if hasattr(pytrends, 'interest_by_region_widget') and pytrends.interest_by_region_widget:
-                print(f"[PyTrendsGeo] Widget found, patching resolution to {resolution}")
-                print(f"[PyTrendsGeo] Widget before patch: {pytrends.interest_by_region_widget}")
-                pytrends.interest_by_region_widget['request']['resolution'] = resolution
-                print(f"[PyTrendsGeo] Widget after patch: {pytrends.interest_by_region_widget}")
-            else:
-                print(f"[PyTrendsGeo] WARNING: No interest_by_region_widget found!")
-                print(f"[PyTrendsGeo] hasattr: {hasattr(pytrends, 'interest_by_region_widget')}")
-                if hasattr(pytrends, 'interest_by_region_widget'):
-                    print(f"[PyTrendsGeo] Widget value: {pytrends.interest_by_region_widget}")
-
-            print(f"[PyTrendsGeo] Calling interest_by_region...")
-            df = pytrends.interest_by_region(resolution=resolution, inc_low_vol=True, inc_geo_code=False)
-
-            print(f"[PyTrendsGeo] DataFrame received: type={type(df)}")
-            if df is not None:
-                print(f"[PyTrendsGeo] DataFrame shape: {df.shape}")
-                print(f"[PyTrendsGeo] DataFrame empty: {df.empty}")
-                print(f"[PyTrendsGeo] DataFrame columns: {list(df.columns)}")
-                print(f"[PyTrendsGeo] DataFrame index (first 10): {list(df.index[:10])}")
-                if not df.empty:
-                    print(f"[PyTrendsGeo] DataFrame head:\n{df.head(10)}")
-
-            if df is not None and not df.empty:
-                # Convert to list of dicts
-                result = []
-                for idx, row in df.iterrows():
-                    city_name = idx if isinstance(idx, str) else str(idx)
-                    score = int(row[keyword]) if keyword in row.index else 0
-                    if score > 0:  # Only include cities with data
-                        result.append({
-                            "name": city_name,
-                            "score": score
-                        })
-
-                # Sort by score descending
-                result.sort(key=lambda x: x["score"], reverse=True)
-
-                print(f"[PyTrendsGeo] SUCCESS: Found {len(result)} cities with data")
-                if result:
-                    print(f"[PyTrendsGeo] Top 5: {result[:5]}")
-                print(f"[PyTrendsGeo] ====== FETCH END - SUCCESS ======")
-                return {"data": result, "error": None}
-            else:
-                print(f"[PyTrendsGeo] DataFrame is None or empty")
-                if attempt < max_retries - 1:
-                    print(f"[PyTrendsGeo] Retrying after delay...")
-                    time.sleep(5 * (attempt + 1))
-
-        except Exception as e:
-            err_str = str(e)
-            print(f"[PyTrendsGeo] EXCEPTION: {err_str}")
-            import traceback
-            print(f"[PyTrendsGeo] Traceback:\n{traceback.format_exc()}")
-
-            if "429" in err_str:
-                if attempt < max_retries - 1:
-                    print(f"[PyTrendsGeo] Rate limited, waiting longer...")
-                    time.sleep(10 * (attempt + 1) + random.uniform(0, 5))
-                else:
-                    print(f"[PyTrendsGeo] ====== FETCH END - RATE LIMITED ======")
-                    return {"error": "RATE_LIMITED", "data": []}
-            else:
-                if attempt == max_retries - 1:
-                    print(f"[PyTrendsGeo] ====== FETCH END - ERROR ======")
-                    return {"error": err_str[:200], "data": []}
-                time.sleep(3)
-
-    print(f"[PyTrendsGeo] ====== FETCH END - NO DATA ======")
-    return {"data": [], "error": None}
-
-def fetch_geo_trends_comparative(keywords: list, geo: str, timeframe: str, resolution: str = "REGION") -> dict:
-    """
-    Fetch geographic interest data for multiple keywords in ONE request.
-    This gives COMPARABLE scores between keywords (max 5 keywords).
-
-    Returns:
-        {
-            "results": {
-                "region_name": {"keyword1": score, "keyword2": score, ...},
-                ...
-            },
-            "error": str or None,
-            "comparative": True
-        }
-    """
-    print(f"[PyTrendsGeo] ====== COMPARATIVE FETCH START ======")
-    print(f"[PyTrendsGeo] Keywords: {keywords}")
-    print(f"[PyTrendsGeo] Geo: {geo}, Timeframe: {timeframe}, Resolution: {resolution}")
-
-    if len(keywords) > 5:
-        print(f"[PyTrendsGeo] ERROR: Max 5 keywords for comparative mode")
-        return {"results": {}, "error": "Max 5 keywords for comparative mode", "comparative": True}
-
-    if not keywords:
-        print(f"[PyTrendsGeo] ERROR: No keywords provided")
-        return {"results": {}, "error": "No keywords provided", "comparative": True}
-
-    try:
-        from pytrends.request import TrendReq
-        import pandas as pd
-        print(f"[PyTrendsGeo] pytrends imported OK")
-    except ImportError as e:
-        print(f"[PyTrendsGeo] ERROR: pytrends import failed: {e}")
-        return {"results": {}, "error": "pytrends not installed", "comparative": True}
-
-    max_retries = 3
-
-    for attempt in range(max_retries):
-        print(f"[PyTrendsGeo] Attempt {attempt + 1}/{max_retries}")
-        try:
-            # Random delay to avoid rate limiting
-            delay = 2 + random.uniform(0, 2)
-            print(f"[PyTrendsGeo] Sleeping {delay:.1f}s before request")
-            time.sleep(delay)
-
-            print(f"[PyTrendsGeo] Creating TrendReq...")
-            pytrends = TrendReq(hl="fr-FR", tz=60, timeout=(10, 25))
-
-            print(f"[PyTrendsGeo] Building payload with ALL keywords: {keywords}")
-            pytrends.build_payload(keywords, timeframe=timeframe, geo=geo)
-
-            time.sleep(1 + random.uniform(0, 1))
-
-            # Patch resolution for non-US countries
-            if hasattr(pytrends, 'interest_by_region_widget') and pytrends.interest_by_region_widget:
-                print(f"[PyTrendsGeo] Widget found, patching resolution to {resolution}")
-                pytrends.interest_by_region_widget['request']['resolution'] = resolution
-
-            print(f"[PyTrendsGeo] Calling interest_by_region...")
-            df = pytrends.interest_by_region(resolution=resolution, inc_low_vol=True, inc_geo_code=False)
-
-            print(f"[PyTrendsGeo] DataFrame received: type={type(df)}")
-            if df is not None:
-                print(f"[PyTrendsGeo] DataFrame shape: {df.shape}")
-                print(f"[PyTrendsGeo] DataFrame columns: {list(df.columns)}")
-                print(f"[PyTrendsGeo] DataFrame index (first 10): {list(df.index[:10])}")
-                if not df.empty:
-                    print(f"[PyTrendsGeo] DataFrame head:\n{df.head(10)}")
-
-            if df is not None and not df.empty:
-                # Convert to dict: region -> {keyword: score, ...}
-                results = {}
-                for region_name in df.index:
-                    region_data = {}
-                    for kw in keywords:
-                        if kw in df.columns:
-                            score = int(df.loc[region_name, kw])
-                            region_data[kw] = score
-                    # Only include regions with at least some data
-                    if any(v > 0 for v in region_data.values()):
-                        results[region_name] = region_data
-
-                print(f"[PyTrendsGeo] SUCCESS: Found {len(results)} regions with data")
-                if results:
-                    first_region = list(results.keys())[0]
-                    print(f"[PyTrendsGeo] Example - {first_region}: {results[first_region]}")
-                print(f"[PyTrendsGeo] ====== COMPARATIVE FETCH END - SUCCESS ======")
-                return {"results": results, "error": None, "comparative": True}
-            else:
-                print(f"[PyTrendsGeo] DataFrame is None or empty")
-                if attempt < max_retries - 1:
-                    time.sleep(5 * (attempt + 1))
-
-        except Exception as e:
-            err_str = str(e)
-            print(f"[PyTrendsGeo] EXCEPTION: {err_str}")
-            import traceback
-            print(f"[PyTrendsGeo] Traceback:\n{traceback.format_exc()}")
-
-            if "429" in err_str:
-                if attempt < max_retries - 1:
-                    print(f"[PyTrendsGeo] Rate limited, waiting longer...")
-                    time.sleep(10 * (attempt + 1) + random.uniform(0, 5))
-                else:
-                    print(f"[PyTrendsGeo] ====== COMPARATIVE FETCH END - RATE LIMITED ======")
-                    return {"results": {}, "error": "RATE_LIMITED", "comparative": True}
-            else:
-                if attempt == max_retries - 1:
-                    print(f"[PyTrendsGeo] ====== COMPARATIVE FETCH END - ERROR ======")
-                    return {"results": {}, "error": err_str[:200], "comparative": True}
-                time.sleep(3)
-
-    print(f"[PyTrendsGeo] ====== COMPARATIVE FETCH END - NO DATA ======")
-    return {"results": {}, "error": None, "comparative": True}
-
-
-def fetch_geo_trends_batch(keywords: list, geo: str, timeframe: str, resolution: str = "CITY") -> dict:
-    """
-    Fetch geographic interest data for multiple keywords.
-    Processes sequentially with delays to avoid rate limiting.
-
-    Returns:
-        {
-            "results": {
-                "keyword1": [{"name": "Paris", "score": 100}, ...],
-                "keyword2": [...],
-            },
-            "error": str or None,
-            "from_cache": bool
-        }
-    """
-    global _last_request_time
-
-    print(f"[PyTrendsGeo] ====== BATCH START ======")
-    print(f"[PyTrendsGeo] Keywords: {keywords}")
-    print(f"[PyTrendsGeo] Geo: {geo}, Timeframe: {timeframe}, Resolution: {resolution}")
-
-    if not keywords:
-        print(f"[PyTrendsGeo] ERROR: No keywords provided")
-        return {"results": {}, "error": "No keywords provided", "from_cache": False}
-
-    # Rate limit check (minimum 60 seconds between full batch requests)
-    if _last_request_time:
-        elapsed = time.time() - _last_request_time
-        print(f"[PyTrendsGeo] Time since last request: {elapsed:.1f}s")
-        if elapsed < 60:
-            # Return cached data if available
-            cached_results = {}
-            cache_key_prefix = f"{geo}:{resolution}:"
-            for kw in keywords:
-                cache_key = cache_key_prefix + kw
-                if cache_key in _memory_cache:
-                    cached_results[kw] = _memory_cache[cache_key]
-            if cached_results:
-                print(f"[PyTrendsGeo] Returning cached results for {len(cached_results)} keywords")
-                return {"results": cached_results, "error": None, "from_cache": True}
-            else:
-                print(f"[PyTrendsGeo] No cached results available, proceeding anyway")
-
-    _last_request_time = time.time()
-
-    all_results = {}
-    errors = []
-
-    for i, kw in enumerate(keywords):
-        print(f"[PyTrendsGeo] Processing keyword {i+1}/{len(keywords)}: {kw}")
-        result = fetch_geo_trends(kw, geo, timeframe, resolution)
-
-        if result.get("error") == "RATE_LIMITED":
-            print(f"[PyTrendsGeo] Rate limited, using fallback for remaining keywords")
-            # Use fallback for remaining keywords
-            cache_key_prefix = f"{geo}:{resolution}:"
-            for remaining_kw in keywords:
-                if remaining_kw not in all_results:
-                    cache_key = cache_key_prefix + remaining_kw
-                    all_results[remaining_kw] = _memory_cache.get(cache_key, [])
-            return {"results": all_results, "error": "RATE_LIMITED", "from_cache": False}
-
-        if result.get("error"):
-            print(f"[PyTrendsGeo] Error for {kw}: {result['error']}")
-            errors.append(f"{kw}: {result['error']}")
-
-        all_results[kw] = result.get("data", [])
-        print(f"[PyTrendsGeo] Got {len(all_results[kw])} cities for {kw}")
-
-        # Store in memory cache for fallback
-        if result.get("data"):
-            cache_key = f"{geo}:{resolution}:{kw}"
-            _memory_cache[cache_key] = result["data"]
-
-        # Delay between keywords to avoid rate limiting
-        if len(keywords) > 1 and i < len(keywords) - 1:
-            delay = 3 + random.uniform(0, 2)
-            print(f"[PyTrendsGeo] Sleeping {delay:.1f}s before next keyword")
-            time.sleep(delay)
-
-    print(f"[PyTrendsGeo] ====== BATCH END ======")
-    print(f"[PyTrendsGeo] Total results: {len(all_results)} keywords")
-    for kw, cities in all_results.items():
-        print(f"[PyTrendsGeo]   {kw}: {len(cities)} cities")
-
-    return {
-        "results": all_results,
-        "error": errors[0] if errors else None,
-        "from_cache": False
-    }
-
-class handler(BaseHTTPRequestHandler):
-    def do_GET(self):
-        print(f"[PyTrendsGeo] ====== HTTP GET REQUEST ======")
-        print(f"[PyTrendsGeo] Path: {self.path}")
-        try:
-            # Parse query parameters
-            parsed = urlparse(self.path)
-            params = parse_qs(parsed.query)
-            print(f"[PyTrendsGeo] Parsed params: {params}")
-
-            keywords_raw = params.get("keywords", [""])[0]
-            geo = params.get("geo", ["FR-J"])[0]  # Default: Ile-de-France
-            days = int(params.get("days", ["7"])[0])
-            resolution = params.get("resolution", ["CITY"])[0].upper()
-
-            print(f"[PyTrendsGeo] keywords_raw: {keywords_raw}")
-            print(f"[PyTrendsGeo] geo: {geo}, days: {days}, resolution: {resolution}")
-
-            if resolution not in ["CITY", "REGION"]:
-                resolution = "CITY"
-
-            if not keywords_raw:
-                print(f"[PyTrendsGeo] ERROR: Missing keywords parameter")
-                self.send_response(400)
-                self.send_header("Content-Type", "application/json")
-                self.end_headers()
-                self.wfile.write(json.dumps({"error": "Missing keywords parameter"}).encode())
-                return
-
-            # Parse keywords (comma-separated)
-            keywords = [k.strip() for k in keywords_raw.split(",") if k.strip()]
-            print(f"[PyTrendsGeo] Parsed keywords: {keywords}")
-
-            if not keywords:
-                print(f"[PyTrendsGeo] ERROR: No valid keywords")
-                self.send_response(400)
-                self.send_header("Content-Type", "application/json")
-                self.end_headers()
-                self.wfile.write(json.dumps({"error": "No valid keywords"}).encode())
-                return
-
-            # Check for comparative mode
-            comparative = params.get("comparative", ["false"])[0].lower() == "true"
-            print(f"[PyTrendsGeo] Comparative mode: {comparative}")
-
-            # Get timeframe
-            timeframe = get_timeframe(days)
-            print(f"[PyTrendsGeo] Timeframe: {timeframe}")
-
-            # Fetch geographic trends
-            if comparative and len(keywords) <= 5:
-                print(f"[PyTrendsGeo] Calling fetch_geo_trends_comparative...")
-                result = fetch_geo_trends_comparative(keywords, geo, timeframe, resolution)
-            else:
-                print(f"[PyTrendsGeo] Calling fetch_geo_trends_batch...")
-                result = fetch_geo_trends_batch(keywords, geo, timeframe, resolution)
-            print(f"[PyTrendsGeo] Result: {json.dumps(result)[:500]}...")
-
-            self.send_response(200)
-            self.send_header("Content-Type", "application/json")
-            self.send_header("Cache-Control", "s-maxage=7200")  # Cache 2h at edge
-            self.end_headers()
-            self.wfile.write(json.dumps(result).encode())
-            print(f"[PyTrendsGeo] ====== HTTP GET RESPONSE SENT ======")
-
-        except Exception as e:
-            print(f"[PyTrendsGeo] ====== HTTP GET EXCEPTION ======")
-            print(f"[PyTrendsGeo] Exception: {e}")
-            import traceback
-            print(f"[PyTrendsGeo] Traceback:\n{traceback.format_exc()}")
-            self.send_response(500)
-            self.send_header("Content-Type", "application/json")
-            self.end_headers()
-            self.wfile.write(json.dumps({"error": str(e)}).encode())
-
-    def do_POST(self):
-        try:
-            content_length = int(self.headers.get("Content-Length", 0))
-            body = self.rfile.read(content_length)
-            data = json.loads(body) if body else {}
-
-            keywords = data.get("keywords", [])
-            geo = data.get("geo", "FR-J")
-            days = data.get("days", 7)
-            resolution = data.get("resolution", "CITY").upper()
-            comparative = data.get("comparative", False)
-
-            print(f"[PyTrendsGeo] POST - keywords: {keywords}, geo: {geo}, days: {days}, resolution: {resolution}, comparative: {comparative}")
-
-            if resolution not in ["CITY", "REGION"]:
-                resolution = "CITY"
-
-            if not keywords:
-                self.send_response(400)
-                self.send_header("Content-Type", "application/json")
-                self.end_headers()
-                self.wfile.write(json.dumps({"error": "Missing keywords"}).encode())
-                return
-
-            timeframe = get_timeframe(days)
-
-            if comparative and len(keywords) <= 5:
-                print(f"[PyTrendsGeo] POST - Using comparative mode")
-                result = fetch_geo_trends_comparative(keywords, geo, timeframe, resolution)
-            else:
-                print(f"[PyTrendsGeo] POST - Using batch mode")
-                result = fetch_geo_trends_batch(keywords, geo, timeframe, resolution)
-
-            self.send_response(200)
-            self.send_header("Content-Type", "application/json")
-            self.end_headers()
-            self.wfile.write(json.dumps(result).encode())
-
-        except Exception as e:
-            self.send_response(500)
-            self.send_header("Content-Type", "application/json")
-            self.end_headers()
-            self.wfile.write(json.dumps({"error": str(e)}).encode())
+from http.server import BaseHTTPRequestHandler
+import json
+import os
+import sys
+import time
+from urllib.parse import parse_qs, urlparse
+from datetime import datetime, timedelta
+
+# Shared helpers live in api/_lib (appended so the pytrends package still wins)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+_import_started = time.perf_counter()
+from _lib.attempts import attempt_with_retries
+from _lib.backoff import Deadline
+from _lib.cache import MemoryCache
+from _lib.geo import chain_comparative, comparative_regions, ranked_regions, to_columnar
+from _lib.history import history_comparative
+from _lib.proxies import get_egress_pool
+from _lib.ratelimit import get_rate_state
+from _lib.responses import EventStream, parse_stream, send_json
+from _lib.scheduler import MAX_KEYWORDS_PER_PAYLOAD, pivot_batches, run_batches
+from _lib.sessions import missing_client_dependency
+from _lib.singleflight import flight_key, get_flight, normalize_keywords
+from _lib.snapshot import lookup, snapshot_key
+from _lib.store import timeframe_days
+from _lib.swr import serve
+from _lib.timing import log, record_import, span, start_request
+record_import(time.perf_counter() - _import_started)
+
+# Cache en memoire pour cette instance (fallback)
+_memory_cache = MemoryCache()
+
+def _cache_key(geo: str, resolution: str, timeframe: str, keyword: str) -> tuple:
+    """Memory cache key of a keyword's ranked cities (each keyword is its own scale)"""
+    return ("geo", geo, resolution, timeframe_days(timeframe), keyword)
+
+def get_timeframe(days: int) -> str:
+    """Convert days to Google Trends timeframe format"""
+    end = datetime.now()
+    start = end - timedelta(days=days)
+    return f"{start.strftime('%Y-%m-%d')} {end.strftime('%Y-%m-%d')}"
+
+def fetch_geo_trends(keyword: str, geo: str, timeframe: str, resolution: str = "CITY",
+                     deadline: Deadline = None) -> dict:
+    """
+    Fetch geographic interest data for a keyword.
+    The widget resolution is forced to support CITY for non-US countries.
+
+    Args:
+        keyword: Search term
+        geo: Geographic code (e.g., 'FR-J' for Ile-de-France)
+        timeframe: Date range
+        resolution: 'CITY' or 'REGION'
+        deadline: Gives up with error "DEADLINE" when no time is left to retry
+    """
+    log(f"[PyTrendsGeo] ====== FETCH START ======")
+    log(f"[PyTrendsGeo] Keyword: {keyword}")
+    log(f"[PyTrendsGeo] Geo: {geo}, Timeframe: {timeframe}, Resolution: {resolution}")
+
+    missing_dependency = missing_client_dependency()
+    if missing_dependency:
+        print(f"[PyTrendsGeo] ERROR: {missing_dependency} not installed")
+        return {"error": f"{missing_dependency} not installed", "data": []}
+
+    deadline = deadline or Deadline()
+
+    def fetch(client, egress):
+        log(f"[PyTrendsGeo] Building payload...")
+        client.build_payload([keyword], timeframe=timeframe, geo=geo)
+
+        egress.acquire(deadline=deadline)
+
+        # The client forces the resolution in the widget request:
+        # Google only honours CITY/REGION for the US or an empty geo otherwise
+        log(f"[PyTrendsGeo] Fetching interest by region ({resolution})...")
+        geo_map = client.regions(resolution=resolution, inc_low_vol=True)
+        log(f"[PyTrendsGeo] Regions received: {len(geo_map['regions'])}")
+        return geo_map if geo_map["regions"] else None
+
+    geo_map, error = attempt_with_retries(fetch, deadline, "PyTrendsGeo")
+    if error:
+        log(f"[PyTrendsGeo] ====== FETCH END - {error[:200]} ======")
+        return {"error": error[:200], "data": []}
+    if geo_map is None:
+        log(f"[PyTrendsGeo] ====== FETCH END - NO DATA ======")
+        return {"data": [], "error": None}
+
+    # Cities with data, sorted by score descending
+    with span("normalize"):
+        result = ranked_regions(geo_map, keyword)
+
+    log(f"[PyTrendsGeo] SUCCESS: Found {len(result)} cities with data")
+    if result:
+        log(f"[PyTrendsGeo] Top 5: {result[:5]}")
+    log(f"[PyTrendsGeo] ====== FETCH END - SUCCESS ======")
+    return {"data": result, "error": None}
+
+def fetch_geo_trends_comparative(keywords: list, geo: str, timeframe: str, resolution: str = "REGION",
+                                 deadline: Deadline = None) -> dict:
+    """
+    Fetch geographic interest data for multiple keywords in ONE request.
+    This gives COMPARABLE scores between keywords (max 5 keywords).
+
+    Returns:
+        {
+            "results": {
+                "region_name": {"keyword1": score, "keyword2": score, ...},
+                ...
+            },
+            "error": str or None,
+            "comparative": True
+        }
+    """
+    log(f"[PyTrendsGeo] ====== COMPARATIVE FETCH START ======")
+    log(f"[PyTrendsGeo] Keywords: {keywords}")
+    log(f"[PyTrendsGeo] Geo: {geo}, Timeframe: {timeframe}, Resolution: {resolution}")
+
+    if len(keywords) > MAX_KEYWORDS_PER_PAYLOAD:
+        print(f"[PyTrendsGeo] ERROR: Max 5 keywords for comparative mode")
+        return {"results": {}, "error": "Max 5 keywords for comparative mode", "comparative": True}
+
+    if not keywords:
+        print(f"[PyTrendsGeo] ERROR: No keywords provided")
+        return {"results": {}, "error": "No keywords provided", "comparative": True}
+
+    missing_dependency = missing_client_dependency()
+    if missing_dependency:
+        print(f"[PyTrendsGeo] ERROR: {missing_dependency} not installed")
+        return {"results": {}, "error": f"{missing_dependency} not installed", "comparative": True}
+
+    deadline = deadline or Deadline()
+
+    def fetch(client, egress):
+        log(f"[PyTrendsGeo] Building payload with ALL keywords: {keywords}")
+        client.build_payload(keywords, timeframe=timeframe, geo=geo)
+
+        egress.acquire(deadline=deadline)
+
+        log(f"[PyTrendsGeo] Fetching interest by region ({resolution})...")
+        geo_map = client.regions(resolution=resolution, inc_low_vol=True)
+        log(f"[PyTrendsGeo] Regions received: {len(geo_map['regions'])}")
+        return geo_map if geo_map["regions"] else None
+
+    geo_map, error = attempt_with_retries(fetch, deadline, "PyTrendsGeo")
+    if error:
+        log(f"[PyTrendsGeo] ====== COMPARATIVE FETCH END - {error[:200]} ======")
+        return {"results": {}, "error": error[:200], "comparative": True}
+    if geo_map is None:
+        log(f"[PyTrendsGeo] ====== COMPARATIVE FETCH END - NO DATA ======")
+        return {"results": {}, "error": None, "comparative": True}
+
+    # Convert to dict: region -> {keyword: score, ...}
+    # Only regions with at least some data are kept
+    with span("normalize"):
+        results = comparative_regions(geo_map, keywords)
+
+    log(f"[PyTrendsGeo] SUCCESS: Found {len(results)} regions with data")
+    if results:
+        first_region = list(results.keys())[0]
+        log(f"[PyTrendsGeo] Example - {first_region}: {results[first_region]}")
+    log(f"[PyTrendsGeo] ====== COMPARATIVE FETCH END - SUCCESS ======")
+    return {"results": results, "error": None, "comparative": True}
+
+
+def fetch_geo_trends_comparative_chained(keywords: list, geo: str, timeframe: str, resolution: str = "REGION",
+                                         deadline: Deadline = None, on_batch=None) -> dict:
+    """
+    Comparative geo data for any number of keywords.
+    The first keyword is the pivot of overlapping batches (pivot + 4 others),
+    so N keywords take ceil((N-1)/4) requests. Batch shares are rescaled per
+    region onto the pivot and merged into one comparable matrix.
+    on_batch(event) receives a "batch" event as each batch completes, with
+    the matrix merged from the batches done so far.
+
+    Returns the shape of fetch_geo_trends_comparative, plus "batches" and,
+    when some batches could not be fetched, "partial" and "missing".
+    """
+    log(f"[PyTrendsGeo] ====== CHAINED COMPARATIVE START ======")
+    log(f"[PyTrendsGeo] Keywords: {keywords}")
+
+    if len(keywords) <= MAX_KEYWORDS_PER_PAYLOAD:
+        return fetch_geo_trends_comparative(keywords, geo, timeframe, resolution, deadline)
+
+    pivot = keywords[0]
+    batches = pivot_batches(keywords)
+    log(f"[PyTrendsGeo] {len(batches)} batches around pivot '{pivot}'")
+
+    done = [None] * len(batches)
+    completed = []
+
+    def report(index: int, result: dict) -> None:
+        completed.append(index)
+        done[index] = result.get("results") if not result.get("error") else None
+        with span("normalize"):
+            provisional = chain_comparative(batches, done, pivot, keywords)
+        on_batch({
+            "type": "batch",
+            "index": index,
+            "keywords": batches[index],
+            "error": result.get("error"),
+            "results": provisional,
+            "comparative": True,
+            "done": len(completed),
+            "total": len(batches),
+        })
+
+    batch_results = run_batches(
+        lambda batch: fetch_geo_trends_comparative(batch, geo, timeframe, resolution, deadline),
+        batches,
+        stop=lambda result: result.get("error") == "RATE_LIMITED",
+        on_result=report if on_batch else None,
+    )
+
+    errors = []
+    missing = []
+    merged_inputs = []
+    for batch, result in zip(batches, batch_results):
+        if result is None or result.get("error") or not result.get("results"):
+            error = "RATE_LIMITED" if result is None else result.get("error")
+            print(f"[PyTrendsGeo] Batch {batch} failed: {error}")
+            if error:
+                errors.append(error)
+            missing.extend(batch[1:])
+            merged_inputs.append(None)
+            continue
+        merged_inputs.append(result["results"])
+
+    if all(r is None for r in merged_inputs):
+        log(f"[PyTrendsGeo] ====== CHAINED COMPARATIVE END - NO DATA ======")
+        error = "RATE_LIMITED" if "RATE_LIMITED" in errors else (errors[0] if errors else None)
+        return {"results": {}, "error": error, "comparative": True, "partial": True, "missing": list(keywords)}
+
+    with span("normalize"):
+        results = chain_comparative(batches, merged_inputs, pivot, keywords)
+    log(f"[PyTrendsGeo] ====== CHAINED COMPARATIVE END - {len(results)} regions ======")
+
+    result = {"results": results, "error": None, "comparative": True, "batches": len(batches)}
+    if missing:
+        result["partial"] = True
+        result["missing"] = missing
+        if "RATE_LIMITED" in errors:
+            result["error"] = "RATE_LIMITED"
+    return result
+
+
+def fetch_geo_trends_batch(keywords: list, geo: str, timeframe: str, resolution: str = "CITY",
+                           deadline: Deadline = None, on_batch=None) -> dict:
+    """
+    Fetch geographic interest data for multiple keywords.
+    Keywords are fetched concurrently, paced by the shared token bucket.
+    Keywords cut off by the deadline fall back to the memory cache.
+    on_batch(event) receives a "batch" event with each keyword's cities as
+    soon as they are fetched.
+
+    Returns:
+        {
+            "results": {
+                "keyword1": [{"name": "Paris", "score": 100}, ...],
+                "keyword2": [...],
+            },
+            "error": str or None,
+            "from_cache": bool,
+            "partial": True, "missing": [...]  # only when the deadline was reached
+        }
+    """
+    log(f"[PyTrendsGeo] ====== BATCH START ======")
+    log(f"[PyTrendsGeo] Keywords: {keywords}")
+    log(f"[PyTrendsGeo] Geo: {geo}, Timeframe: {timeframe}, Resolution: {resolution}")
+
+    if not keywords:
+        print(f"[PyTrendsGeo] ERROR: No keywords provided")
+        return {"results": {}, "error": "No keywords provided", "from_cache": False}
+
+    # Rate limit check (minimum 60 seconds between full batch requests, on any instance)
+    rate_state = get_rate_state()
+    if rate_state.last_request("geo"):
+        elapsed = time.time() - rate_state.last_request("geo")
+        log(f"[PyTrendsGeo] Time since last request: {elapsed:.1f}s")
+        if elapsed < 60:
+            # Return cached data if available
+            cached_results = {}
+            for kw in keywords:
+                cached = _memory_cache.get(_cache_key(geo, resolution, timeframe, kw))
+                if cached is not None:
+                    cached_results[kw] = cached
+            if cached_results:
+                log(f"[PyTrendsGeo] Returning cached results for {len(cached_results)} keywords")
+                return {"results": cached_results, "error": None, "from_cache": True}
+            else:
+                log(f"[PyTrendsGeo] No cached results available, proceeding anyway")
+
+    rate_state.mark_request("geo")
+
+    all_results = {}
+    errors = []
+    missing = []
+
+    # One request per keyword, run concurrently under the shared rate budget
+    completed = []
+
+    def report(index: int, result: dict) -> None:
+        completed.append(index)
+        on_batch({
+            "type": "batch",
+            "index": index,
+            "keywords": [keywords[index]],
+            "error": result.get("error"),
+            "results": {keywords[index]: result.get("data", [])},
+            "done": len(completed),
+            "total": len(keywords),
+        })
+
+    results = run_batches(
+        lambda kw: fetch_geo_trends(kw, geo, timeframe, resolution, deadline),
+        keywords,
+        stop=lambda result: result.get("error") == "RATE_LIMITED",
+        on_result=report if on_batch else None,
+    )
+
+    for kw, result in zip(keywords, results):
+        if result is None or result.get("error") == "RATE_LIMITED":
+            log(f"[PyTrendsGeo] Rate limited, using fallback for remaining keywords")
+            # Use fallback for remaining keywords
+            for remaining_kw in keywords:
+                if remaining_kw not in all_results:
+                    all_results[remaining_kw] = _memory_cache.get(
+                        _cache_key(geo, resolution, timeframe, remaining_kw), []
+                    )
+            return {"results": all_results, "error": "RATE_LIMITED", "from_cache": False}
+
+        if result.get("error") == "DEADLINE":
+            log(f"[PyTrendsGeo] Deadline reached for {kw}, using fallback")
+            missing.append(kw)
+            all_results[kw] = _memory_cache.get(_cache_key(geo, resolution, timeframe, kw), [])
+            continue
+
+        if result.get("error"):
+            log(f"[PyTrendsGeo] Error for {kw}: {result['error']}")
+            errors.append(f"{kw}: {result['error']}")
+
+        all_results[kw] = result.get("data", [])
+        log(f"[PyTrendsGeo] Got {len(all_results[kw])} cities for {kw}")
+
+        # Store in memory cache for fallback
+        if result.get("data"):
+            _memory_cache.set(_cache_key(geo, resolution, timeframe, kw), result["data"])
+
+    log(f"[PyTrendsGeo] ====== BATCH END ======")
+    log(f"[PyTrendsGeo] Total results: {len(all_results)} keywords")
+    for kw, cities in all_results.items():
+        log(f"[PyTrendsGeo]   {kw}: {len(cities)} cities")
+
+    result = {
+        "results": all_results,
+        "error": errors[0] if errors else None,
+        "from_cache": False
+    }
+    # Deadline reached: return what was fetched instead of nothing
+    if missing:
+        result["partial"] = True
+        result["missing"] = missing
+    return result
+
+def _is_good_result(result: dict) -> bool:
+    return (
+        not result.get("error")
+        and not result.get("from_cache")
+        and not result.get("partial")
+        and bool(result.get("results"))
+    )
+
+def fetch_geo_trends_shared(keywords: list, geo: str, timeframe: str, resolution: str, comparative: bool,
+                            deadline: Deadline = None, on_batch=None) -> dict:
+    """
+    Comparative (chained beyond 5 keywords) or per-keyword geo fetch, coalesced with
+    identical requests in flight in this process or in other workers.
+    The last good result is served right away (marked stale past the soft
+    TTL) while it is refreshed in the background, without the request deadline.
+    Batch events only reach on_batch when this request does the fetch.
+    Sets pre-warmed by scripts/prewarm.py are served from the snapshot first;
+    comparative requests upstream cannot complete fall back to the history's
+    geo matrices when one covers their keywords.
+    """
+    snapshot = lookup(snapshot_key(
+        "geo", keywords, days=timeframe_days(timeframe), geo=geo, resolution=resolution, comparative=comparative
+    ))
+    if snapshot is not None:
+        return snapshot
+
+    key = flight_key(
+        "geo", keywords, timeframe=timeframe, geo=geo, resolution=resolution, comparative=comparative
+    )
+
+    def fetch(deadline: Deadline = None, on_batch=None):
+        if comparative:
+            log(f"[PyTrendsGeo] Calling fetch_geo_trends_comparative_chained...")
+            result = fetch_geo_trends_comparative_chained(keywords, geo, timeframe, resolution, deadline, on_batch)
+            if not _is_good_result(result):
+                history = history_comparative(keywords, geo, resolution, timeframe_days(timeframe))
+                if history:
+                    log(f"[PyTrendsGeo] Upstream incomplete ({result.get('error')}), serving the history")
+                    return {"results": history, "error": None, "comparative": True, "from_cache": True}
+            return result
+        log(f"[PyTrendsGeo] Calling fetch_geo_trends_batch...")
+        return fetch_geo_trends_batch(keywords, geo, timeframe, resolution, deadline, on_batch)
+
+    return serve(
+        key,
+        lambda: get_flight().do(key, lambda: fetch(deadline, on_batch), deadline),
+        _is_good_result,
+        refresh=lambda: get_flight().do(key, fetch),
+    )
+
+def fetch_geo_maps(keywords: list, geo: str, timeframe: str, resolutions: list,
+                   deadline: Deadline = None) -> dict:
+    """
+    Raw interest-by-region maps of up to 5 keywords at several resolutions
+    from ONE explore payload: the GEO_MAP widget token does not depend on
+    the resolution, which the client forces per widget call.
+
+    Returns:
+        {"maps": {resolution: geo_map}, "error": str or None}
+    """
+    missing_dependency = missing_client_dependency()
+    if missing_dependency:
+        return {"maps": {}, "error": f"{missing_dependency} not installed"}
+
+    deadline = deadline or Deadline()
+
+    def fetch(client, egress):
+        client.build_payload(keywords, timeframe=timeframe, geo=geo)
+
+        maps = {}
+        for resolution in resolutions:
+            egress.acquire(deadline=deadline)
+            maps[resolution] = client.regions(resolution=resolution, inc_low_vol=True)
+        if any(geo_map["regions"] for geo_map in maps.values()):
+            return maps
+        log(f"[PyTrendsGeo] No region data for {keywords} in {geo}")
+        return None
+
+    maps, error = attempt_with_retries(fetch, deadline, "PyTrendsGeo")
+    if error:
+        return {"maps": {}, "error": error[:200]}
+    return {"maps": maps or {}, "error": None}
+
+
+def target_key(geo: str, resolution: str) -> str:
+    """Key of a (geo, resolution) target in multi-target responses"""
+    return f"{geo}:{resolution}"
+
+
+def _group_targets(targets: list) -> dict:
+    """{geo: [resolution, ...]} in request order, duplicates dropped"""
+    grouped = {}
+    for geo, resolution in targets:
+        if resolution not in grouped.setdefault(geo, []):
+            grouped[geo].append(resolution)
+    return grouped
+
+
+def fetch_geo_targets(keywords: list, targets: list, timeframe: str, comparative: bool,
+                      deadline: Deadline = None, on_batch=None) -> dict:
+    """
+    The same keywords at several (geo, resolution) targets in one scheduled job.
+    Work units are (geo, keyword) in per-keyword mode and (geo, pivot batch)
+    in comparative mode; each unit builds its payload once and fetches every
+    resolution wanted for its geo, so FR at REGION and CITY cost one token
+    request per unit instead of two. All units share the rate budget and
+    stop together on a 429.
+    on_batch(event) receives a "batch" event per completed unit.
+
+    Returns:
+        {
+            "results": {"geo:resolution": <results of that target>},  # shapes of
+                                            # fetch_geo_trends_batch / _comparative_chained
+            "error": str or None,
+            "comparative": bool,
+            "from_cache": bool,
+            "targets": ["geo:resolution", ...],
+            "partial": True, "missing": {"geo:resolution": [...]}  # only when units were cut off
+        }
+    """
+    grouped = _group_targets(targets)
+    keys = [target_key(geo, resolution) for geo, resolutions in grouped.items() for resolution in resolutions]
+    log(f"[PyTrendsGeo] ====== MULTI-TARGET START: {keys} ======")
+
+    if not keywords:
+        return {"results": {}, "error": "No keywords provided", "from_cache": False}
+
+    if not comparative:
+        # Same 60s gate as fetch_geo_trends_batch, once for the whole job
+        rate_state = get_rate_state()
+        if time.time() - rate_state.last_request("geo") < 60:
+            cached = {
+                target_key(geo, resolution): {
+                    kw: value for kw in keywords
+                    if (value := _memory_cache.get(_cache_key(geo, resolution, timeframe, kw))) is not None
+                }
+                for geo, resolutions in grouped.items() for resolution in resolutions
+            }
+            if all(cached.values()):
+                log(f"[PyTrendsGeo] Returning cached results for {len(cached)} targets")
+                return {"results": cached, "error": None, "comparative": False, "from_cache": True, "targets": keys}
+        rate_state.mark_request("geo")
+
+    batches = pivot_batches(keywords) if comparative else [[kw] for kw in keywords]
+    units = [(geo, batch) for geo in grouped for batch in batches]
+    completed = []
+
+    def unit_results(geo: str, batch: list, maps: dict) -> dict:
+        """{"geo:resolution": results} of one unit"""
+        with span("normalize"):
+            return {
+                target_key(geo, resolution): (
+                    comparative_regions(geo_map, batch) if comparative
+                    else {batch[0]: ranked_regions(geo_map, batch[0])}
+                )
+                for resolution, geo_map in maps.items()
+            }
+
+    def report(index: int, result: dict) -> None:
+        completed.append(index)
+        geo, batch = units[index]
+        on_batch({
+            "type": "batch",
+            "index": index,
+            "geo": geo,
+            "keywords": batch,
+            "error": result.get("error"),
+            "results": unit_results(geo, batch, result["maps"]) if result.get("maps") else {},
+            "comparative": comparative,
+            "done": len(completed),
+            "total": len(units),
+        })
+
+    unit_outcomes = run_batches(
+        lambda unit: fetch_geo_maps(unit[1], unit[0], timeframe, grouped[unit[0]], deadline),
+        units,
+        stop=lambda result: result.get("error") == "RATE_LIMITED",
+        on_result=report if on_batch else None,
+    )
+
+    errors = []
+    missing = {}
+    per_unit = []
+    for (geo, batch), result in zip(units, unit_outcomes):
+        if result is None or result.get("error") or not result.get("maps"):
+            error = "RATE_LIMITED" if result is None else result.get("error")
+            if error:
+                print(f"[PyTrendsGeo] Unit {geo} {batch} failed: {error}")
+                errors.append(error)
+            if error in ("RATE_LIMITED", "DEADLINE"):
+                lost = batch[1:] if comparative and len(batches) > 1 else batch
+                for resolution in grouped[geo]:
+                    missing.setdefault(target_key(geo, resolution), []).extend(lost)
+            per_unit.append(None)
+            continue
+        per_unit.append(unit_results(geo, batch, result["maps"]))
+
+    results = {}
+    for geo, resolutions in grouped.items():
+        unit_indexes = [i for i, (unit_geo, _) in enumerate(units) if unit_geo == geo]
+        for resolution in resolutions:
+            key = target_key(geo, resolution)
+            shares = [per_unit[i][key] if per_unit[i] else None for i in unit_indexes]
+            if comparative:
+                if len(batches) == 1:
+                    results[key] = shares[0] or {}
+                elif any(shares):
+                    with span("normalize"):
+                        results[key] = chain_comparative(batches, shares, keywords[0], keywords)
+                else:
+                    results[key] = {}
+                continue
+            target = {}
+            for kw, ranked in zip(keywords, shares):
+                cache_key = _cache_key(geo, resolution, timeframe, kw)
+                if ranked is None:
+                    # Cut off or failed: fall back to the memory cache
+                    target[kw] = _memory_cache.get(cache_key, [])
+                    continue
+                target[kw] = ranked[kw]
+                if ranked[kw]:
+                    _memory_cache.set(cache_key, ranked[kw])
+            results[key] = target
+
+    log(f"[PyTrendsGeo] ====== MULTI-TARGET END: {len(units)} units ======")
+    result = {
+        "results": results,
+        "error": "RATE_LIMITED" if "RATE_LIMITED" in errors else (errors[0] if errors else None),
+        "comparative": comparative,
+        "from_cache": False,
+        "targets": keys,
+    }
+    if missing:
+        result["partial"] = True
+        result["missing"] = missing
+    return result
+
+
+def fetch_geo_targets_shared(keywords: list, targets: list, timeframe: str, comparative: bool,
+                             deadline: Deadline = None, on_batch=None) -> dict:
+    """fetch_geo_targets coalesced and served stale-while-revalidate like fetch_geo_trends_shared"""
+    key = flight_key(
+        "geo-targets", keywords, timeframe=timeframe, comparative=comparative,
+        targets=sorted(target_key(geo, resolution) for geo, resolution in targets),
+    )
+
+    def fetch(deadline: Deadline = None, on_batch=None):
+        return fetch_geo_targets(keywords, targets, timeframe, comparative, deadline, on_batch)
+
+    def is_good(result: dict) -> bool:
+        return (
+            not result.get("error")
+            and not result.get("from_cache")
+            and not result.get("partial")
+            and any(result.get("results", {}).values())
+        )
+
+    return serve(
+        key,
+        lambda: get_flight().do(key, lambda: fetch(deadline, on_batch), deadline),
+        is_good,
+        refresh=lambda: get_flight().do(key, fetch),
+    )
+
+
+def _parse_targets(raw) -> list:
+    """[(geo, resolution)] from [{"geo", "resolution"}, ...]; unknown resolutions become CITY"""
+    targets = []
+    for item in raw or []:
+        if not isinstance(item, dict) or not item.get("geo"):
+            continue
+        resolution = str(item.get("resolution", "CITY")).upper()
+        if resolution not in ["CITY", "REGION"]:
+            resolution = "CITY"
+        if (item["geo"], resolution) not in targets:
+            targets.append((item["geo"], resolution))
+    return targets
+
+
+class handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        timings = start_request()
+        events = None
+        log(f"[PyTrendsGeo] ====== HTTP GET REQUEST ======")
+        log(f"[PyTrendsGeo] Path: {self.path}")
+        try:
+            # Parse query parameters
+            parsed = urlparse(self.path)
+            params = parse_qs(parsed.query)
+            log(f"[PyTrendsGeo] Parsed params: {params}")
+
+            keywords_raw = params.get("keywords", [""])[0]
+            geo = params.get("geo", ["FR-J"])[0]  # Default: Ile-de-France
+            days = int(params.get("days", ["7"])[0])
+            resolution = params.get("resolution", ["CITY"])[0].upper()
+            deadline = Deadline.parse(params.get("deadline", [None])[0])
+
+            log(f"[PyTrendsGeo] keywords_raw: {keywords_raw}")
+            log(f"[PyTrendsGeo] geo: {geo}, days: {days}, resolution: {resolution}")
+
+            if resolution not in ["CITY", "REGION"]:
+                resolution = "CITY"
+
+            if not keywords_raw:
+                print(f"[PyTrendsGeo] ERROR: Missing keywords parameter")
+                send_json(self, 400, {"error": "Missing keywords parameter"})
+                return
+
+            # Parse keywords (comma-separated)
+            keywords = normalize_keywords(keywords_raw.split(","))
+            log(f"[PyTrendsGeo] Parsed keywords: {keywords}")
+
+            if not keywords:
+                print(f"[PyTrendsGeo] ERROR: No valid keywords")
+                send_json(self, 400, {"error": "No valid keywords"})
+                return
+
+            # Check for comparative mode
+            comparative = params.get("comparative", ["false"])[0].lower() == "true"
+            log(f"[PyTrendsGeo] Comparative mode: {comparative}")
+
+            # Optional columnar output: region list + one score array per keyword
+            columnar = params.get("format", ["rows"])[0].lower() == "columnar"
+
+            # Get timeframe
+            timeframe = get_timeframe(days)
+            log(f"[PyTrendsGeo] Timeframe: {timeframe}")
+
+            # stream=ndjson|sse: one event per completed batch, then the result
+            stream = parse_stream(params.get("stream", [None])[0])
+            if stream:
+                events = EventStream(self, stream)
+                events.start()
+
+            # Fetch geographic trends
+            result = fetch_geo_trends_shared(
+                keywords, geo, timeframe, resolution, comparative, deadline, events.send if events else None
+            )
+            if columnar:
+                result = to_columnar(result, keywords)
+
+            if events:
+                events.send({"type": "final", **result, "timings": timings.as_dict()})
+                return
+
+            # Per-phase durations are always in Server-Timing, in the body on demand
+            if params.get("timings", ["0"])[0] == "1":
+                result = {
+                    **result,
+                    "timings": timings.as_dict(),
+                    "cache": _memory_cache.stats(),
+                    "egress": get_egress_pool().stats(),
+                }
+
+            send_json(self, 200, result, {"Cache-Control": "s-maxage=7200"})  # Cache 2h at edge
+            log(f"[PyTrendsGeo] ====== HTTP GET RESPONSE SENT ======")
+
+        except Exception as e:
+            print(f"[PyTrendsGeo] ====== HTTP GET EXCEPTION ======")
+            print(f"[PyTrendsGeo] Exception: {e}")
+            import traceback
+            print(f"[PyTrendsGeo] Traceback:\n{traceback.format_exc()}")
+            if events:
+                events.send({"type": "error", "error": str(e)})
+            else:
+                send_json(self, 500, {"error": str(e)})
+
+    def do_POST(self):
+        timings = start_request()
+        events = None
+        try:
+            content_length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(content_length)
+            data = json.loads(body) if body else {}
+
+            keywords = normalize_keywords(data.get("keywords", []))
+            geo = data.get("geo", "FR-J")
+            days = data.get("days", 7)
+            resolution = data.get("resolution", "CITY").upper()
+            comparative = data.get("comparative", False)
+            deadline = Deadline.parse(data.get("deadline"))
+            columnar = data.get("format", "rows") == "columnar"
+
+            log(f"[PyTrendsGeo] POST - keywords: {keywords}, geo: {geo}, days: {days}, resolution: {resolution}, comparative: {comparative}")
+
+            if resolution not in ["CITY", "REGION"]:
+                resolution = "CITY"
+
+            if not keywords:
+                send_json(self, 400, {"error": "Missing keywords"})
+                return
+
+            timeframe = get_timeframe(days)
+
+            # targets=[{geo, resolution}, ...]: several levels in one job, keyed by "geo:resolution"
+            targets = _parse_targets(data.get("targets"))
+
+            stream = parse_stream(data.get("stream"))
+            if stream:
+                events = EventStream(self, stream)
+                events.start()
+
+            if targets:
+                result = fetch_geo_targets_shared(
+                    keywords, targets, timeframe, comparative, deadline, events.send if events else None
+                )
+                if columnar:
+                    result = {
+                        **result,
+                        "results": {
+                            key: to_columnar({"results": results, "comparative": comparative}, keywords)
+                            for key, results in result["results"].items()
+                        },
+                        "format": "columnar",
+                    }
+            else:
+                result = fetch_geo_trends_shared(
+                    keywords, geo, timeframe, resolution, comparative, deadline, events.send if events else None
+                )
+                if columnar:
+                    result = to_columnar(result, keywords)
+
+            if events:
+                events.send({"type": "final", **result, "timings": timings.as_dict()})
+                return
+
+            if data.get("timings"):
+                result = {
+                    **result,
+                    "timings": timings.as_dict(),
+                    "cache": _memory_cache.stats(),
+                    "egress": get_egress_pool().stats(),
+                }
+
+            send_json(self, 200, result)
+
+        except Exception as e:
+            if events:
+                events.send({"type": "error", "error": str(e)})
+            else:
+                send_json(self, 500, {"error": str(e)})
@@ -0,0 +1,203 @@
+"""
+Offline benchmark of the Trends handlers against the local stub server.
+
+Every scenario runs the real fetch function in a fresh Python process (cold
+caches, its own peak RSS) pointed at benchmarks/stub.py, and reports:
+
+    wall      seconds spent in the fetch function
+    requests  upstream requests served by the stub (cookies included)
+    sleep     seconds spent in time.sleep (rate budget, backoff, retries),
+              summed over worker threads so it can exceed wall
+    rss       peak resident memory of the process, in MB
+
+Usage (from the repository root):
+
+    python benchmarks/run.py                              # all targets, 1/8/17/100 keywords
+    python benchmarks/run.py --targets trends --sizes 17 --rate 2
+    python benchmarks/run.py --error-rate 0.1 --latency 0.2 --json
+    python benchmarks/run.py --targets trends --ip-rate 1.2 --rate 1 --proxies 3
+
+The handlers keep their own configuration (TRENDS_RATE, TRENDS_BURST...):
+with the production rate of 0.5 request/s the 100-keyword runs take minutes,
+--rate overrides it for quicker comparisons. The store, the result cache and
+the cross-process single-flight are disabled unless --store is given.
+
+--ip-rate makes the stub rate-limit each client identity like Google does
+per IP; --proxies N routes the handlers through N local stand-in proxies
+(TRENDS_PROXIES), each a separate identity with its own budget.
+
+--deadline gives each fetch one request deadline, as the handlers do, so a
+scenario that runs out of time ends partial or with DEADLINE.
+
+--check exits with status 1 when a scenario ends with an error or a partial
+result, as none should without injected faults. With --store it covers the
+ratio graph's planning (a fresh store per scenario):
+
+    python benchmarks/run.py --store --check --sizes 1,2,8 --rate 100
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(1, os.path.join(os.path.dirname(BENCH_DIR), "scripts"))
+
+from handlers import API_DIR, load_handler  # noqa: E402
+from stub import StubProxy, StubTrends  # noqa: E402
+
+TARGETS = ["trends", "geo", "comparative", "combined"]
+SIZES = [1, 8, 17, 100]
+
+
+def _run_target(target: str, keywords: list, deadline=None):
+    if target == "trends":
+        module = load_handler("pytrends")
+        return module.fetch_trends_with_pivot(keywords, module.get_timeframe(30), deadline)
+    if target == "combined":
+        module = load_handler("pytrends")
+        return module.fetch_combined(keywords, module.get_timeframe(30), deadline=deadline)
+    module = load_handler("pytrends_geo")
+    timeframe = module.get_timeframe(7)
+    if target == "geo":
+        return module.fetch_geo_trends_batch(keywords, "FR", timeframe, "CITY", deadline)
+    return module.fetch_geo_trends_comparative_chained(keywords, "FR", timeframe, "REGION", deadline)
+
+
+def child(target: str, size: int, deadline: float = None) -> dict:
+    """Run one scenario in this process and return its measurements"""
+    from _lib.backoff import Deadline
+
+    slept = [0.0]
+    real_sleep = time.sleep
+
+    def counting_sleep(seconds):
+        slept[0] += max(0.0, seconds)
+        real_sleep(seconds)
+
+    time.sleep = counting_sleep
+    keywords = [f"candidat {i:03d}" for i in range(size)]
+
+    started = time.perf_counter()
+    # One request deadline for the whole fetch, as the handlers pass it
+    result = _run_target(target, keywords, Deadline.parse(deadline) if deadline is not None else None)
+    wall = time.perf_counter() - started
+
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rss_mb = rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+    return {
+        "wall": round(wall, 3),
+        "sleep": round(slept[0], 3),
+        "rss": round(rss_mb, 1),
+        "error": result.get("error"),
+        "partial": bool(result.get("partial")),
+    }
+
+
+def run_scenario(stub: StubTrends, target: str, size: int, args, proxies: list = None) -> dict:
+    env = dict(os.environ)
+    env["TRENDS_BASE_URL"] = stub.base_url
+    env["TRENDS_CLIENT"] = "direct"
+    env["TRENDS_PROXIES"] = ",".join(proxy.url for proxy in proxies or [])
+    # The stand-in proxies are on localhost too
+    env.pop("NO_PROXY", None)
+    env.pop("no_proxy", None)
+    if not args.store:
+        env["TRENDS_STORE_PATH"] = ""
+        env["TRENDS_LOCK_DIR"] = ""
+        env["TRENDS_SWR"] = "0"
+    if args.rate is not None:
+        env["TRENDS_RATE"] = str(args.rate)
+    if args.deadline is not None:
+        env["TRENDS_DEADLINE"] = str(args.deadline)
+
+    stub.reset()
+    with tempfile.TemporaryDirectory(prefix="trends_bench_") as scratch:
+        if args.store and args.check:
+            # Checks start from an empty store, ratio graph and rate state, without prewarmed data
+            env["TRENDS_STORE_PATH"] = os.path.join(scratch, "store.db")
+            env["TRENDS_LOCK_DIR"] = os.path.join(scratch, "flights")
+            env["TRENDS_SNAPSHOT_PATH"] = ""
+            env["TRENDS_HISTORY_PATH"] = ""
+        command = [sys.executable, os.path.abspath(__file__), "--child", target, str(size)]
+        if args.deadline is not None:
+            command += ["--deadline", str(args.deadline)]
+        proc = subprocess.run(
+            command,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+    if proc.returncode != 0:
+        raise RuntimeError(f"{target}/{size} failed:\n{proc.stderr[-2000:]}")
+    # The handlers log to stdout: the measurements are the last line
+    measures = json.loads(proc.stdout.strip().splitlines()[-1])
+    return {"target": target, "keywords": size, "requests": stub.total, "identities": len(stub.identities), **measures}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--targets", default=",".join(TARGETS), help="comma-separated: " + ", ".join(TARGETS))
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)), help="keyword counts")
+    parser.add_argument("--rate", type=float, help="TRENDS_RATE for the handlers (requests/s)")
+    parser.add_argument("--deadline", type=float, help="request deadline of every fetch (seconds, 0 = none)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered 429")
+    parser.add_argument("--empty-rate", type=float, default=0.0, help="share of widget requests with an empty frame")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every stub response")
+    parser.add_argument("--ip-rate", type=float, default=0.0, help="requests/s per client identity before 429s")
+    parser.add_argument("--proxies", type=int, default=0, help="local stand-in egress proxies to route through")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--store", action="store_true", help="keep the handlers' store and result cache")
+    parser.add_argument("--json", action="store_true", help="print one JSON object per scenario")
+    parser.add_argument("--check", action="store_true", help="exit 1 when a scenario ends with an error or partial")
+    parser.add_argument("--child", nargs=2, metavar=("TARGET", "SIZE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        sys.path.append(API_DIR)
+        print(json.dumps(child(args.child[0], int(args.child[1]), args.deadline)))
+        return
+
+    targets = [t for t in args.targets.split(",") if t in TARGETS]
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    stub = StubTrends(
+        error_rate=args.error_rate, empty_rate=args.empty_rate, latency=args.latency, seed=args.seed,
+        ip_rate=args.ip_rate,
+    ).start()
+    proxies = [StubProxy(f"proxy-{i}").start() for i in range(args.proxies)]
+
+    if not args.json:
+        print(f"{'target':<12} {'keywords':>8} {'wall s':>8} {'requests':>8} {'sleep s':>8} {'rss MB':>7}  result")
+    failed = []
+    try:
+        for target in targets:
+            for size in sizes:
+                row = run_scenario(stub, target, size, args, proxies)
+                if row["error"] or row["partial"]:
+                    failed.append(f"{target}/{size}")
+                if args.json:
+                    print(json.dumps(row))
+                    continue
+                status = row["error"] or ("partial" if row["partial"] else "ok")
+                print(
+                    f"{row['target']:<12} {row['keywords']:>8} {row['wall']:>8.2f} {row['requests']:>8} "
+                    f"{row['sleep']:>8.2f} {row['rss']:>7.1f}  {status}"
+                )
+    finally:
+        for proxy in proxies:
+            proxy.stop()
+        stub.stop()
+
+    if args.check and failed:
+        print(f"Incomplete scenarios: {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
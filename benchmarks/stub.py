@@ -0,0 +1,278 @@
+"""
+Local stand-in for the Google Trends endpoints used by the handlers.
+
+Replays the responses in fixtures/ (explore, multiline, comparedgeo) for any
+keyword list: value rows are cycled over the requested keywords and the
+timeline is re-dated onto the requested window, so store and period logic
+see realistic daily data. Point the handlers at it with
+TRENDS_BASE_URL=http://127.0.0.1:<port>/trends (direct client only).
+
+Faults are injected per widget/explore request, from a seeded RNG:
+    error_rate  share of requests answered with a 429
+    empty_rate  share of widget requests answered with an empty frame
+    latency     seconds added to every response
+    ip_rate     requests/s allowed per client identity (token bucket of
+                burst 2), beyond which requests get a 429 like Google's
+                per-IP limit; 0 disables it
+
+StubProxy is a local stand-in egress proxy: requests sent through it (plain
+http, TRENDS_PROXIES=http://127.0.0.1:<port>) reach the stub under the
+proxy's own identity, so ip_rate applies per proxy.
+"""
+import json
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# Header carrying the client identity set by StubProxy
+IDENTITY_HEADER = "X-Stub-Identity"
+
+# Google prefixes every JSON answer with garbage to prevent JSON hijacking
+_EXPLORE_PREFIX = ")]}'\n"
+_WIDGET_PREFIX = ")]}',\n"
+
+
+def _load_fixture(name: str) -> dict:
+    with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _cycle_row(row: list, count: int) -> list:
+    return [row[i % len(row)] for i in range(count)]
+
+
+class StubTrends:
+    """Threaded stub server; `counts` holds the requests served per endpoint"""
+
+    def __init__(self, port: int = 0, error_rate: float = 0.0, empty_rate: float = 0.0,
+                 latency: float = 0.0, seed: int = 0, ip_rate: float = 0.0):
+        self.error_rate = error_rate
+        self.empty_rate = empty_rate
+        self.latency = latency
+        self.ip_rate = ip_rate
+        self.counts = Counter()
+        self.identities = Counter()
+        self._buckets = {}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._explore = _load_fixture("explore.json")
+        self._timeline = _load_fixture("multiline.json")["default"]["timelineData"]
+        self._geo = {
+            "REGION": _load_fixture("comparedgeo_region.json")["default"]["geoMapData"],
+            "CITY": _load_fixture("comparedgeo_city.json")["default"]["geoMapData"],
+        }
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/trends"
+
+    @property
+    def total(self) -> int:
+        with self._lock:
+            return sum(self.counts.values())
+
+    def start(self) -> "StubTrends":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counts.clear()
+            self.identities.clear()
+            self._buckets.clear()
+
+    def _over_ip_rate(self, identity: str) -> bool:
+        """Per-identity token bucket of ip_rate requests/s, burst 2"""
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(identity, (2.0, now))
+        tokens = min(2.0, tokens + (now - updated) * self.ip_rate)
+        if tokens < 1.0:
+            self._buckets[identity] = (tokens, now)
+            return True
+        self._buckets[identity] = (tokens - 1.0, now)
+        return False
+
+    def _fault(self, endpoint: str, identity: str = "direct"):
+        """"429", "empty" or None, counted under the endpoint"""
+        with self._lock:
+            self.counts[endpoint] += 1
+            self.identities[identity] += 1
+            roll = self._rng.random()
+            limited = endpoint != "cookie" and self.ip_rate > 0 and self._over_ip_rate(identity)
+        if endpoint == "cookie":
+            return None
+        if limited or roll < self.error_rate:
+            return "429"
+        if endpoint != "explore" and roll < self.error_rate + self.empty_rate:
+            return "empty"
+        return None
+
+    def explore(self, req: dict) -> dict:
+        keywords = [item["keyword"] for item in req["comparisonItem"]]
+        time_range = req["comparisonItem"][0]["time"]
+        payload = json.loads(json.dumps(self._explore))
+        for widget in payload["widgets"]:
+            # Widget requests echo the keywords and window they were built for
+            widget["request"]["keywords"] = keywords
+            widget["request"]["time"] = time_range
+        return payload
+
+    def multiline(self, req: dict) -> dict:
+        keywords = req["keywords"]
+        try:
+            start, end = (datetime.strptime(d, "%Y-%m-%d") for d in req["time"].split(" "))
+        except ValueError:
+            end = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+            start = end - timedelta(days=7)
+        points = []
+        day = start
+        while day <= end:
+            row = self._timeline[len(points) % len(self._timeline)]["value"]
+            points.append({
+                "time": str(int(day.replace(tzinfo=timezone.utc).timestamp())),
+                "value": _cycle_row(row, len(keywords)),
+            })
+            day += timedelta(days=1)
+        if points:
+            points[-1]["isPartial"] = True
+        return {"default": {"timelineData": points}}
+
+    def comparedgeo(self, req: dict) -> dict:
+        keywords = req["keywords"]
+        entries = self._geo.get(req.get("resolution", "REGION"), self._geo["REGION"])
+        return {"default": {"geoMapData": [
+            {"geoCode": e["geoCode"], "geoName": e["geoName"], "value": _cycle_row(e["value"], len(keywords))}
+            for e in entries
+        ]}}
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body: str, content_type: str = "application/json"):
+                data = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.send_header("Set-Cookie", "NID=511=stub; Path=/")
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                self.do_GET()
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = parse_qs(url.query)
+                if url.path.endswith("/explore/"):
+                    endpoint = "cookie"
+                elif url.path.endswith("/api/explore"):
+                    endpoint = "explore"
+                elif url.path.endswith("/multiline"):
+                    endpoint = "multiline"
+                elif url.path.endswith("/comparedgeo"):
+                    endpoint = "comparedgeo"
+                else:
+                    return self._send(404, "not found", "text/plain")
+
+                fault = stub._fault(endpoint, self.headers.get(IDENTITY_HEADER, "direct"))
+                if stub.latency:
+                    threading.Event().wait(stub.latency)
+                if fault == "429":
+                    return self._send(429, "Too Many Requests", "text/html")
+                if endpoint == "cookie":
+                    return self._send(200, "<html></html>", "text/html")
+
+                req = json.loads(params["req"][0])
+                if endpoint == "explore":
+                    return self._send(200, _EXPLORE_PREFIX + json.dumps(stub.explore(req)))
+                if fault == "empty":
+                    key = "timelineData" if endpoint == "multiline" else "geoMapData"
+                    return self._send(200, _WIDGET_PREFIX + json.dumps({"default": {key: []}}))
+                body = stub.multiline(req) if endpoint == "multiline" else stub.comparedgeo(req)
+                return self._send(200, _WIDGET_PREFIX + json.dumps(body))
+
+        return Handler
+
+
+class StubProxy:
+    """Forwarding HTTP proxy with its own identity, standing in for an egress proxy"""
+
+    def __init__(self, name: str, port: int = 0, down: bool = False):
+        self.name = name
+        self.down = down
+        # Never chain through the proxies of the environment
+        self._opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler_class())
+        self._server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubProxy":
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler_class(self):
+        proxy = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                self.do_GET()
+
+            def do_GET(self):
+                if proxy.down:
+                    self.send_response(502)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                # Proxied requests carry the absolute URL
+                headers = {k: v for k, v in self.headers.items() if k.lower() not in ("host", "proxy-connection")}
+                headers[IDENTITY_HEADER] = proxy.name
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length) if length else None
+                request = urllib.request.Request(self.path, data=body, headers=headers, method=self.command)
+                try:
+                    with proxy._opener.open(request, timeout=30) as response:
+                        status, reply_headers, data = response.status, response.headers, response.read()
+                except urllib.error.HTTPError as e:
+                    status, reply_headers, data = e.code, e.headers, e.read()
+                self.send_response(status)
+                for name in ("Content-Type", "Set-Cookie"):
+                    if reply_headers.get(name):
+                        self.send_header(name, reply_headers[name])
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
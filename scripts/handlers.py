@@ -0,0 +1,17 @@
+"""
+Loads the Vercel handlers of api/ in the commands that run them outside of
+Vercel (serve.py, prewarm.py, benchmarks/run.py).
+"""
+import importlib.util
+import os
+
+API_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api")
+
+
+def load_handler(name: str):
+    """Module of api/<name>.py"""
+    # api/pytrends.py would shadow the pytrends package under its own name
+    spec = importlib.util.spec_from_file_location(f"{name}_handler", os.path.join(API_DIR, f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,188 @@
+"""
+Pre-warm the Trends snapshot served by the handlers.
+
+The candidate keyword sets are known ahead of time, so instead of waiting
+for a user request to hit Google, this command fetches every job of a
+manifest for every period, within the handlers' own rate budget, and writes
+a new version of the snapshot (api/_lib/snapshot.py). The handlers look
+requests up there first.
+
+Manifest (scripts/prewarm.json by default):
+
+    {
+      "periods": [7, 14, 30],
+      "sets": {"paris": ["Rachida Dati", ...]},
+      "jobs": [
+        {"kind": "trends", "set": "paris"},
+        {"kind": "geo", "set": "paris", "geo": "FR-J", "resolution": "CITY"},
+        {"kind": "geo", "set": "paris", "geo": "FR", "resolution": "REGION", "comparative": true}
+      ]
+    }
+
+A job may override "periods". Keyword sets mirror the first search term of
+src/lib/candidates, which is what the dashboard sends.
+
+Usage (from the repository root, e.g. from a nightly cron):
+
+    python scripts/prewarm.py
+    python scripts/prewarm.py --max-age 43200          # skip entries fetched in the last 12h
+    python scripts/prewarm.py --jobs 0,1 --dry-run
+
+Entries that cannot be fetched keep their previous value, so a rate-limited
+run never makes the snapshot worse. The snapshot path is TRENDS_SNAPSHOT_PATH
+(--output overrides it); point the handlers at the same file.
+
+The run then exports the daily store and the comparative geo matrices to the
+memory-mapped history (api/_lib/history.py, TRENDS_HISTORY_PATH or
+--history): cold instances seed their store from it, and comparative geo
+requests upstream cannot complete are answered from its matrices.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from handlers import API_DIR, load_handler
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MANIFEST = os.path.join(SCRIPTS_DIR, "prewarm.json")
+
+
+def plan(manifest: dict, job_indexes: list = None) -> list:
+    """One entry per (job, period): {"kind", "keywords", "days", "params", "label"}"""
+    default_periods = manifest.get("periods", [7])
+    entries = []
+    for index, job in enumerate(manifest["jobs"]):
+        if job_indexes is not None and index not in job_indexes:
+            continue
+        keywords = manifest["sets"][job["set"]]
+        for days in job.get("periods", default_periods):
+            if job["kind"] == "trends":
+                params = {}
+                label = f"trends {job['set']} {days}d"
+            else:
+                params = {
+                    "geo": job.get("geo", "FR-J"),
+                    "resolution": job.get("resolution", "CITY").upper(),
+                    "comparative": bool(job.get("comparative", False)),
+                }
+                mode = "comparative" if params["comparative"] else "per keyword"
+                label = f"geo {job['set']} {params['geo']}:{params['resolution']} ({mode}) {days}d"
+            entries.append({"kind": job["kind"], "keywords": keywords, "days": days, "params": params, "label": label})
+    return entries
+
+
+def _geo_group(entry: dict, result: dict) -> list:
+    """History geo matrix of a comparative geo entry: [(geo, resolution, days, results)]"""
+    if entry["kind"] != "geo" or not entry["params"]["comparative"]:
+        return []
+    return [(entry["params"]["geo"], entry["params"]["resolution"], entry["days"], result["results"])]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST, help="manifest JSON file")
+    parser.add_argument("--output", help="snapshot file (default: TRENDS_SNAPSHOT_PATH)")
+    parser.add_argument("--jobs", help="comma-separated job indexes of the manifest (default: all)")
+    parser.add_argument("--history", help="history file (default: TRENDS_HISTORY_PATH, \"\" to skip)")
+    parser.add_argument("--max-age", type=float, default=0.0,
+                        help="keep entries of the current snapshot younger than this (seconds)")
+    parser.add_argument("--rate", type=float, help="TRENDS_RATE for this run (requests/s)")
+    parser.add_argument("--dry-run", action="store_true", help="print the plan and exit")
+    args = parser.parse_args()
+
+    if args.rate is not None:
+        os.environ["TRENDS_RATE"] = str(args.rate)
+    sys.path.append(API_DIR)
+    from _lib.history import history_path, write_history
+    from _lib.ratelimit import get_rate_state
+    from _lib.singleflight import normalize_keywords
+    from _lib.snapshot import load_snapshot, snapshot_key, snapshot_path, write_snapshot
+
+    with open(args.manifest, encoding="utf-8") as f:
+        manifest = json.load(f)
+    job_indexes = [int(i) for i in args.jobs.split(",")] if args.jobs else None
+    entries = plan(manifest, job_indexes)
+
+    output = args.output or snapshot_path()
+    if not output:
+        parser.error("no snapshot path: set TRENDS_SNAPSHOT_PATH or pass --output")
+
+    if args.dry_run:
+        for entry in entries:
+            print(entry["label"])
+        print(f"{len(entries)} entries -> {output}")
+        return
+
+    trends = load_handler("pytrends")
+    geo = load_handler("pytrends_geo")
+    rate_state = get_rate_state()
+
+    previous = load_snapshot(output)
+    snapshot = dict(previous.entries) if previous else {}
+    geo_groups = []
+    fetched = kept = failed = 0
+    started = time.time()
+
+    for entry in entries:
+        keywords = normalize_keywords(entry["keywords"])
+        if entry["kind"] == "trends":
+            key = snapshot_key("trends", keywords, days=entry["days"], geo=trends.GEO)
+        else:
+            key = snapshot_key("geo", keywords, days=entry["days"], **entry["params"])
+
+        current = snapshot.get(key)
+        if current and time.time() - current["fetched_at"] < args.max_age:
+            print(f"[Prewarm] {entry['label']}: fresh, kept")
+            kept += 1
+            geo_groups.extend(_geo_group(entry, current["result"]))
+            continue
+
+        entry_started = time.time()
+        # The 30s/60s gates protect live traffic; this run is paced by the token bucket
+        rate_state.mark_request(entry["kind"], 0.0)
+        if entry["kind"] == "trends":
+            result = trends.fetch_trends_with_pivot(keywords, trends.get_timeframe(entry["days"]))
+            good = trends._is_good_result(result)
+        else:
+            params = entry["params"]
+            timeframe = geo.get_timeframe(entry["days"])
+            if params["comparative"]:
+                result = geo.fetch_geo_trends_comparative_chained(
+                    keywords, params["geo"], timeframe, params["resolution"]
+                )
+            else:
+                result = geo.fetch_geo_trends_batch(keywords, params["geo"], timeframe, params["resolution"])
+            good = geo._is_good_result(result)
+
+        elapsed = time.time() - entry_started
+        if good:
+            snapshot[key] = {"result": result, "fetched_at": time.time()}
+            fetched += 1
+            print(f"[Prewarm] {entry['label']}: ok in {elapsed:.1f}s")
+        else:
+            failed += 1
+            status = "kept previous" if key in snapshot else "no entry"
+            print(f"[Prewarm] {entry['label']}: {result.get('error') or 'partial/empty'} in {elapsed:.1f}s, {status}")
+        if key in snapshot:
+            geo_groups.extend(_geo_group(entry, snapshot[key]["result"]))
+
+    version = write_snapshot(output, snapshot)
+    print(
+        f"[Prewarm] Snapshot v{version} -> {output}: {fetched} fetched, {kept} kept, {failed} failed "
+        f"in {time.time() - started:.0f}s"
+    )
+
+    history = history_path() if args.history is None else args.history
+    store = trends.get_store()
+    if history and store:
+        series_groups = [(geo_code, pivot, series) for (geo_code, pivot), series in store.export().items()]
+        write_history(history, series_groups, geo_groups)
+        print(f"[Prewarm] History -> {history}: {len(series_groups)} series, {len(geo_groups)} geo matrices")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Long-lived server for the Trends handlers, outside of Vercel.
+
+On Vercel every invocation may land on a cold instance: the memory caches,
+the session pool and the rate-limit state rarely survive. This command
+serves both routes from one process, so all requests share them:
+
+    /api/pytrends       api/pytrends.py handler
+    /api/pytrends_geo   api/pytrends_geo.py handler
+    /healthz            200 "ok" (load balancer checks)
+
+Requests run on a bounded pool of threads (--threads), with at most --queue
+more accepted and waiting; beyond that the server answers 503 at once
+rather than piling up connections. SIGTERM/SIGINT stop accepting, let the
+requests in flight finish for up to --drain seconds, then exit.
+
+--processes N pre-forks N workers (POSIX) sharing the listening socket, for
+the CPU-bound parsing (pandas/NumPy hold the GIL for part of it). Workers
+each have their memory caches; the SQLite store, ratio graph, result cache,
+rate-limit state and snapshot are shared through their files as on Vercel.
+
+Usage (from the repository root):
+
+    python scripts/serve.py --port 8000
+    python scripts/serve.py --host 0.0.0.0 --threads 32 --processes 4
+
+and point the Next.js app at it with PYTRENDS_URL=http://host:8000.
+"""
+import argparse
+import concurrent.futures
+import http.server
+import os
+import signal
+import socket
+import sys
+import threading
+from urllib.parse import urlparse
+
+from handlers import API_DIR, load_handler
+
+ROUTES = {
+    "/api/pytrends": "pytrends",
+    "/api/pytrends_geo": "pytrends_geo",
+}
+
+
+class Router(http.server.BaseHTTPRequestHandler):
+    """Dispatches each request to the handler class of its route"""
+
+    routes = {}
+
+    def parse_request(self) -> bool:
+        if not super().parse_request():
+            return False
+        path = urlparse(self.path).path.rstrip("/")
+        if path == "/healthz":
+            self.__class__ = Health
+            return True
+        route = self.routes.get(path)
+        if route is None:
+            self.send_error(404)
+            return False
+        # The handlers are plain BaseHTTPRequestHandler subclasses: become one
+        self.__class__ = route
+        return True
+
+
+class Health(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = b"ok"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    do_HEAD = do_GET
+
+
+class PooledHTTPServer(http.server.HTTPServer):
+    """HTTP server running requests on a bounded thread pool"""
+
+    def __init__(self, address, handler_class, threads: int, queue: int, bind_and_activate: bool = True):
+        super().__init__(address, handler_class, bind_and_activate)
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=threads, thread_name_prefix="trends")
+        self._slots = threading.BoundedSemaphore(threads + queue)
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        if not self._slots.acquire(blocking=False):
+            self._reject(request)
+            return
+        future = self._pool.submit(self._run, request, client_address)
+        with self._pending_lock:
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+
+    def _run(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def _done(self, future):
+        with self._pending_lock:
+            self._pending.discard(future)
+
+    def _reject(self, request):
+        body = b'{"error": "BUSY"}'
+        try:
+            request.sendall(
+                b"HTTP/1.0 503 Service Unavailable\r\n"
+                b"Content-Type: application/json\r\n"
+                b"Retry-After: 1\r\n"
+                + f"Content-Length: {len(body)}\r\n\r\n".encode()
+                + body
+            )
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def drain(self, timeout: float) -> int:
+        """Wait for the requests in flight; returns how many did not finish"""
+        with self._pending_lock:
+            pending = set(self._pending)
+        _, not_done = concurrent.futures.wait(pending, timeout=timeout)
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        return len(not_done)
+
+
+def serve(sock: socket.socket, args) -> None:
+    """Run one server on an already bound socket until SIGTERM/SIGINT"""
+    server = PooledHTTPServer(sock.getsockname()[:2], Router, args.threads, args.queue, bind_and_activate=False)
+    server.socket.close()
+    server.socket = sock
+
+    def stop(signum, frame):
+        # shutdown() waits for serve_forever(), which runs in this very thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    print(f"[Serve] pid {os.getpid()} on {args.host}:{args.port}, {args.threads} threads")
+    server.serve_forever()
+    left = server.drain(args.drain)
+    print(f"[Serve] pid {os.getpid()} stopped" + (f", {left} requests cut off" if left else ""))
+    server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8000")))
+    parser.add_argument("--threads", type=int, default=16, help="requests served at once per process")
+    parser.add_argument("--queue", type=int, default=32, help="requests waiting for a thread before 503s")
+    parser.add_argument("--processes", type=int, default=1, help="pre-forked worker processes")
+    parser.add_argument("--drain", type=float, default=30.0, help="seconds to finish requests on shutdown")
+    args = parser.parse_args()
+
+    # Imported once: forked workers start warm
+    sys.path.append(API_DIR)
+    Router.routes = {path: load_handler(name).handler for path, name in ROUTES.items()}
+
+    sock = socket.create_server((args.host, args.port), backlog=args.threads + args.queue)
+    if args.processes <= 1:
+        serve(sock, args)
+        return
+    if not hasattr(os, "fork"):
+        parser.error("--processes needs fork()")
+
+    children = []
+    for _ in range(args.processes):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                serve(sock, args)
+            finally:
+                sys.stdout.flush()
+                os._exit(0)
+        children.append(pid)
+
+    def stop(signum, frame):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for pid in children:
+        while True:
+            try:
+                os.waitpid(pid, 0)
+                break
+            except InterruptedError:
+                continue
+            except ChildProcessError:
+                break
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
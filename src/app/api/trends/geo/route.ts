@@ -7,10 +7,11 @@ interface ComparativeResult {
   fromCache: boolean;
   rateLimited: boolean;
   comparative: true;
+  partial?: boolean;
   error?: string;
 }
 
-// Fetch comparative data from Python backend (all keywords in one request)
+// Fetch comparative data from Python backend (pivot-chained batches beyond 5 keywords)
 async function fetchComparative(
   keywords: string[],
   geo: string,
@@ -18,7 +19,7 @@ async function fetchComparative(
   resolution: string
 ): Promise<ComparativeResult> {
   try {
-    const baseUrl = "https://visibility-paris-2026.vercel.app";
+    const baseUrl = process.env.PYTRENDS_URL || "https://visibility-paris-2026.vercel.app";
     const keywordsParam = encodeURIComponent(keywords.join(","));
     const url = `${baseUrl}/api/pytrends_geo?keywords=${keywordsParam}&geo=${geo}&days=${days}&resolution=${resolution}&comparative=true`;
 
@@ -62,6 +63,7 @@ async function fetchComparative(
       rateLimited: false,
       fromCache: false,
       comparative: true,
+      partial: Boolean(data.partial),
     };
   } catch (error) {
     console.error(`[TrendsGeo] COMPARATIVE FETCH EXCEPTION:`, error);
@@ -88,8 +90,8 @@ export async function POST(request: NextRequest) {
       return NextResponse.json({ error: "Missing keywords array" }, { status: 400 });
     }
 
-    // COMPARATIVE MODE (≤5 keywords)
-    if (comparative && keywords.length <= 5) {
+    // COMPARATIVE MODE (any number of keywords)
+    if (comparative) {
       console.log(`[TrendsGeo] COMPARATIVE MODE - ${keywords.length} keywords`);
 
       // Build cache key for comparative query
@@ -108,9 +110,9 @@ export async function POST(request: NextRequest) {
       console.log(`[TrendsGeo] Cache MISS, fetching comparative data...`);
       const result = await fetchComparative(keywords, geo, days, resolution);
 
-      // Only cache if we got data and no rate limit
+      // Only cache complete data (no rate limit, no missing batch)
       const hasData = Object.keys(result.results).length > 0;
-      if (hasData && !result.rateLimited) {
+      if (hasData && !result.rateLimited && !result.partial) {
         await cacheSet(cacheKey, result, CACHE_DURATION.TRENDS_GEO);
         console.log(`[TrendsGeo] Cached comparative result`);
       } else {
@@ -120,11 +122,11 @@ export async function POST(request: NextRequest) {
       return NextResponse.json(result);
     }
 
-    // NON-COMPARATIVE MODE (>5 keywords) - return error
-    console.log(`[TrendsGeo] ERROR - ${keywords.length} keywords, max 5 for comparative`);
+    // NON-COMPARATIVE MODE - return error
+    console.log(`[TrendsGeo] ERROR - comparative mode required`);
     return NextResponse.json({
       results: {},
-      error: "Sélectionnez maximum 5 candidats pour la vue comparative",
+      error: "La vue géographique est uniquement disponible en mode comparatif",
       rateLimited: false,
       fromCache: false,
       comparative: true,
@@ -15,8 +15,8 @@ async function fetchFromPython(keywords: string[], days: number): Promise<{
   rateLimited: boolean;
 }> {
   try {
-    // Use production domain to avoid preview deployment auth
-    const baseUrl = "https://visibility-paris-2026.vercel.app";
+    // Use production domain to avoid preview deployment auth (PYTRENDS_URL: self-hosted scripts/serve.py)
+    const baseUrl = process.env.PYTRENDS_URL || "https://visibility-paris-2026.vercel.app";
 
     const keywordsParam = encodeURIComponent(keywords.join(","));
     const url = `${baseUrl}/api/pytrends?keywords=${keywordsParam}&days=${days}`;